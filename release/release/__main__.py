@@ -1,16 +1,19 @@
 #!/usr/bin/env python3
 
-from release.environment import Environment
-from release.release_mgmt.manager import ReleaseManager
+# NOTE: Commands import what they need themselves, so that light commands
+# like print-version don't pay for loading the deploy machinery.
 from release.release_mgmt.version import Mode, Version
-from release.sentry import Sentry
-from release.wrangler import Wrangler
 
 from pathlib import Path
-import shutil
+from typing import TYPE_CHECKING, Optional, Sequence, Tuple
 
 import click
 
+if TYPE_CHECKING:
+    from release.environment import Environment
+    from release.release_mgmt.git import Git
+    from release.sentry import SentryClient
+
 BUMP_MODES = ["major", "minor", "patch"]
 RELEASE_MODES = ["staging", "production"]
 
@@ -18,17 +21,135 @@ RELEASE_BRANCH_PREFIX = "release/"
 
 SUPPORTED_ID_TYPES = ["rsa", "ed25519"]
 
+SENTRY_BACKENDS = ["cli", "http"]
+
+# A newer deploy was queued for the same environments, so this one did nothing
+EXIT_SUPERSEDED = 3
+
 
 @click.group()
-def cli() -> None:
-    pass
+@click.option(
+    "--trace",
+    type=Path,
+    help="Write a Chrome trace of every phase and subprocess to this file",
+)
+@click.pass_context
+def cli(ctx: click.Context, trace: Optional[Path]) -> None:
+    if trace:
+        from release.tracing import write_trace
+
+        ctx.call_on_close(lambda: write_trace(trace))
+
+
+def print_trace_summary() -> None:
+    from release.tracing import TRACER
+
+    click.echo(TRACER.summary(), err=True)
+
+
+def sentry_client(env: "Environment", backend: str) -> "SentryClient":
+    from release.sentry import Sentry
+    from release.sentry_api import DEFAULT_URL, SentryAPI
+
+    import os
+
+    if backend == "http":
+        return SentryAPI(
+            org=env.sentry.org,
+            project=env.sentry.project_id,
+            auth_token=env.sentry.token,
+            url=os.environ.get("SENTRY_URL", DEFAULT_URL),
+        )
+
+    return Sentry(
+        org=env.sentry.org,
+        project=env.sentry.project_id,
+        auth_token=env.sentry.token,
+    )
+
+
+def configure_execution(
+    timeouts: Sequence[str], retries: Optional[int]
+) -> None:
+    from release.execution import DEFAULT_POLICIES, update_policy
+
+    for timeout in timeouts:
+        (step, _, seconds) = timeout.partition("=")
+        try:
+            update_policy(step, timeout=float(seconds))
+        except ValueError:
+            raise click.BadParameter(
+                f"expected STEP=SECONDS, got {timeout!r}",
+                param_hint="--timeout",
+            ) from None
+
+    if retries is not None:
+        for step in DEFAULT_POLICIES:
+            update_policy(step, attempts=retries + 1)
+
+
+def hedge_slow_steps(git_: "Git", extra_steps: Sequence[str]) -> None:
+    """
+    Hedges network steps once an attempt runs longer than their attempts'
+    p95 from earlier deploys (when there are enough of them).
+    """
+    from release.execution import update_policy
+    from release.history import History, attempt_phase, history_path
+
+    import sqlite3
+
+    steps = ["git_push", "create_release", "upload_sourcemaps", *extra_steps]
+    try:
+        history = History(history_path(git_.snapshot().git_dir))
+        for step in steps:
+            p95 = history.percentile(attempt_phase(step), 95)
+            if p95 is not None:
+                update_policy(step, hedge_after=p95)
+    except (sqlite3.Error, OSError) as e:
+        click.echo(f"couldn't read timing history: {e}", err=True)
+
+
+def record_history(
+    command: str, environment: str, git_: Optional["Git"]
+) -> None:
+    """
+    Appends this run's phase timings to the local history. A history we
+    can't write to is reported, but never fails the command.
+    """
+    from release.history import History, history_path, phase_records
+    from release.release_mgmt.manager import ReleaseManager
+    from release.tracing import TRACER
+
+    import sqlite3
+    import subprocess
+    import time
+
+    if git_ is None:
+        return
+
+    total = time.perf_counter() - TRACER.origin
+    records = phase_records(TRACER.spans, total)
+    try:
+        last = ReleaseManager(git_).last_version()
+        version = f"v{last.version_string()}" if last else None
+        path = history_path(git_.snapshot().git_dir)
+        History(path).record(command, environment, version, records)
+    except (sqlite3.Error, OSError, subprocess.CalledProcessError) as e:
+        click.echo(f"couldn't record timings: {e}", err=True)
 
 
 @cli.command()
 def print_version() -> None:
-    manager = ReleaseManager.from_local_dir()
-    version = manager.last_version() or Version(0, 0, 0)
-    print(version.version_string("patch"))
+    from release.release_mgmt.refs import UnsupportedLayout, latest_version
+
+    try:
+        version = latest_version(Path.cwd())
+    except UnsupportedLayout:
+        from release.release_mgmt.manager import ReleaseManager
+
+        version = ReleaseManager.from_local_dir().last_version()
+
+    print((version or Version(0, 0, 0)).version_string("patch"))
 
 
 @cli.command()
@@ -41,52 +162,583 @@ def print_version() -> None:
 @click.argument("BUMP_MODE", type=click.Choice(BUMP_MODES), default="patch")
 @click.argument("BUNDLE_PATH", type=Path)
 @click.argument("SOURCEMAP_PATH", type=Path)
+@click.option(
+    "--sentry-backend",
+    type=click.Choice(SENTRY_BACKENDS),
+    default="http",
+    envvar="SENTRY_BACKEND",
+    show_default=True,
+    help="Talk to Sentry directly over HTTP, or through sentry-cli (which "
+    "can't be given the release's commits, so works them out itself)",
+)
+@click.option(
+    "--target",
+    "targets",
+    multiple=True,
+    help="wrangler environment to deploy to; repeat for several "
+    "(default: RELEASE_MODE)",
+)
+@click.option(
+    "--max-parallel",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Most environments to deploy to at once",
+)
+@click.option(
+    "--log-dir",
+    type=Path,
+    help="Write each environment's wrangler output to its own file here "
+    "(default: a temporary directory, when deploying to several)",
+)
+@click.option(
+    "--size-budget",
+    type=click.IntRange(min=0),
+    envvar="RELEASE_SIZE_BUDGET",
+    help="Fail if the gzipped bundle is larger than this many bytes",
+)
+@click.option(
+    "--slim-sourcemap",
+    is_flag=True,
+    help="Drop third-party sourcesContent from the sourcemap before "
+    "uploading it to Sentry",
+)
+@click.option(
+    "--migrate",
+    is_flag=True,
+    help="Apply pending D1 migrations before uploading",
+)
+@click.option(
+    "--database",
+    envvar="D1_DATABASE",
+    help="Name of the D1 database to migrate, as in wrangler.toml",
+)
+@click.option(
+    "--queue/--no-queue",
+    default=True,
+    show_default=True,
+    help="Wait for other deploys on this machine, and give up (with exit "
+    f"status {EXIT_SUPERSEDED}) if a newer deploy to the same environments "
+    "is queued meanwhile",
+)
+@click.option(
+    "--history/--no-history",
+    default=True,
+    show_default=True,
+    help="Record how long each phase took, for `release stats`",
+)
+@click.option(
+    "--timeout",
+    "timeouts",
+    multiple=True,
+    metavar="STEP=SECONDS",
+    help="Per-attempt timeout for a step (git_ls_remote, git_push, "
+    "git_tag, create_release, upload_sourcemaps, wrangler_deploy); "
+    "repeatable",
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(min=0),
+    help="How many times to retry a failed network step (default: 2)",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Upload even to environments already running this bundle",
+)
+@click.option(
+    "--hedge/--no-hedge",
+    default=False,
+    show_default=True,
+    help="Start a second attempt of a network step that's running slower "
+    "than its historical p95 (which may upload a bundle twice)",
+)
+@click.pass_context
 def deploy(
-    release_mode: str, bump_mode: Mode, bundle_path: Path, sourcemap_path: Path
+    ctx: click.Context,
+    release_mode: str,
+    bump_mode: Mode,
+    bundle_path: Path,
+    sourcemap_path: Path,
+    sentry_backend: str,
+    targets: Tuple[str, ...],
+    max_parallel: int,
+    log_dir: Optional[Path],
+    size_budget: Optional[int],
+    slim_sourcemap: bool,
+    migrate: bool,
+    database: Optional[str],
+    queue: bool,
+    history: bool,
+    timeouts: Tuple[str, ...],
+    retries: Optional[int],
+    force: bool,
+    hedge: bool,
 ) -> None:
-    env = Environment.from_env()
-    sentry = Sentry(
-        org=env.sentry.org,
-        project=env.sentry.project_id,
-        auth_token=env.sentry.token,
+    from release.deploy import deploy_graph, deploy_step, target_summary
+    from release.deploy_queue import DeployQueue, Superseded, queue_dir
+    from release.manifest import LocalManifest, manifest_path
+    from release.environment import (
+        SENTRY_SECRET,
+        WRANGLER_SECRET,
+        Environment,
     )
-    wrangler = Wrangler(
-        src_root=env.git.root(),
-        wrangler_bin=env.wrangler_bin,
+    from release.release_mgmt.git import Git
+    from release.scheduler import StepFailed
+    from release.sentry import SentryClient
+
+    import contextlib
+    import tempfile
+
+    if migrate and not database:
+        raise click.UsageError("--migrate needs --database")
+
+    targets = targets or (release_mode,)
+    configure_execution(timeouts, retries)
+    if len(targets) > 1 and log_dir is None:
+        log_dir = Path(tempfile.mkdtemp(prefix="release-deploy-"))
+
+    with contextlib.ExitStack() as stack:
+        if queue:
+            git_dir = Git.from_local_dir().snapshot().git_dir
+            key = f"{release_mode}:{','.join(sorted(targets))}"
+            try:
+                admission = stack.enter_context(
+                    DeployQueue(queue_dir(git_dir)).admit(key)
+                )
+            except Superseded as e:
+                click.echo(f"{e}; not deploying", err=True)
+                ctx.exit(EXIT_SUPERSEDED)
+            click.echo(str(admission), err=True)
+
+        needs = [WRANGLER_SECRET]
+        if release_mode == "production":
+            needs.append(SENTRY_SECRET)
+        env = Environment.from_env(needs)
+        wrangler = env.wrangler()
+        if hedge:
+            hedge_slow_steps(env.git, [*map(deploy_step, targets)])
+        sentry: Optional[SentryClient] = None
+        if release_mode == "production":
+            # NOTE: only production releases talk to Sentry
+            sentry = sentry_client(env, sentry_backend)
+
+        slim_dir = None
+        if slim_sourcemap:
+            tmp = stack.enter_context(tempfile.TemporaryDirectory())
+            slim_dir = Path(tmp)
+
+        graph = deploy_graph(
+            env,
+            sentry,
+            wrangler,
+            release_mode,
+            bump_mode,
+            bundle_path,
+            sourcemap_path,
+            targets=targets,
+            max_parallel=max_parallel,
+            log_dir=log_dir,
+            size_budget=size_budget,
+            slim_dir=slim_dir,
+            database=database if migrate else None,
+            manifest=LocalManifest(manifest_path(env.git.snapshot().git_dir)),
+            force=force,
+        )
+        try:
+            report = graph.run()
+        except StepFailed as e:
+            click.echo("deploy targets:", err=True)
+            click.echo(target_summary(e.report, targets, log_dir), err=True)
+            raise
+        finally:
+            print_trace_summary()
+            if history:
+                record_history("deploy", release_mode, env.git)
+
+    click.echo("deploy steps (* = critical path):", err=True)
+    click.echo(report.summary(), err=True)
+    click.echo("deploy targets:", err=True)
+    click.echo(target_summary(report, targets, log_dir), err=True)
+    if "analyze_bundle" in report.results:
+        click.echo(report.results["analyze_bundle"].value.summary(), err=True)
+    if "slim_sourcemap" in report.results:
+        click.echo(str(report.results["slim_sourcemap"].value), err=True)
+
+
+@cli.command()
+@click.option(
+    "--command",
+    type=click.Choice(["deploy", "build"]),
+    default="deploy",
+    show_default=True,
+)
+@click.option("--environment", help="Only show this environment")
+@click.option(
+    "--days",
+    type=click.FloatRange(min=0),
+    default=30,
+    show_default=True,
+    help="How far back to look",
+)
+@click.option(
+    "--recent",
+    type=click.IntRange(min=1),
+    default=5,
+    show_default=True,
+    help="How many of the latest runs to compare against the ones before",
+)
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0),
+    default=0.2,
+    show_default=True,
+    help="Relative slowdown that counts as a regression",
+)
+@click.option(
+    "--check",
+    is_flag=True,
+    help="Exit non-zero if any phase regressed",
+)
+def stats(
+    command: str,
+    environment: Optional[str],
+    days: float,
+    recent: int,
+    threshold: float,
+    check: bool,
+) -> None:
+    """
+    Shows p50/p95/p99 durations of each phase of past runs, flagging phases
+    whose recent runs are slower than the ones before them.
+    """
+    from release.history import History, history_path, stats_table
+    from release.release_mgmt.git import Git
+
+    git_dir = Git.from_local_dir().snapshot().git_dir
+    history = History(history_path(git_dir))
+    rows = [
+        s
+        for s in history.stats(command, days, recent)
+        if environment is None or s.environment == environment
+    ]
+    if not rows:
+        click.echo(f"no {command} runs in the last {days:g} days", err=True)
+        return
+
+    click.echo(stats_table(rows, threshold))
+    regressed = [s.phase for s in rows if s.regressed(threshold)]
+    if check and regressed:
+        raise click.ClickException(f"slower than before: {regressed}")
+
+
+@cli.command("queue")
+def show_queue() -> None:
+    """
+    Shows the deploy running on this machine, and any waiting behind it.
+    """
+    from release.deploy_queue import DeployQueue, queue_dir
+    from release.release_mgmt.git import Git
+
+    import time
+
+    git_dir = Git.from_local_dir().snapshot().git_dir
+    state = DeployQueue(queue_dir(git_dir)).status()
+    now = time.time()
+
+    click.echo(f"depth: {state.depth()}")
+    if state.running:
+        age = now - state.running.enqueued_at
+        click.echo(f"running: {state.running} queued {age:.1f}s ago")
+    for ticket in state.pending:
+        age = now - ticket.enqueued_at
+        click.echo(f"waiting: {ticket} for {age:.1f}s")
+
+
+@cli.command()
+@click.argument(
+    "RELEASE_MODE",
+    type=click.Choice(RELEASE_MODES),
+    default="production",
+    envvar="ENV",
+)
+@click.option(
+    "--database",
+    envvar="D1_DATABASE",
+    required=True,
+    help="Name of the D1 database to migrate, as in wrangler.toml",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    help="Migrations to apply per batch (default: all pending at once)",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only check pending migrations against an in-memory SQLite copy",
+)
+@click.option(
+    "--baseline",
+    metavar="NAME",
+    help="Record migrations up to and including NAME as applied without "
+    "running them, for databases migrated by hand",
+)
+@click.option(
+    "--local",
+    is_flag=True,
+    help="Migrate wrangler's local copy of the database instead",
+)
+def migrate(
+    release_mode: str,
+    database: str,
+    batch_size: Optional[int],
+    dry_run: bool,
+    baseline: Optional[str],
+    local: bool,
+) -> None:
+    """
+    Applies pending migrations from migrations/ to a D1 database.
+    """
+    from release.environment import WRANGLER_SECRET, Environment
+    from release.migrations import Migrator
+
+    env = Environment.from_env([WRANGLER_SECRET])
+    wrangler = env.wrangler()
+    migrator = Migrator(
+        wrangler,
+        database,
+        release_mode,
+        env.git.root() / "migrations",
+        remote=not local,
     )
-    is_prod = release_mode == "production"
+    applied = migrator.migrate(batch_size, dry_run, baseline)
+
+    verb = "would apply" if dry_run else "applied"
+    if not applied:
+        click.echo("no pending migrations", err=True)
+    for migration in applied:
+        click.echo(f"{verb} {migration.name}", err=True)
+
+
+@cli.group()
+def agent() -> None:
+    """
+    Keeps decrypted credentials in memory between commands.
+    """
+
+
+TTL_OPTION = click.option(
+    "--ttl",
+    type=click.FloatRange(min=0),
+    default=15 * 60,
+    show_default=True,
+    help="Seconds to keep credentials before decrypting them again",
+)
+
+
+@agent.command("start")
+@TTL_OPTION
+def start_agent(ttl: float) -> None:
+    from release.agent import AgentClient, socket_path, spawn
+
+    if AgentClient.connect():
+        click.echo(f"agent already listening on {socket_path()}", err=True)
+        return
+
+    pid = spawn(ttl)
+    click.echo(f"agent {pid} listening on {socket_path()}", err=True)
+
+
+@agent.command("serve", hidden=True)
+@TTL_OPTION
+def serve_agent(ttl: float) -> None:
+    from release.agent import serve, socket_path
+
+    serve(socket_path(), ttl)
+
+
+@agent.command("stop")
+def stop_agent() -> None:
+    from release.agent import AgentClient
+
+    client = AgentClient.connect()
+    if client is None:
+        click.echo("no agent running", err=True)
+        return
 
-    tag_str = ""
-    if is_prod:
-        env.git.assert_clean()
-        manager = ReleaseManager(env.git)
-        new_version = manager.version_bump(bump_mode)
-        tag_str = f"v{new_version.version_string()}"
-        hash = env.git.commit_hash()
-        env.git.push(tags=True)
-        sentry.create_release(commit=hash, tag=tag_str)
+    client.request({"op": "stop"})
 
-    wrangler.deploy(release_mode, bundle_path)
 
-    if is_prod:
-        sentry.upload_sourcemaps(tag_str, bundle_path, sourcemap_path)
+@agent.command("clear")
+def clear_agent() -> None:
+    """
+    Forgets all credentials without stopping the agent.
+    """
+    from release.agent import AgentClient
+
+    client = AgentClient.connect()
+    if client is not None:
+        client.request({"op": "clear"})
+
+
+@agent.command("status")
+def status_agent() -> None:
+    from release.agent import AgentClient, socket_path
+
+    client = AgentClient.connect()
+    if client is None:
+        raise click.ClickException("no agent running")
+
+    pid = client.request({"op": "ping"})["pid"]
+    click.echo(f"agent {pid} listening on {socket_path()}")
+
+
+def link_node_modules(proj_dir: Path, node_modules_dir: Path) -> None:
+    node_modules = proj_dir / "node_modules"
+
+    # Just in case we want to use the local node_modules (experimentation, etc)
+    if node_modules != node_modules_dir:
+        node_modules.unlink(missing_ok=True)
+        node_modules.symlink_to(node_modules_dir)
 
 
 @cli.command()
 @click.argument("OUTPUT_DIRECTORY", required=True)
 @click.argument("NODE_MODULES_PATH", required=True)
-def build(output_directory: str, node_modules_path: str) -> None:
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    help="Reuse outputs of an earlier build with identical inputs",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=0),
+    envvar="RELEASE_BUILD_CACHE_SIZE",
+    help="Most bytes of build outputs to keep cached (default: 512MiB)",
+)
+@click.option(
+    "--size-budget",
+    type=click.IntRange(min=0),
+    envvar="RELEASE_SIZE_BUDGET",
+    help="Fail if the gzipped bundle is larger than this many bytes",
+)
+@click.option(
+    "--history/--no-history",
+    default=True,
+    show_default=True,
+    help="Record how long each phase took, for `release stats`",
+)
+def build(
+    output_directory: str,
+    node_modules_path: str,
+    cache: bool,
+    cache_size: Optional[int],
+    size_budget: Optional[int],
+    history: bool,
+) -> None:
     output_dir = Path(output_directory.strip())
     node_modules_dir = Path(node_modules_path.strip())
 
+    try:
+        build_outputs(output_dir, node_modules_dir, cache, cache_size)
+        if size_budget is not None:
+            check_size(
+                output_dir / "index.js",
+                output_dir / "index.js.map",
+                size_budget,
+            )
+    finally:
+        print_trace_summary()
+        if history:
+            # NOTE: builds have no environment of their own
+            record_history("build", "local", local_git())
+
+
+def local_git() -> Optional["Git"]:
+    """
+    The repository we're running in, or None when there isn't one (e.g.
+    building inside the Nix sandbox).
+    """
+    from release.release_mgmt.git import Git
+
+    import subprocess
+
+    try:
+        return Git.from_local_dir()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def check_size(
+    bundle_path: Path,
+    sourcemap_path: Path,
+    size_budget: Optional[int],
+    top: int = 10,
+) -> None:
+    from release.sourcemap import analyze_release, check_budget
+    from release.tracing import TRACER
+
+    with TRACER.span("analyze_bundle"):
+        analysis = analyze_release(bundle_path, sourcemap_path, local_git())
+    click.echo(analysis.summary(top), err=True)
+    check_budget(analysis.report, size_budget)
+
+
+@cli.command()
+@click.argument("BUNDLE_PATH", type=Path)
+@click.argument("SOURCEMAP_PATH", type=Path)
+@click.option(
+    "--size-budget",
+    type=click.IntRange(min=0),
+    envvar="RELEASE_SIZE_BUDGET",
+    help="Fail if the gzipped bundle is larger than this many bytes",
+)
+@click.option(
+    "--top",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="How many packages and modules to list",
+)
+def analyze(
+    bundle_path: Path,
+    sourcemap_path: Path,
+    size_budget: Optional[int],
+    top: int,
+) -> None:
+    """
+    Shows how much of the bundle each source module and package accounts
+    for, and what changed most since the last release.
+    """
+    check_size(bundle_path, sourcemap_path, size_budget, top)
+
+
+def build_outputs(
+    output_dir: Path,
+    node_modules_dir: Path,
+    cache: bool,
+    cache_size: Optional[int],
+) -> None:
+    from release.build_cache import BuildCache
+    from release.tracing import TRACER
+    from release.wrangler import BUILD_ARGS, Wrangler
+
+    import shutil
+
     # TODO: improve?
     proj_dir = Path.cwd()
-    node_modules = proj_dir / "node_modules"
 
-    # Just in case we want to use the local node_modules (experimentation, etc)
-    if node_modules != node_modules_dir:
-        node_modules.unlink(missing_ok=True)
-        node_modules.symlink_to(node_modules_dir)
+    build_cache = BuildCache.from_env(cache_size) if cache else None
+    if build_cache:
+        with TRACER.span("build_cache_lookup"):
+            key = build_cache.key(proj_dir, node_modules_dir, BUILD_ARGS)
+            hit = build_cache.restore(key, output_dir)
+        if hit:
+            click.echo(f"build cache hit ({key[:12]})", err=True)
+            return
+
+    link_node_modules(proj_dir, node_modules_dir)
 
     wrangler_bin = node_modules_dir / ".bin/wrangler2"
     wrangler = Wrangler(src_root=proj_dir, wrangler_bin=wrangler_bin)
@@ -95,10 +747,87 @@ def build(output_directory: str, node_modules_path: str) -> None:
     tmp_build_dir.mkdir(exist_ok=True)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    wrangler.build(tmp_build_dir)
+    with TRACER.span("wrangler_build"):
+        wrangler.build(tmp_build_dir)
     for f in ("index.js", "index.js.map"):
         shutil.move(tmp_build_dir / f, output_dir / f)
 
+    if build_cache:
+        with TRACER.span("build_cache_store"):
+            build_cache.store(key, output_dir)
+
+
+@cli.command()
+@click.argument("OUTPUT_DIRECTORY", required=True)
+@click.argument("NODE_MODULES_PATH", required=True)
+@click.option(
+    "--debounce",
+    type=float,
+    default=0.1,
+    show_default=True,
+    help="Seconds without changes before rebuilding",
+)
+@click.option(
+    "--deploy",
+    "deploy_env",
+    type=click.Choice(["dev", "staging"]),
+    help="Deploy to this environment after each successful rebuild",
+)
+def watch(
+    output_directory: str,
+    node_modules_path: str,
+    debounce: float,
+    deploy_env: Optional[str],
+) -> None:
+    """
+    Rebuilds OUTPUT_DIRECTORY whenever anything in src/ changes.
+    """
+    from release.watch import BuildFailed, EsbuildServer, watch
+    from release.wrangler import BUILD_OUTPUTS, Wrangler
+
+    import subprocess
+    import time
+
+    output_dir = Path(output_directory.strip())
+    node_modules_dir = Path(node_modules_path.strip())
+    proj_dir = Path.cwd()
+    link_node_modules(proj_dir, node_modules_dir)
+
+    wrangler: Optional[Wrangler] = None
+    if deploy_env:
+        from release.environment import WRANGLER_SECRET, Environment
+
+        env = Environment.from_env([WRANGLER_SECRET])
+        wrangler = env.wrangler()
+
+    def rebuild(server: EsbuildServer) -> None:
+        start = time.monotonic()
+        try:
+            server.build(output_dir, BUILD_OUTPUTS)
+        except BuildFailed as e:
+            click.echo(str(e), err=True)
+            return
+
+        elapsed = (time.monotonic() - start) * 1000
+        click.echo(f"rebuilt {output_dir} in {elapsed:.0f}ms", err=True)
+        if wrangler and deploy_env:
+            try:
+                wrangler.deploy(deploy_env, output_dir / "index.js")
+            except (subprocess.SubprocessError, OSError) as e:
+                # NOTE: the next change gets another go
+                click.echo(f"deploying to {deploy_env} failed: {e}", err=True)
+
+    server = EsbuildServer(node_modules_dir / ".bin" / "esbuild", proj_dir)
+    try:
+        rebuild(server)
+        for changed in watch(proj_dir / "src", debounce):
+            click.echo(f"{len(changed)} path(s) changed", err=True)
+            rebuild(server)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,251 @@
+"""
+An ssh-agent style daemon that keeps decrypted credentials in memory, so
+back-to-back commands don't decrypt and source the same secrets each time.
+
+Entries are scoped to a checkout and keyed on the contents of its secrets
+(and the identities used to decrypt them); when any of those change, the
+old entry is dropped on the next lookup. Entries also expire after a TTL.
+Nothing the agent holds is ever written to disk.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+
+DEFAULT_TTL = 15 * 60
+# Requests and responses are single JSON lines; secrets are small
+MAX_MESSAGE = 1024 * 1024
+
+
+def socket_path() -> Path:
+    configured = os.environ.get("RELEASE_AGENT_SOCK")
+    if configured:
+        return Path(configured)
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    base = Path(runtime_dir) if runtime_dir else Path("/tmp")
+    return base / f"release-agent-{os.getuid()}" / "agent.sock"
+
+
+def secrets_key(
+    root: Path, paths: Iterable[Path], identities: Iterable[Path]
+) -> str:
+    """
+    Identifies the encrypted secrets (paths relative to root) that a cached
+    entry was decrypted from; hashing the blobs is far cheaper than age.
+    """
+    h = hashlib.sha256(str(root).encode())
+    for path in sorted(paths):
+        h.update(b"\0" + str(path).encode() + b"\0")
+        h.update(hashlib.sha256((root / path).read_bytes()).digest())
+    for identity in identities:
+        h.update(b"\0" + str(identity).encode())
+
+    return h.hexdigest()
+
+
+def _check_private(directory: Path) -> None:
+    st = directory.lstat()
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f"{directory} is not a directory we own")
+    if st.st_mode & 0o077:
+        raise PermissionError(f"{directory} is accessible to other users")
+
+
+class Store:
+    def __init__(self, ttl: float):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # scope -> (key, expiry, value)
+        self._entries: Dict[str, Tuple[str, float, Any]] = {}
+
+    def get(self, scope: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is None:
+                return None
+
+            (entry_key, expiry, value) = entry
+            if entry_key != key or expiry < time.monotonic():
+                # The secrets changed (or it's stale): forget the old ones
+                del self._entries[scope]
+                return None
+            return value
+
+    def put(self, scope: str, key: str, value: Any) -> None:
+        with self._lock:
+            expiry = time.monotonic() + self._ttl
+            self._entries[scope] = (key, expiry, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "AgentServer"
+
+    def handle(self) -> None:
+        if not self.server.peer_allowed(self.request):
+            return
+
+        line = self.rfile.readline(MAX_MESSAGE)
+        try:
+            request = json.loads(line)
+            response = self.server.dispatch(request)
+        except (ValueError, KeyError) as e:
+            response = {"ok": False, "error": str(e)}
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class AgentServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.store = Store(ttl)
+
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        _check_private(path.parent)
+        path.unlink(missing_ok=True)
+
+        # NOTE: created 0600 from the start, not chmod'd afterwards
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(str(path), _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def peer_allowed(self, conn: socket.socket) -> bool:
+        if not hasattr(socket, "SO_PEERCRED"):
+            # The directory permissions are all we have
+            return True
+        creds = conn.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        (_, uid, _) = struct.unpack("3i", creds)
+        return uid == os.getuid()
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request["op"]
+        if op == "get":
+            value = self.store.get(request["scope"], request["key"])
+            return {"ok": True, "value": value}
+        if op == "put":
+            self.store.put(request["scope"], request["key"], request["value"])
+            return {"ok": True}
+        if op == "clear":
+            self.store.clear()
+            return {"ok": True}
+        if op == "stop":
+            threading.Thread(target=self.shutdown).start()
+            return {"ok": True}
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid()}
+
+        raise ValueError(f"unknown op {op!r}")
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.path.unlink(missing_ok=True)
+
+
+class AgentClient:
+    def __init__(self, path: Path, timeout: float = 2.0):
+        self._path = path
+        self._timeout = timeout
+
+    @classmethod
+    def connect(cls) -> Optional["AgentClient"]:
+        """
+        Returns a client if an agent is listening (in a private directory),
+        otherwise None.
+        """
+        path = socket_path()
+        try:
+            _check_private(path.parent)
+        except OSError:
+            return None
+
+        client = cls(path)
+        try:
+            client.request({"op": "ping"})
+        except OSError:
+            return None
+        return client
+
+    def request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(self._timeout)
+            s.connect(str(self._path))
+            s.sendall(json.dumps(request).encode() + b"\n")
+            with s.makefile("rb") as f:
+                line = f.readline(MAX_MESSAGE)
+
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise OSError(f"agent error: {response.get('error')}")
+        return response
+
+    def get(self, scope: str, key: str) -> Optional[Any]:
+        request = {"op": "get", "scope": scope, "key": key}
+        return self.request(request)["value"]
+
+    def put(self, scope: str, key: str, value: Any) -> None:
+        self.request({"op": "put", "scope": scope, "key": key, "value": value})
+
+
+def serve(path: Path, ttl: float) -> None:
+    with AgentServer(path, ttl) as server:
+        server.serve_forever()
+
+
+def spawn(ttl: float, timeout: float = 5.0) -> int:
+    """
+    Starts an agent in the background, returning its pid once it answers.
+    """
+    import subprocess
+
+    path = socket_path()
+    cmd = [
+        sys.executable,
+        "-m",
+        "release",
+        "agent",
+        "serve",
+        "--ttl",
+        str(ttl),
+    ]
+    # Make sure the child imports this same copy of the package
+    package_root = str(Path(__file__).resolve().parents[1])
+    paths = [package_root, os.environ.get("PYTHONPATH")]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, paths))}
+    proc = subprocess.Popen(
+        cmd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"agent exited with {proc.returncode}")
+        if path.exists() and AgentClient.connect():
+            return proc.pid
+        time.sleep(0.05)
+
+    proc.kill()
+    raise RuntimeError("timed out waiting for the agent to start")
@@ -0,0 +1,86 @@
+"""
+Compares the old two-step cleanliness check with a single `git status` on
+a large checkout.
+
+    python -m release.bench.assert_clean [--files N] [--dirty N]
+"""
+
+from release.bench.fixtures import git, make_repo
+from release.bench.timing import measure
+from release.release_mgmt.git import Git
+
+from pathlib import Path
+import argparse
+import subprocess
+import tempfile
+
+
+def add_files(root: Path, count: int, per_dir: int = 1000) -> None:
+    # One commit adding `count` small files; fast-import is much quicker
+    # than writing and `git add`ing them.
+    parent = git(root, "rev-parse", "HEAD")
+    stream = [
+        "blob\nmark :1\ndata 6\nbench\n",
+        "commit refs/heads/master",
+        "committer bench <bench@localhost> 1700000000 +0000",
+        "data 0",
+        f"from {parent}",
+    ]
+    for i in range(count):
+        stream.append(f"M 100644 :1 files/{i // per_dir}/{i}.txt")
+
+    data = ("\n".join(stream) + "\n\n").encode()
+    cmd = ["git", "-C", str(root), "fast-import", "--quiet"]
+    subprocess.run(cmd, input=data, check=True)
+    git(root, "reset", "-q", "--hard", "master")
+
+
+def legacy_is_clean(root: Path) -> bool:
+    # What Git.assert_clean used to do
+    prefix = ["git", "-C", str(root)]
+    subprocess.run([*prefix, "update-index", "-q", "--refresh"])
+    diff = [*prefix, "diff-index", "--quiet", "HEAD", "--"]
+    return subprocess.run(diff).returncode == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--dirty", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="release-bench-") as tmp:
+        root = make_repo(Path(tmp) / "repo")
+        add_files(root, args.files)
+
+        timings = [
+            measure(
+                "update-index + diff",
+                lambda: legacy_is_clean(root),
+                args.repeat,
+            ),
+            measure(
+                "status (clean)",
+                lambda: Git(root).dirty_paths(),
+                args.repeat,
+            ),
+        ]
+
+        for i in range(args.dirty):
+            (root / "files" / "0" / f"{i}.txt").write_text("dirty\n")
+        timings.append(
+            measure(
+                "status (dirty)",
+                lambda: Git(root).dirty_paths(),
+                args.repeat,
+            )
+        )
+
+    print(f"{args.files} tracked files")
+    for t in timings:
+        print(t)
+
+
+if __name__ == "__main__":
+    main()
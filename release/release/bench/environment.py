@@ -0,0 +1,46 @@
+"""
+Compares serial and concurrent secret loading in Environment.from_env.
+
+    python -m release.bench.environment [--latency SECONDS] [--repeat N]
+"""
+
+from release.bench.fixtures import bench_env
+from release.bench.timing import measure
+from release.environment import ALL_SECRETS, Environment
+
+import argparse
+
+
+def load_all(env: Environment) -> Environment:
+    # Secrets are only decrypted once something asks for them
+    env.store.load(ALL_SECRETS)
+    for name in ALL_SECRETS:
+        env.store.get(name)
+    return env
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with bench_env(age_latency=args.latency):
+        serial = measure(
+            "from_env (serial)",
+            lambda: load_all(Environment.from_env(concurrent=False)),
+            args.repeat,
+        )
+        concurrent = measure(
+            "from_env (concurrent)",
+            lambda: load_all(Environment.from_env(concurrent=True)),
+            args.repeat,
+        )
+
+    print(serial)
+    print(concurrent)
+    print(f"speedup: {serial.median / concurrent.median:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+import contextlib
+import os
+import subprocess
+import tempfile
+
+# Stands in for `age --decrypt`: the "encrypted" fixtures are plaintext, so
+# decrypting is a copy after a configurable delay.
+AGE_STUB = """#!/bin/sh
+sleep "${STUB_AGE_LATENCY:-0.05}"
+out=""
+while [ $# -gt 1 ]; do
+    case "$1" in
+        --output) out="$2"; shift 2 ;;
+        *) shift ;;
+    esac
+done
+if [ -n "$out" ]; then cp "$1" "$out"; else cat "$1"; fi
+"""
+
+SENTRY_CLI_STUB = """#!/bin/sh
+sleep "${STUB_SENTRY_LATENCY:-0.05}"
+"""
+
+# Answers `deploy` after a delay, and writes placeholder outputs when asked
+# to build into an --outdir.
+WRANGLER_STUB = """#!/bin/sh
+sleep "${STUB_WRANGLER_LATENCY:-0.05}"
+out=""
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --outdir) out="$2"; shift 2 ;;
+        *) shift ;;
+    esac
+done
+if [ -n "$out" ]; then
+    mkdir -p "$out"
+    echo 'export default {};' > "$out/index.js"
+    echo '{"version":3,"sources":[],"mappings":""}' > "$out/index.js.map"
+fi
+"""
+
+SECRETS = {
+    "cf_authn.sh": (
+        "export CLOUDFLARE_API_TOKEN=bench-token\n"
+        "export CLOUDFLARE_ACCOUNT_ID=bench-account\n"
+    ),
+    "sentry_authn.sh": (
+        "export SENTRY_AUTH_TOKEN=bench-sentry-token\n"
+        "export SENTRY_ORG=bench-org\n"
+        "export SENTRY_PROJECT=bench-project\n"
+    ),
+    "wrangler.toml": 'name = "bench"\nmain = "src/index.ts"\n',
+}
+
+
+def git(root: Path, *argv: str) -> str:
+    cmd = ["git", "-C", str(root), *argv]
+    return subprocess.check_output(cmd).decode().strip()
+
+
+def install_stub(bin_dir: Path, name: str, script: str) -> Path:
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    path = bin_dir / name
+    path.write_text(script)
+    path.chmod(0o755)
+    return path
+
+
+def make_repo(root: Path) -> Path:
+    root.mkdir(parents=True, exist_ok=True)
+    git(root, "init", "-q", "-b", "master")
+    git(root, "config", "user.name", "bench")
+    git(root, "config", "user.email", "bench@localhost")
+    git(root, "config", "commit.gpgsign", "false")
+
+    secrets_dir = root / "secrets"
+    secrets_dir.mkdir(exist_ok=True)
+    for name, content in SECRETS.items():
+        (secrets_dir / f"{name}.age").write_text(content)
+    (root / "src").mkdir(exist_ok=True)
+    (root / "src" / "index.ts").write_text("export default {};\n")
+
+    git(root, "add", "-A")
+    git(root, "commit", "-q", "-m", "initial")
+    return root
+
+
+@contextlib.contextmanager
+def bench_env(
+    age_latency: float = 0.05,
+    sentry_latency: float = 0.05,
+    wrangler_latency: float = 0.05,
+    extra_env: Optional[Dict[str, str]] = None,
+) -> Iterator[Path]:
+    """
+    Yields a throwaway repository with stubbed tools on PATH, a fake HOME
+    holding an ssh identity, and the process chdir'd into the repository.
+    """
+    old_cwd = Path.cwd()
+    old_env = dict(os.environ)
+    with tempfile.TemporaryDirectory(prefix="release-bench-") as tmp:
+        base = Path(tmp)
+        home = base / "home"
+        (home / ".ssh").mkdir(parents=True)
+        (home / ".ssh" / "id_ed25519").write_text("bench identity\n")
+
+        bin_dir = base / "bin"
+        install_stub(bin_dir, "age", AGE_STUB)
+        install_stub(bin_dir, "sentry-cli", SENTRY_CLI_STUB)
+        wrangler = install_stub(bin_dir, "wrangler2", WRANGLER_STUB)
+
+        repo = make_repo(base / "repo")
+        os.environ.update(
+            {
+                "HOME": str(home),
+                "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+                "STUB_AGE_LATENCY": str(age_latency),
+                "STUB_SENTRY_LATENCY": str(sentry_latency),
+                "STUB_WRANGLER_LATENCY": str(wrangler_latency),
+                "WRANGLER_BIN": str(wrangler),
+                # The stubbed sentry-cli, rather than the real Sentry API
+                "SENTRY_BACKEND": "cli",
+                # Never talk to an agent the developer has running
+                "RELEASE_AGENT_SOCK": str(base / "agent" / "agent.sock"),
+                **(extra_env or {}),
+            }
+        )
+        os.chdir(repo)
+        try:
+            yield repo
+        finally:
+            os.chdir(old_cwd)
+            os.environ.clear()
+            os.environ.update(old_env)
+
+
+def add_history(
+    root: Path,
+    commits: int,
+    version_tags: int = 0,
+    other_tags: int = 0,
+) -> None:
+    """
+    Appends commits to master with git fast-import, spreading version tags
+    (v0.0.0, v0.0.1, ...) and non-release tags evenly along them.
+    """
+    parent = git(root, "rev-parse", "HEAD")
+    stream = []
+    for i in range(1, commits + 1):
+        stream.append(
+            f"commit refs/heads/master\n"
+            f"mark :{i}\n"
+            f"committer bench <bench@localhost> {1700000000 + i} +0000\n"
+            f"data 0\n"
+            f"from {parent if i == 1 else f':{i - 1}'}\n"
+        )
+
+    def tag(name: str, n: int, total: int) -> None:
+        mark = 1 + (n * commits) // max(total, 1)
+        stream.append(f"reset refs/tags/{name}\nfrom :{min(mark, commits)}\n")
+
+    for n in range(version_tags):
+        (major, rest) = divmod(n, 10000)
+        (minor, patch) = divmod(rest, 100)
+        tag(f"v{major}.{minor}.{patch}", n, version_tags)
+    for n in range(other_tags):
+        tag(f"build-{n}", n, other_tags)
+
+    data = "\n".join(stream).encode()
+    cmd = ["git", "-C", str(root), "fast-import", "--quiet"]
+    subprocess.run(cmd, input=data, check=True)
+    git(root, "reset", "-q", "--hard", "master")
+
+
+def add_remote(root: Path, name: str = "origin") -> Path:
+    """
+    Creates a bare repository next to root and pushes everything to it.
+    """
+    remote = root.parent / f"{name}.git"
+    subprocess.run(
+        ["git", "init", "-q", "--bare", str(remote)], check=True
+    )
+    git(root, "remote", "add", name, str(remote))
+    git(root, "push", "-q", "--all", name)
+    git(root, "push", "-q", "--tags", name)
+    return remote
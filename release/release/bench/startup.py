@@ -0,0 +1,63 @@
+"""
+Measures cold-start time of `release print-version`, as a fresh interpreter
+per run like our build scripts do.
+
+    python -m release.bench.startup [--repeat N]
+"""
+
+from release.bench.fixtures import add_history, make_repo
+from release.bench.timing import measure
+
+from pathlib import Path
+import argparse
+import os
+import release
+import subprocess
+import sys
+import tempfile
+
+
+# Run against this checkout even if it isn't installed
+PYTHONPATH = str(Path(release.__file__).parent.parent)
+
+
+def run(root: Path, *argv: str) -> None:
+    cmd = [sys.executable, *argv]
+    env = {**os.environ, "PYTHONPATH": PYTHONPATH}
+    subprocess.run(
+        cmd, cwd=root, env=env, check=True, stdout=subprocess.DEVNULL
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--tags", type=int, default=1000)
+    args = parser.parse_args()
+
+    print_version = ["-m", "release", "print-version"]
+    with tempfile.TemporaryDirectory(prefix="release-bench-") as tmp:
+        root = make_repo(Path(tmp) / "repo")
+        add_history(root, 100, args.tags)
+        index = root / ".git" / "release" / "version-index.json"
+
+        def fallback() -> None:
+            index.unlink(missing_ok=True)
+            run(root, *print_version)
+
+        timings = [
+            measure("python -c pass", lambda: run(root, "-c", "pass")),
+            measure("print-version (git)", fallback, args.repeat),
+            measure(
+                "print-version (index)",
+                lambda: run(root, *print_version),
+                args.repeat,
+            ),
+        ]
+
+    for t in timings:
+        print(t)
+
+
+if __name__ == "__main__":
+    main()
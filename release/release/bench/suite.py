@@ -0,0 +1,329 @@
+"""
+Runs deploy, build and print-version end to end against a throwaway
+repository, with stubs standing in for age, sentry-cli and wrangler2, and
+compares the time spent in each phase against stored baselines.
+
+    python -m release.bench.suite [--repeat N] [--threshold FRACTION]
+                                  [--update-baselines]
+
+Baselines depend on the machine they were recorded on. Record them with
+--update-baselines before making a change, then compare afterwards; the
+run fails if any phase got slower than the threshold allows. A calibration
+workload is timed alongside the baselines, and comparing against baselines
+from a host that runs it at a different speed fails on that instead, rather
+than reporting the difference as a regression.
+"""
+
+from release.__main__ import cli
+from release.bench.fixtures import (
+    WRANGLER_STUB,
+    add_history,
+    add_remote,
+    bench_env,
+    git,
+    install_stub,
+)
+from release.bench.timing import Timing
+from release.tracing import TRACER
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+BASELINES_PATH = Path(__file__).with_name("baselines.json")
+
+# Phases faster than this are too noisy to call a regression
+MIN_DELTA = 0.005
+
+# Process starts, and some interpreter work, in about the proportion the
+# commands spend on them
+CALIBRATION_SPAWNS = 20
+CALIBRATION_LOOPS = 200_000
+# Runs of the calibration on one host vary by about half this
+HOST_TOLERANCE = 0.3
+
+
+@dataclass
+class Scenario:
+    name: str
+    argv: List[str]
+    # Runs before every sample, untimed
+    setup: Optional[Callable[[], None]] = None
+
+
+@dataclass
+class Result:
+    name: str
+    total: Timing
+    phases: Dict[str, Timing] = field(default_factory=dict)
+
+    def medians(self) -> Dict[str, object]:
+        return {
+            "total": self.total.median,
+            "phases": {n: t.median for (n, t) in self.phases.items()},
+        }
+
+
+@contextlib.contextmanager
+def quiet() -> Iterator[None]:
+    # Commands print summaries, and git chats on stderr; silence both at the
+    # file descriptor level so subprocesses are covered too.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved_fd in zip((1, 2), saved):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        os.close(devnull)
+
+
+def run_cli(argv: Sequence[str]) -> Dict[str, float]:
+    """
+    Runs one command in-process, returning the time spent in each traced
+    phase. Spans with the same name are summed, so concurrent steps can add
+    up to more than the wall-clock total.
+    """
+    TRACER.reset()
+    with quiet():
+        cli.main(list(argv), prog_name="release", standalone_mode=False)
+
+    phases: Dict[str, float] = {}
+    for span in TRACER.spans:
+        phases[span.name] = phases.get(span.name, 0.0) + span.duration
+    return phases
+
+
+def measure_scenario(scenario: Scenario, repeat: int) -> Result:
+    # One untimed run first, to warm caches the same way every time
+    if scenario.setup:
+        scenario.setup()
+    run_cli(scenario.argv)
+
+    totals: List[float] = []
+    phases: Dict[str, List[float]] = {}
+    for _ in range(repeat):
+        if scenario.setup:
+            scenario.setup()
+        start = time.perf_counter()
+        sample = run_cli(scenario.argv)
+        totals.append(time.perf_counter() - start)
+        for name, duration in sample.items():
+            phases.setdefault(name, []).append(duration)
+
+    return Result(
+        scenario.name,
+        Timing(scenario.name, totals),
+        {name: Timing(name, samples) for (name, samples) in phases.items()},
+    )
+
+
+def calibrate(repeat: int) -> float:
+    """
+    Median time for a fixed workload, which depends only on the host.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(CALIBRATION_SPAWNS):
+            subprocess.run(["git", "--version"], stdout=subprocess.DEVNULL)
+        sum(i * i for i in range(CALIBRATION_LOOPS))
+        samples.append(time.perf_counter() - start)
+    return Timing("calibration", samples).median
+
+
+def same_host(baseline: float, current: float) -> bool:
+    return abs(current - baseline) <= baseline * HOST_TOLERANCE
+
+
+def compare(
+    baseline: Dict[str, float], current: Dict[str, float], threshold: float
+) -> List[str]:
+    regressions = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if now > before * (1 + threshold) and now - before > MIN_DELTA:
+            change = (now - before) / before * 100
+            regressions.append(
+                f"{name}: {before * 1000:.1f}ms -> {now * 1000:.1f}ms "
+                f"(+{change:.0f}%)"
+            )
+
+    return regressions
+
+
+def check(
+    results: Sequence[Result], baselines: Dict[str, dict], threshold: float
+) -> List[str]:
+    regressions = []
+    for result in results:
+        baseline = baselines.get(result.name)
+        if baseline is None:
+            continue
+
+        current = {"total": result.total.median}
+        current.update((n, t.median) for (n, t) in result.phases.items())
+        previous = {"total": baseline["total"], **baseline["phases"]}
+        for line in compare(previous, current, threshold):
+            regressions.append(f"{result.name} / {line}")
+
+    return regressions
+
+
+def report(result: Result, baseline: Optional[dict]) -> str:
+    def row(name: str, timing: Timing, before: Optional[float]) -> str:
+        line = f"  {name:<28}{timing.median * 1000:9.1f}ms"
+        if before:
+            change = (timing.median - before) / before * 100
+            line += f"  (baseline {before * 1000:.1f}ms, {change:+.0f}%)"
+        return line
+
+    baseline_phases = (baseline or {}).get("phases", {})
+    lines = [
+        f"{result.name} (n={len(result.total.samples)})",
+        row("total", result.total, (baseline or {}).get("total")),
+    ]
+    ordered = sorted(result.phases.values(), key=lambda t: -t.median)
+    for timing in ordered:
+        before = baseline_phases.get(timing.name)
+        lines.append(row(timing.name, timing, before))
+
+    return "\n".join(lines)
+
+
+def scenarios(repo: Path) -> List[Scenario]:
+    base = repo.parent
+    node_modules = base / "node_modules"
+    install_stub(node_modules / ".bin", "wrangler2", WRANGLER_STUB)
+
+    artifacts = base / "artifacts"
+    artifacts.mkdir()
+    bundle = artifacts / "index.js"
+    sourcemap = artifacts / "index.js.map"
+    bundle.write_text("export default {};\n")
+    sourcemap.write_text('{"version":3,"sources":[],"mappings":""}\n')
+
+    index = repo / ".git" / "release" / "version-index.json"
+    out = str(base / "out")
+    deploy = ["patch", str(bundle), str(sourcemap)]
+
+    def drop_index() -> None:
+        index.unlink(missing_ok=True)
+
+    return [
+        Scenario("print-version", ["print-version"]),
+        Scenario("print-version (no index)", ["print-version"], drop_index),
+        Scenario("build", ["build", out, str(node_modules), "--no-cache"]),
+        Scenario("build (cached)", ["build", out, str(node_modules)]),
+        # NOTE: forced, or every run after the first would skip the uploads
+        Scenario("deploy staging", ["deploy", "staging", *deploy, "--force"]),
+        Scenario(
+            "deploy production",
+            ["deploy", "production", *deploy, "--force"],
+        ),
+        Scenario("deploy staging (unchanged)", ["deploy", "staging", *deploy]),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--commits", type=int, default=500)
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--age-latency", type=float, default=0.05)
+    parser.add_argument("--sentry-latency", type=float, default=0.05)
+    parser.add_argument("--wrangler-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="fractional slowdown that counts as a regression",
+    )
+    parser.add_argument("--baselines", type=Path, default=BASELINES_PATH)
+    parser.add_argument(
+        "--update-baselines",
+        action="store_true",
+        help="record this run as the new baseline",
+    )
+    parser.add_argument(
+        "--only", action="append", help="run only the named scenario(s)"
+    )
+    args = parser.parse_args()
+
+    stored: Dict[str, Any] = {"calibration": None, "scenarios": {}}
+    if args.baselines.exists():
+        stored = json.loads(args.baselines.read_text())
+    baselines: Dict[str, dict] = stored["scenarios"]
+
+    calibration = calibrate(args.repeat)
+    print(f"calibration {calibration * 1000:.1f}ms\n")
+
+    results = []
+    with bench_env(
+        age_latency=args.age_latency,
+        sentry_latency=args.sentry_latency,
+        wrangler_latency=args.wrangler_latency,
+    ) as repo:
+        # NOTE: bench_env puts the environment back afterwards
+        os.environ["RELEASE_BUILD_CACHE"] = str(repo.parent / "build-cache")
+        add_history(repo, args.commits, args.tags)
+        add_remote(repo)
+
+        # Patch releases happen on the release branch for the latest tag
+        (major, rest) = divmod(args.tags - 1, 10000)
+        git(repo, "checkout", "-q", "-b", f"release/{major}.{rest // 100}")
+
+        for scenario in scenarios(repo):
+            if args.only and scenario.name not in args.only:
+                continue
+            result = measure_scenario(scenario, args.repeat)
+            results.append(result)
+            print(report(result, baselines.get(result.name)))
+
+    if args.update_baselines:
+        # NOTE: every scenario has to be re-recorded on a new host
+        previous = stored["calibration"]
+        if previous is not None and not same_host(previous, calibration):
+            baselines.clear()
+        stored["calibration"] = calibration
+        baselines.update({r.name: r.medians() for r in results})
+        text = json.dumps(stored, indent=2, sort_keys=True)
+        args.baselines.write_text(text + "\n")
+        print(f"wrote baselines to {args.baselines}")
+        return
+
+    previous = stored["calibration"]
+    if previous is not None and not same_host(previous, calibration):
+        print(
+            f"\nbaselines were recorded on a host that ran the calibration "
+            f"in {previous * 1000:.1f}ms; re-record them here "
+            f"with --update-baselines before comparing"
+        )
+        sys.exit(2)
+
+    regressions = check(results, baselines, args.threshold)
+    if regressions:
+        print(f"\nregressions (threshold {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from typing import Callable, List
+import statistics
+import time
+
+
+@dataclass
+class Timing:
+    name: str
+    samples: List[float]
+
+    @property
+    def best(self) -> float:
+        return min(self.samples)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.samples)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<24} best {self.best * 1000:8.1f}ms  "
+            f"median {self.median * 1000:8.1f}ms  (n={len(self.samples)})"
+        )
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int = 5) -> Timing:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    return Timing(name, samples)
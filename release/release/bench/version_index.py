@@ -0,0 +1,69 @@
+"""
+Compares ways of finding the latest release version in a repository with
+many tags.
+
+    python -m release.bench.version_index [--tags N] [--other-tags N]
+"""
+
+from release.bench.fixtures import add_history, git, make_repo
+from release.bench.timing import measure
+from release.release_mgmt.git import Git
+from release.release_mgmt.version import TAG_REGEX
+from release.release_mgmt.version_index import VersionIndex
+
+from pathlib import Path
+import argparse
+import tempfile
+
+
+def legacy_last_version(root: Path) -> str:
+    # What ReleaseManager.last_version used to do
+    tags = git(root, "tag", "--sort=-committerdate", "--merged").splitlines()
+    return next(t for t in tags if TAG_REGEX.match(t))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=2000)
+    parser.add_argument("--tags", type=int, default=10000)
+    parser.add_argument("--other-tags", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pack", action="store_true", help="pack all refs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="release-bench-") as tmp:
+        root = make_repo(Path(tmp) / "repo")
+        add_history(root, args.commits, args.tags, args.other_tags)
+        if args.pack:
+            git(root, "pack-refs", "--all")
+
+        cache = Path(tmp) / "version-index.json"
+
+        def cold() -> None:
+            cache.unlink(missing_ok=True)
+            VersionIndex(Git(root), cache).latest()
+
+        def uncached() -> None:
+            VersionIndex(Git(root)).latest()
+
+        def warm() -> None:
+            VersionIndex(Git(root), cache).latest()
+
+        timings = [
+            measure(
+                "git tag + regex scan",
+                lambda: legacy_last_version(root),
+                args.repeat,
+            ),
+            measure("index (uncached)", uncached, args.repeat),
+            measure("index (cold cache)", cold, args.repeat),
+            measure("index (warm cache)", warm, args.repeat),
+        ]
+
+    print(f"{args.tags} version tags, {args.other_tags} other tags")
+    for t in timings:
+        print(t)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+from release.utils import atomic_write
+from release.wrangler import BUILD_OUTPUTS, COMPATIBILITY_DATE
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Project files outside src/ that change what gets bundled (wrangler.toml
+# is the decrypted one `wrangler build` reads)
+CONFIG_FILES = ["package.json", "yarn.lock", "tsconfig.jsonc", "wrangler.toml"]
+
+# (size, mtime_ns, inode) -> sha256, persisted between runs
+FileStat = Tuple[int, int, int]
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class HashMemo:
+    """
+    Remembers file digests by (size, mtime, inode), so unchanged files are
+    only stat()ed rather than read on every build.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._entries: Dict[str, Tuple[FileStat, str]] = {}
+        self._dirty = False
+        try:
+            raw = json.loads(path.read_text())
+            self._entries = {k: (tuple(s), d) for (k, (s, d)) in raw.items()}
+        except (OSError, ValueError):
+            pass
+
+    def digest(self, path: Path) -> str:
+        st = path.stat()
+        stat: FileStat = (st.st_size, st.st_mtime_ns, st.st_ino)
+        key = str(path)
+        entry = self._entries.get(key)
+        if entry and entry[0] == stat:
+            return entry[1]
+
+        digest = _file_digest(path)
+        self._entries[key] = (stat, digest)
+        self._dirty = True
+        return digest
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+
+        atomic_write(self._path, json.dumps(self._entries))
+        self._dirty = False
+
+
+def _node_modules_identity(node_modules: Path) -> str:
+    # Nix store paths already identify their contents. For a local install
+    # we fall back to yarn's integrity file (or the directory itself).
+    real = node_modules.resolve()
+    integrity = real / ".yarn-integrity"
+    marker = integrity if integrity.exists() else real
+    st = marker.stat()
+    return f"{real}:{st.st_mtime_ns}:{st.st_size}"
+
+
+class BuildCache:
+    """
+    Stores build outputs keyed by a hash of everything that went into them.
+    Least recently used entries are evicted past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self._dir = cache_dir
+        self._entries = cache_dir / "entries"
+        self._max_bytes = max_bytes
+        self._entries.mkdir(parents=True, exist_ok=True)
+        self._memo = HashMemo(cache_dir / "file-hashes.json")
+
+    @classmethod
+    def from_env(
+        cls, max_bytes: Optional[int] = None
+    ) -> Optional["BuildCache"]:
+        """
+        Returns None when there's nowhere writable to keep a cache (e.g.
+        inside the Nix build sandbox). Without max_bytes, the size comes from
+        RELEASE_BUILD_CACHE_SIZE, and a malformed value raises ValueError.
+        """
+        configured = os.environ.get("RELEASE_BUILD_CACHE")
+        if configured is not None:
+            cache_dir = Path(configured)
+        else:
+            xdg = os.environ.get("XDG_CACHE_HOME")
+            base = Path(xdg) if xdg else Path.home() / ".cache"
+            cache_dir = base / "release" / "build"
+
+        configured_size = os.environ.get("RELEASE_BUILD_CACHE_SIZE")
+        if max_bytes is None and configured_size is not None:
+            try:
+                max_bytes = int(configured_size)
+            except ValueError:
+                raise ValueError(
+                    "RELEASE_BUILD_CACHE_SIZE="
+                    f"{configured_size!r} is not a number of bytes"
+                )
+        try:
+            if max_bytes is None:
+                return cls(cache_dir)
+            return cls(cache_dir, max_bytes)
+        except OSError:
+            return None
+
+    def key(
+        self,
+        proj_dir: Path,
+        node_modules: Path,
+        wrangler_args: Sequence[str],
+    ) -> str:
+        h = hashlib.sha256()
+
+        def add(*parts: str) -> None:
+            h.update("\0".join(parts).encode())
+            h.update(b"\n")
+
+        add("compatibility-date", COMPATIBILITY_DATE)
+        add("wrangler-args", *wrangler_args)
+        add("node-modules", _node_modules_identity(node_modules))
+        for name in CONFIG_FILES:
+            path = proj_dir / name
+            if path.exists():
+                add("config", name, self._memo.digest(path))
+
+        src_dir = proj_dir / "src"
+        files: List[Path] = []
+        for root, dirs, names in os.walk(src_dir):
+            dirs.sort()
+            files.extend(Path(root) / n for n in sorted(names))
+        for path in files:
+            rel = str(path.relative_to(proj_dir))
+            add("src", rel, self._memo.digest(path))
+
+        self._memo.save()
+        return h.hexdigest()
+
+    def restore(self, key: str, out_dir: Path) -> bool:
+        entry = self._entries / key
+        if not entry.is_dir():
+            return False
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for name in BUILD_OUTPUTS:
+            shutil.copyfile(entry / name, out_dir / name)
+        # Eviction goes by mtime
+        os.utime(entry)
+        return True
+
+    def store(self, key: str, out_dir: Path) -> None:
+        entry = self._entries / key
+        if entry.exists():
+            return
+
+        tmp = Path(tempfile.mkdtemp(dir=self._entries, prefix=".tmp-"))
+        try:
+            for name in BUILD_OUTPUTS:
+                shutil.copyfile(out_dir / name, tmp / name)
+            tmp.rename(entry)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for entry in self._entries.iterdir():
+            if entry.name.startswith("."):
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir())
+            entries.append((entry.stat().st_mtime, size, entry))
+
+        total = sum(size for (_, size, _) in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,255 @@
+from release.environment import Environment
+from release.manifest import DeployRecord, ManifestBackend, bundle_digest
+from release.migrations import Migration, Migrator
+from release.release_mgmt.manager import ReleaseManager
+from release.release_mgmt.version import Mode
+from release.scheduler import Graph, Report, StepFn
+from release.sentry import CommitRange, SentryClient
+from release.sourcemap import (
+    Analysis,
+    SlimResult,
+    analyze_release,
+    check_budget,
+    report_path,
+    slim,
+    store_report,
+)
+from release.wrangler import Wrangler
+
+from pathlib import Path
+from typing import Any, List, Mapping, Optional, Sequence
+import threading
+import time
+
+DEFAULT_MAX_PARALLEL = 4
+# What an upload step returns when the environment already has the bundle
+UNCHANGED = "unchanged"
+
+
+def deploy_step(target: str) -> str:
+    return f"wrangler_deploy[{target}]"
+
+
+def migrate_step(target: str) -> str:
+    return f"migrate[{target}]"
+
+
+def log_path(log_dir: Path, target: str) -> Path:
+    return log_dir / f"wrangler-{target}.log"
+
+
+def deploy_graph(
+    env: Environment,
+    sentry: Optional[SentryClient],
+    wrangler: Wrangler,
+    release_mode: str,
+    bump_mode: Mode,
+    bundle_path: Path,
+    sourcemap_path: Path,
+    manager: Optional[ReleaseManager] = None,
+    targets: Sequence[str] = (),
+    max_parallel: int = DEFAULT_MAX_PARALLEL,
+    log_dir: Optional[Path] = None,
+    size_budget: Optional[int] = None,
+    slim_dir: Optional[Path] = None,
+    database: Optional[str] = None,
+    manifest: Optional[ManifestBackend] = None,
+    force: bool = False,
+) -> Graph:
+    """
+    Lays out a deploy as a graph of steps.
+
+    Staging is just the upload, and needs no sentry client. Production
+    releases go through tag -> push -> Sentry release -> sourcemaps, with
+    the upload to Cloudflare running alongside once the version has been
+    bumped. The Sentry release is given the commits since the previous
+    tag, from our own checkout.
+
+    The bundle is uploaded to every wrangler environment in `targets`
+    (just `release_mode` by default), at most `max_parallel` at a time.
+    With a log_dir, each environment's output goes to its own file there.
+
+    With a size_budget, nothing is tagged or uploaded until the bundle has
+    been checked against it, and production releases keep the size report
+    for comparing against next time.
+
+    With a slim_dir, the sourcemap is slimmed into it before uploading to
+    Sentry, dropping sourcesContent for third-party code.
+
+    With a (D1) database, pending migrations are applied to each target's
+    database before its upload, and before production tags anything.
+
+    With a manifest, targets already running this exact bundle (and
+    sourcemap) aren't uploaded to again, unless `force`d; if none need it,
+    neither do the sourcemaps. Successful uploads are recorded there.
+    """
+    targets_ = list(targets) or [release_mode]
+    digest = bundle_digest(bundle_path, sourcemap_path) if manifest else ""
+    unchanged = set()
+    if manifest and not force:
+        for target in targets_:
+            record = manifest.get(target)
+            if record and record.digest == digest:
+                unchanged.add(target)
+    slots = threading.BoundedSemaphore(max_parallel)
+    if log_dir:
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+    def upload(target: str) -> StepFn:
+        def step(results: Mapping[str, Any]) -> Optional[str]:
+            if target in unchanged:
+                return UNCHANGED
+
+            with slots:
+                if log_dir is None:
+                    wrangler.deploy(target, bundle_path)
+                else:
+                    with open(log_path(log_dir, target), "wb") as log:
+                        wrangler.deploy(target, bundle_path, log=log)
+
+            if manifest:
+                version = results.get("version_bump")
+                record = DeployRecord(digest, version, time.time())
+                manifest.put(target, record)
+            return None
+
+        return step
+
+    def migrate(target: str) -> StepFn:
+        def step(_: Mapping[str, Any]) -> List[Migration]:
+            assert database
+            directory = env.git.root() / "migrations"
+            return Migrator(wrangler, database, target, directory).migrate()
+
+        return step
+
+    def add_migrations(deps: Sequence[str]) -> None:
+        for target in targets_:
+            graph.add(migrate_step(target), migrate(target), deps)
+
+    def add_uploads(deps: Sequence[str]) -> None:
+        for target in targets_:
+            target_deps = [*deps]
+            if database:
+                target_deps.append(migrate_step(target))
+            graph.add(deploy_step(target), upload(target), target_deps)
+
+    graph = Graph()
+    gate: List[str] = []
+    if size_budget is not None:
+
+        def analyze_bundle(_) -> Analysis:
+            analysis = analyze_release(bundle_path, sourcemap_path, env.git)
+            check_budget(analysis.report, size_budget)
+            return analysis
+
+        graph.add("analyze_bundle", analyze_bundle)
+        gate.append("analyze_bundle")
+
+    if release_mode != "production":
+        if database:
+            add_migrations(gate)
+        add_uploads(gate)
+        return graph
+
+    assert sentry, "production releases need a Sentry client"
+    sentry_ = sentry
+    manager_ = manager or ReleaseManager(env.git)
+
+    def previous_tag(_) -> Optional[str]:
+        previous = manager_.last_version()
+        return f"v{previous.version_string()}" if previous else None
+
+    def version_bump(_) -> str:
+        new_version = manager_.version_bump(bump_mode)
+        return f"v{new_version.version_string()}"
+
+    def git_push(results) -> None:
+        refs = manager_.release_refs(results["version_bump"], bump_mode)
+        env.git.push(refs=refs)
+
+    def create_release(results) -> None:
+        tag = results["version_bump"]
+        commit = results["commit_hash"]
+        previous = results["previous_tag"]
+        # NOTE: listed as they're sent, not up front
+        commits = CommitRange(previous, env.git.log(previous, commit))
+        sentry_.create_release(commit=commit, tag=tag, commits=commits)
+
+    # NOTE: keeps the file name, which the bundle refers to it by
+    slimmed_path = slim_dir / sourcemap_path.name if slim_dir else None
+
+    def slim_sourcemap(_) -> SlimResult:
+        assert slimmed_path
+        return slim(sourcemap_path, slimmed_path)
+
+    def upload_sourcemaps(results) -> None:
+        tag = results["version_bump"]
+        sentry_.upload_sourcemaps(
+            tag, bundle_path, slimmed_path or sourcemap_path
+        )
+
+    graph.add("assert_clean", lambda _: env.git.assert_clean())
+    bump_deps = ["assert_clean", *gate]
+    if database:
+        add_migrations(bump_deps)
+        bump_deps += [migrate_step(t) for t in targets_]
+    graph.add("previous_tag", previous_tag, bump_deps)
+    graph.add("version_bump", version_bump, ["previous_tag"])
+    graph.add("commit_hash", lambda _: env.git.commit_hash(), ["version_bump"])
+    graph.add("git_push", git_push, ["version_bump"])
+    add_uploads(["version_bump"])
+    # NOTE: Sentry resolves the release's commit from the remote, so it has
+    # to be pushed first.
+    graph.add(
+        "create_release",
+        create_release,
+        ["version_bump", "previous_tag", "commit_hash", "git_push"],
+    )
+    # NOTE: an unchanged bundle still refers to the sourcemaps we uploaded
+    # for it last time
+    if unchanged != set(targets_):
+        upload_deps = ["version_bump", "create_release"]
+        if slimmed_path:
+            graph.add("slim_sourcemap", slim_sourcemap)
+            upload_deps.append("slim_sourcemap")
+        graph.add("upload_sourcemaps", upload_sourcemaps, upload_deps)
+    if gate:
+
+        def record_sizes(results) -> None:
+            git_dir = env.git.snapshot().git_dir
+            path = report_path(git_dir, results["version_bump"])
+            store_report(path, results["analyze_bundle"].report)
+
+        graph.add("record_sizes", record_sizes, ["version_bump", *gate])
+
+    return graph
+
+
+def target_summary(
+    report: Report, targets: Sequence[str], log_dir: Optional[Path] = None
+) -> str:
+    """
+    One line per target environment: whether its upload succeeded, and
+    where to find its output.
+    """
+    lines: List[str] = []
+    for target in targets:
+        result = report.results[deploy_step(target)]
+        if result.skipped:
+            status = "skipped"
+        elif result.error is not None:
+            status = "failed"
+        elif result.value == UNCHANGED:
+            status = UNCHANGED
+        else:
+            status = "ok"
+
+        line = f"  {target:<20} {status:<9}"
+        if not result.skipped:
+            line += f" {result.duration:7.2f}s"
+        if log_dir and status in ("ok", "failed"):
+            line += f"  {log_path(log_dir, target)}"
+        lines.append(line)
+
+    return "\n".join(lines)
@@ -0,0 +1,205 @@
+"""
+Serializes deploys on one machine, and coalesces queued deploys to the same
+environments so that only the newest of them ships.
+
+A request takes a ticket, then waits for the deploy lock. While it waits it
+watches for newer tickets with the same key; if one turns up, the request
+is superseded and gives up without deploying anything. Tickets live in a
+small JSON state file, guarded by its own (briefly held) lock.
+"""
+
+from release.tracing import TRACER
+from release.utils import atomic_write
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import contextlib
+import fcntl
+import json
+import os
+import time
+
+POLL_INTERVAL = 0.25
+
+STATE_FILE = "state.json"
+STATE_LOCK = "state.lock"
+DEPLOY_LOCK = "deploy.lock"
+
+
+def queue_dir(git_dir: Path) -> Path:
+    configured = os.environ.get("RELEASE_QUEUE_DIR")
+    if configured:
+        return Path(configured)
+    return git_dir / "release" / "queue"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@dataclass(frozen=True)
+class Ticket:
+    seq: int
+    key: str
+    pid: int
+    enqueued_at: float
+
+    @classmethod
+    def from_json(cls, raw: Dict[str, Any]) -> "Ticket":
+        return cls(raw["seq"], raw["key"], raw["pid"], raw["enqueued_at"])
+
+    def __str__(self) -> str:
+        return f"#{self.seq} ({self.key}, pid {self.pid})"
+
+
+@dataclass
+class QueueState:
+    next_seq: int
+    running: Optional[Ticket]
+    pending: List[Ticket]
+
+    @classmethod
+    def from_json(cls, raw: Dict[str, Any]) -> "QueueState":
+        running = raw.get("running")
+        return cls(
+            raw.get("next_seq", 1),
+            Ticket.from_json(running) if running else None,
+            [Ticket.from_json(t) for t in raw.get("pending", [])],
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "next_seq": self.next_seq,
+            "running": asdict(self.running) if self.running else None,
+            "pending": [asdict(t) for t in self.pending],
+        }
+
+    def prune(self) -> None:
+        # Requests that died (or were killed) without cleaning up after
+        # themselves shouldn't hold up, or supersede, anyone.
+        if self.running and not _alive(self.running.pid):
+            self.running = None
+        self.pending = [t for t in self.pending if _alive(t.pid)]
+
+    def depth(self) -> int:
+        return len(self.pending) + (1 if self.running else 0)
+
+    def newer_than(self, ticket: Ticket) -> Optional[Ticket]:
+        newer = [
+            t
+            for t in self.pending
+            if t.key == ticket.key and t.seq > ticket.seq
+        ]
+        return max(newer, key=lambda t: t.seq, default=None)
+
+    def remove(self, ticket: Ticket) -> None:
+        self.pending = [t for t in self.pending if t.seq != ticket.seq]
+
+
+class Superseded(Exception):
+    def __init__(self, ticket: Ticket, by: Ticket):
+        super().__init__(f"request {ticket} superseded by {by}")
+        self.ticket = ticket
+        self.by = by
+
+
+@dataclass(frozen=True)
+class Admission:
+    ticket: Ticket
+    # Requests queued or running ahead of us when we joined
+    ahead: int
+    waited: float
+
+    def __str__(self) -> str:
+        return (
+            f"deploy queue: request {self.ticket} waited "
+            f"{self.waited:.1f}s behind {self.ahead} request(s)"
+        )
+
+
+class DeployQueue:
+    def __init__(self, directory: Path, poll_interval: float = POLL_INTERVAL):
+        self._dir = directory
+        self._poll_interval = poll_interval
+
+    @contextlib.contextmanager
+    def _state(self) -> Iterator[QueueState]:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        with open(self._dir / STATE_LOCK, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            path = self._dir / STATE_FILE
+            try:
+                state = QueueState.from_json(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                state = QueueState(1, None, [])
+            state.prune()
+
+            yield state
+
+            atomic_write(path, json.dumps(state.to_json()))
+
+    def status(self) -> QueueState:
+        with self._state() as state:
+            return state
+
+    def enqueue(self, key: str) -> Tuple[Ticket, int]:
+        with self._state() as state:
+            ticket = Ticket(state.next_seq, key, os.getpid(), time.time())
+            ahead = state.depth()
+            state.next_seq += 1
+            state.pending.append(ticket)
+
+        return (ticket, ahead)
+
+    @contextlib.contextmanager
+    def admit(self, key: str) -> Iterator[Admission]:
+        """
+        Waits for our turn to deploy, and holds the deploy lock until the
+        block exits. Raises Superseded if a newer request for the same key
+        arrives first.
+        """
+        (ticket, ahead) = self.enqueue(key)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        with open(self._dir / DEPLOY_LOCK, "a") as lock:
+            with TRACER.span("deploy_queue", ahead=ahead) as span:
+                try:
+                    self._wait(ticket, lock)
+                except BaseException:
+                    with self._state() as state:
+                        state.remove(ticket)
+                    raise
+                waited = time.time() - ticket.enqueued_at
+                span.args["waited"] = round(waited, 3)
+
+            try:
+                yield Admission(ticket, ahead, waited)
+            finally:
+                with self._state() as state:
+                    if state.running and state.running.seq == ticket.seq:
+                        state.running = None
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _wait(self, ticket: Ticket, lock: Any) -> None:
+        while True:
+            with self._state() as state:
+                newer = state.newer_than(ticket)
+                if newer is not None:
+                    raise Superseded(ticket, newer)
+
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    state.remove(ticket)
+                    state.running = ticket
+                    return
+
+            time.sleep(self._poll_interval)
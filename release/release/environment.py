@@ -1,14 +1,31 @@
+from release.agent import AgentClient, secrets_key
 from release.release_mgmt.git import Git
 from release.secrets import Secrets
-from release.shell import source_file
-from release.utils import format_paths
+from release.tracing import TRACER
+from release.shell import source_script, source_scripts
+from release.utils import atomic_write, format_paths
+from release.wrangler import Wrangler
 
 from abc import ABC, abstractmethod
+from collections import ChainMap
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Dict, Generic, Optional, Type, TypeVar
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Collection,
+    Dict,
+    Generic,
+    List,
+    Mapping,
+    Optional,
+    Type,
+    TypeVar,
+)
 import os
-import shutil
+import threading
 
 BUMP_MODES = ["major", "minor", "patch"]
 RELEASE_MODES = ["staging", "production"]
@@ -19,72 +36,311 @@ SUPPORTED_ID_TYPES = ["rsa", "ed25519"]
 
 
 E = TypeVar("E", bound="EnvironmentCredentials")
+T = TypeVar("T")
 
+SECRETS_PATHSPEC = ":/secrets/"
 
-def decrypt_secret(git: Git, filename: str, secrets: Secrets) -> Path:
-    path_ref = f":/secrets/{filename}.age"
-    secret_path = git.ls_files([path_ref])
+# What commands can ask Environment.from_env for, named for their secrets
+CF_SECRET = "cf_authn.sh"
+SENTRY_SECRET = "sentry_authn.sh"
+WRANGLER_SECRET = "wrangler.toml"
+ALL_SECRETS = (CF_SECRET, SENTRY_SECRET, WRANGLER_SECRET)
+SCRIPT_SECRETS = (CF_SECRET, SENTRY_SECRET)
+
+
+def find_secret(git: Git, filename: str) -> Path:
+    # NOTE: all secrets come from one (memoized) listing of secrets/
+    expected = Path("secrets") / f"{filename}.age"
+    secret_path = [
+        p for p in git.ls_files([SECRETS_PATHSPEC]) if p == expected
+    ]
     n_found = len(secret_path)
     if n_found != 1:
         found = format_paths(secret_path)
         msg = f"should find exactly one secret for {filename}, found:\n{found}"
         raise AssertionError(msg)
-    return secrets.decrypt(secret_path[0])
+    return secret_path[0]
+
+
+def decrypt_secret(git: Git, filename: str, secrets: Secrets) -> bytes:
+    return secrets.decrypt(find_secret(git, filename))
+
+
+def _secret_result(filename: str, future: "Future[T]") -> T:
+    try:
+        return future.result()
+    except Exception as e:
+        e.add_note(f"while loading secret {filename}")
+        raise
+
+
+def _write_if_changed(dest: Path, data: bytes) -> None:
+    # Rewriting an identical file would only bump its mtime for wrangler
+    try:
+        if dest.read_bytes() == data:
+            return
+    except FileNotFoundError:
+        pass
+
+    # NOTE: no more readable than Secrets.decrypt_to leaves it
+    atomic_write(dest, data, mode=0o600)
 
 
 class EnvironmentCredentials(ABC, Generic[E]):
+    # The secrets/ script that sets our variables
+    SECRET: ClassVar[str]
+
     @classmethod
     def from_secret_file(cls: Type[E], git: Git, fname: str, s: Secrets) -> E:
-        temp_file = decrypt_secret(git, fname, s)
-        new_env = source_file(temp_file)
-        total_env = {**os.environ, **new_env}
-        return cls.from_env(total_env)
+        script = decrypt_secret(git, fname, s)
+        return cls.from_sourced(source_script(script))
+
+    @classmethod
+    def from_sourced(cls: Type[E], new_env: Mapping[str, str]) -> E:
+        # Layered over (rather than copied onto) the parent environment
+        return cls.from_env(ChainMap(dict(new_env), os.environ))
 
     @classmethod
     @abstractmethod
-    def from_env(cls: Type[E], env: Dict[str, str]) -> E:
+    def from_env(cls: Type[E], env: Mapping[str, str]) -> E:
         ...
 
+    @abstractmethod
+    def secrets(self) -> List[str]:
+        """
+        Values to keep out of traces.
+        """
+
 
 class CFCredentials(EnvironmentCredentials["CFCredentials"]):
+    SECRET = CF_SECRET
+
     def __init__(self, token: str, account_id: str):
         self.token = token
         self.account_id = account_id
 
     @classmethod
     def from_env(
-        cls: Type["CFCredentials"], env: Dict[str, str]
+        cls: Type["CFCredentials"], env: Mapping[str, str]
     ) -> "CFCredentials":
         return cls(
             token=env["CLOUDFLARE_API_TOKEN"],
             account_id=env["CLOUDFLARE_ACCOUNT_ID"],
         )
 
+    def secrets(self) -> List[str]:
+        return [self.token]
+
 
 class SentryCredentials(EnvironmentCredentials["SentryCredentials"]):
+    SECRET = SENTRY_SECRET
+
     def __init__(self, project_id: str, token: str, org: str):
         self.project_id = project_id
         self.token = token
         self.org = org
 
     @classmethod
-    def from_env(cls, env: Dict[str, str]) -> "SentryCredentials":
+    def from_env(cls, env: Mapping[str, str]) -> "SentryCredentials":
         return cls(
             project_id=env["SENTRY_PROJECT"],
             token=env["SENTRY_AUTH_TOKEN"],
             org=env["SENTRY_ORG"],
         )
 
+    def secrets(self) -> List[str]:
+        return [self.token]
+
+
+def _agent_call(fn: Callable[[], T]) -> Optional[T]:
+    # A wedged or dying agent shouldn't stop us decrypting things ourselves
+    try:
+        return fn()
+    except (OSError, ValueError):
+        return None
+
+
+class SecretStore:
+    """
+    Decrypts each secret at most once, the first time anything asks for it
+    (or when prefetched). Scripts resolve to the variables they set, and
+    wrangler.toml to the path it was decrypted to.
+    """
+
+    def __init__(self, git: Git, secrets: Secrets, concurrent: bool = True):
+        self._git = git
+        self._secrets = secrets
+        self._concurrent = concurrent
+        # NOTE: the agent is opt-in; without one running, this costs a stat
+        self._agent = AgentClient.connect()
+        self._lock = threading.Lock()
+        self._loaded: Dict[str, "Future[Any]"] = {}
+        self._credentials: Dict[type, Any] = {}
+
+    def check(self, names: Collection[str]) -> None:
+        """
+        Fails if any of the secrets are missing, without decrypting them.
+        """
+        for name in names:
+            try:
+                find_secret(self._git, name)
+            except AssertionError as e:
+                e.add_note(f"while checking secret {name}")
+                raise
+
+    def get(self, name: str) -> Any:
+        self.load([name])
+        return _secret_result(name, self._loaded[name])
+
+    def credentials(self, cls: Type[E]) -> E:
+        with self._lock:
+            if cls in self._credentials:
+                return self._credentials[cls]
+
+        creds = cls.from_sourced(self.get(cls.SECRET))
+        for secret in creds.secrets():
+            TRACER.add_secret(secret)
+        with self._lock:
+            return self._credentials.setdefault(cls, creds)
+
+    def prefetch(self, names: Collection[str]) -> None:
+        """
+        Starts loading the secrets in the background.
+        """
+        thread = threading.Thread(target=self.load, args=(names,))
+        thread.daemon = True
+        thread.start()
+
+    def load(self, names: Collection[str]) -> None:
+        """
+        Loads whichever of the secrets nobody has started loading yet.
+        """
+        with self._lock:
+            claimed = {
+                name: self._loaded.setdefault(name, Future())
+                for name in names
+                if name not in self._loaded
+            }
+        if not claimed:
+            return
+
+        try:
+            with TRACER.span("load_secrets", names=sorted(claimed)):
+                self._fill(claimed)
+        finally:
+            for future in claimed.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("secret not loaded"))
+
+    def _agent_key(self, name: str) -> str:
+        path = find_secret(self._git, name)
+        identities = self._secrets.identities
+        return secrets_key(self._git.root(), [path], identities)
+
+    def _scope(self, name: str) -> str:
+        return f"{self._git.root()}:{name}"
+
+    def _from_agent(self, name: str) -> Any:
+        if self._agent is None:
+            return None
+
+        agent = self._agent
+        with TRACER.span("agent_lookup", secret=name):
+            key = self._agent_key(name)
+            cached = _agent_call(lambda: agent.get(self._scope(name), key))
+        if cached is None or name in SCRIPT_SECRETS:
+            return cached
+
+        dest = self._git.root() / WRANGLER_SECRET
+        _write_if_changed(dest, cached.encode())
+        return dest
+
+    def _to_agent(self, name: str, value: Any) -> None:
+        if self._agent is None:
+            return
+
+        agent = self._agent
+        key = self._agent_key(name)
+        _agent_call(lambda: agent.put(self._scope(name), key, value))
+
+    def _decrypt(self, name: str) -> Any:
+        if name in SCRIPT_SECRETS:
+            return decrypt_secret(self._git, name, self._secrets)
+
+        # NOTE: Even though we can provide a path to wrangler.toml, wrangler
+        # still expects resources to be located relative to that directory.
+        dest = self._git.root() / WRANGLER_SECRET
+        self._secrets.decrypt_to(find_secret(self._git, name), dest)
+        return dest
+
+    def _fill(self, claimed: Dict[str, "Future[Any]"]) -> None:
+        todo = []
+        for (name, future) in claimed.items():
+            cached = self._from_agent(name)
+            if cached is None:
+                todo.append(name)
+            else:
+                future.set_result(cached)
+        if not todo:
+            return
+
+        # Each secret is an independent ls-files -> age pipeline, so we run
+        # them side-by-side and only wait on the slowest one.
+        workers = len(todo) if self._concurrent else 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {name: pool.submit(self._decrypt, name) for name in todo}
+
+        scripts: Dict[str, bytes] = {}
+        for (name, future) in futures.items():
+            if future.exception() is not None:
+                claimed[name].set_exception(future.exception())
+            elif name in SCRIPT_SECRETS:
+                scripts[name] = future.result()
+            else:
+                claimed[name].set_result(future.result())
+                self._to_agent(name, future.result().read_text())
+        if not scripts:
+            return
+
+        # NOTE: any scripts that need a real shell share one bash process
+        try:
+            envs = source_scripts(scripts)
+        except Exception as e:
+            for name in scripts:
+                claimed[name].set_exception(e)
+            return
+
+        for (name, env) in envs.items():
+            claimed[name].set_result(env)
+            self._to_agent(name, env)
+
 
 @dataclass
 class Environment:
-    cf: CFCredentials
-    sentry: SentryCredentials
-
     git: Git
+    store: SecretStore
+
+    @property
+    def cf(self) -> CFCredentials:
+        return self.store.credentials(CFCredentials)
+
+    @property
+    def sentry(self) -> SentryCredentials:
+        return self.store.credentials(SentryCredentials)
 
-    wrangler_bin: Path
-    wrangler_toml_path: Path
+    @property
+    def wrangler_bin(self) -> Path:
+        return Path(self.get_environ("WRANGLER_BIN"))
+
+    @property
+    def wrangler_toml_path(self) -> Path:
+        return self.store.get(WRANGLER_SECRET)
+
+    def wrangler(self) -> Wrangler:
+        # NOTE: wrangler reads wrangler.toml from the checkout, so it has to
+        # be decrypted before we hand out anything that runs it
+        self.store.get(WRANGLER_SECRET)
+        return Wrangler(self.git.root(), self.wrangler_bin)
 
     @staticmethod
     def get_environ(
@@ -101,33 +357,27 @@ class Environment:
         return val.strip()
 
     @classmethod
-    def setup_wrangler(
-        cls, git: Git, dest_toml: Path, secrets: Optional[Secrets] = None
-    ):
-        # NOTE: Even though we can provide a path to wrangler.toml, wrangler
-        # still expects resources to be located relative to that directory.
-        s = secrets or Secrets.from_env()
-        wrangler_bin = Path(cls.get_environ("WRANGLER_BIN"))
-        wrangler_toml_tmp = decrypt_secret(git, "wrangler.toml", s)
-        shutil.move(wrangler_toml_tmp, dest_toml)
-
-        return wrangler_bin
-
-    @classmethod
-    def from_env(cls) -> "Environment":
-        s = Secrets.from_env()
-        git = Git.from_local_dir()
-
-        cf = CFCredentials.from_secret_file(git, "cf_authn.sh", s)
-        sentry = SentryCredentials.from_secret_file(git, "sentry_authn.sh", s)
+    def from_env(
+        cls,
+        needs: Collection[str] = ALL_SECRETS,
+        concurrent: bool = True,
+    ) -> "Environment":
+        """
+        Checks that everything in `needs` is there, without decrypting
+        anything yet. Secrets are decrypted the first time they're used;
+        with `concurrent`, the ones we need start decrypting in the
+        background straight away.
+        """
+        with TRACER.span("load_environment"):
+            s = Secrets.from_env()
+            git = Git.from_local_dir()
+            git.prefetch(ls_files=[SECRETS_PATHSPEC])
+            if WRANGLER_SECRET in needs:
+                cls.get_environ("WRANGLER_BIN")
 
-        wrangler_toml = git.root() / "wrangler.toml"
-        wrangler_bin = cls.setup_wrangler(git, wrangler_toml, s)
+            store = SecretStore(git, s, concurrent)
+            store.check(needs)
 
-        return cls(
-            cf,
-            sentry,
-            git,
-            wrangler_bin,
-            wrangler_toml,
-        )
+        if concurrent:
+            store.prefetch(needs)
+        return cls(git, store)
@@ -0,0 +1,302 @@
+"""
+Runs the release's network-bound subprocesses (pushes, Sentry calls,
+Cloudflare uploads) with timeouts, retries and hedging, so one stalled
+connection can't hang a deploy.
+
+Each call names the step it belongs to, which picks its Policy. Retries
+back off exponentially with full jitter. A hedged step starts a second,
+concurrent attempt when the first is slower than usual (the step's p95 in
+the deploy history), and keeps whichever finishes first.
+
+Only idempotent calls are retried or hedged. Others may still be retried
+if the caller says how to tell they already happened.
+"""
+
+from release.tracing import Span, process_span, record_result
+
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+PathEl = Union[str, Path]
+
+RETRYABLE = (subprocess.TimeoutExpired, subprocess.CalledProcessError)
+
+Outcome = Union[subprocess.CompletedProcess, BaseException]
+
+
+@dataclass(frozen=True)
+class Policy:
+    # Per attempt, in seconds
+    timeout: Optional[float] = None
+    attempts: int = 1
+    # Retry n waits up to backoff * 2^(n-1) seconds, capped at max_backoff
+    backoff: float = 1.0
+    max_backoff: float = 30.0
+    # Start a second attempt once the first has run this long
+    hedge_after: Optional[float] = None
+
+    def delay(self, retry: int) -> float:
+        cap = min(self.max_backoff, self.backoff * 2 ** (retry - 1))
+        return random.uniform(0, cap)
+
+
+# Keyed by step; "wrangler_deploy[staging]" falls back to "wrangler_deploy"
+DEFAULT_POLICIES: Dict[str, Policy] = {
+    "git_ls_remote": Policy(timeout=30, attempts=3),
+    "git_push": Policy(timeout=120, attempts=3),
+    "git_tag": Policy(timeout=30),
+    "create_release": Policy(timeout=60, attempts=3),
+    "upload_sourcemaps": Policy(timeout=300, attempts=3),
+    "wrangler_deploy": Policy(timeout=300, attempts=3),
+}
+
+_policies: Dict[str, Policy] = dict(DEFAULT_POLICIES)
+_policies_lock = threading.Lock()
+
+
+def configure(policies: Mapping[str, Policy]) -> None:
+    with _policies_lock:
+        _policies.update(policies)
+
+
+def reset() -> None:
+    with _policies_lock:
+        _policies.clear()
+        _policies.update(DEFAULT_POLICIES)
+
+
+def policy_for(step: str) -> Policy:
+    with _policies_lock:
+        if step in _policies:
+            return _policies[step]
+        return _policies.get(step.split("[", 1)[0], Policy())
+
+
+def update_policy(step: str, **changes: Any) -> None:
+    """
+    Changes some of a step's settings, keeping the rest.
+    """
+    policy = policy_for(step)
+    configure({step: replace(policy, **changes)})
+
+
+class _Attempt:
+    """
+    One run of the command, which (unlike subprocess.run) another thread can
+    cancel.
+    """
+
+    def __init__(self, argv: Sequence[PathEl], kwargs: Dict[str, Any]):
+        self._argv = argv
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._cancelled = False
+
+    def run(
+        self, timeout: Optional[float], span: Span
+    ) -> subprocess.CompletedProcess:
+        kwargs = dict(self._kwargs)
+        input_ = kwargs.pop("input", None)
+        if input_ is not None:
+            kwargs["stdin"] = subprocess.PIPE
+
+        with self._lock:
+            if self._cancelled:
+                raise subprocess.TimeoutExpired(self._argv, 0)
+            self._proc = subprocess.Popen(self._argv, **kwargs)
+
+        # NOTE: a watchdog rather than communicate(timeout=...), which polls
+        # for the exit and costs up to 50ms per call
+        expired = threading.Event()
+
+        def expire() -> None:
+            expired.set()
+            self.cancel()
+
+        timer = threading.Timer(timeout, expire) if timeout else None
+        with self._proc as proc:
+            if timer:
+                timer.daemon = True
+                timer.start()
+            try:
+                (stdout, stderr) = proc.communicate(input_)
+            except BaseException:
+                proc.kill()
+                proc.wait()
+                raise
+            finally:
+                if timer:
+                    timer.cancel()
+
+        if expired.is_set():
+            span.args["timed_out"] = True
+            raise subprocess.TimeoutExpired(self._argv, timeout or 0)
+
+        res = subprocess.CompletedProcess(
+            self._argv, proc.returncode, stdout, stderr
+        )
+        record_result(span, res)
+        return res
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            if self._proc is not None and self._proc.poll() is None:
+                self._proc.kill()
+
+
+def _run_once(
+    argv: Sequence[PathEl],
+    policy: Policy,
+    check: bool,
+    secrets: Sequence[str],
+    kwargs: Dict[str, Any],
+    **span_args: Any,
+) -> subprocess.CompletedProcess:
+    attempt = _Attempt(argv, kwargs)
+    with process_span(argv, secrets, **span_args) as span:
+        res = attempt.run(policy.timeout, span)
+    if check:
+        res.check_returncode()
+    return res
+
+
+def _private_output(
+    kwargs: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, IO[bytes]]]:
+    """
+    Swaps any file given for stdout or stderr for a temporary one, so that
+    concurrent attempts don't interleave their output.
+    """
+    kwargs = dict(kwargs)
+    files: Dict[str, IO[bytes]] = {}
+    for stream in ("stdout", "stderr"):
+        # NOTE: not PIPE, DEVNULL or STDOUT, which are ints
+        if hasattr(kwargs.get(stream), "fileno"):
+            files[stream] = kwargs[stream] = tempfile.TemporaryFile()
+    return (kwargs, files)
+
+
+def _run_hedged(
+    argv: Sequence[PathEl],
+    policy: Policy,
+    check: bool,
+    secrets: Sequence[str],
+    kwargs: Dict[str, Any],
+    **span_args: Any,
+) -> subprocess.CompletedProcess:
+    assert policy.hedge_after is not None
+    done = threading.Condition()
+    attempts: List[Tuple[_Attempt, Dict[str, IO[bytes]]]] = []
+    # By attempt, in the order they finished
+    outcomes: List[Tuple[int, Outcome]] = []
+
+    def start(hedge: bool) -> None:
+        (attempt_kwargs, files) = _private_output(kwargs)
+        attempt = _Attempt(argv, attempt_kwargs)
+        n = len(attempts)
+        attempts.append((attempt, files))
+
+        def target() -> None:
+            outcome: Outcome
+            try:
+                with process_span(
+                    argv, secrets, hedge=hedge, **span_args
+                ) as span:
+                    outcome = attempt.run(policy.timeout, span)
+                if check:
+                    outcome.check_returncode()
+            except BaseException as e:
+                outcome = e
+            with done:
+                outcomes.append((n, outcome))
+                done.notify()
+
+        threading.Thread(target=target, daemon=True).start()
+
+    def winner() -> Optional[Tuple[int, Outcome]]:
+        done_ = (o for o in outcomes if not isinstance(o[1], BaseException))
+        return next(done_, None)
+
+    start(hedge=False)
+    with done:
+        if not done.wait_for(lambda: outcomes, timeout=policy.hedge_after):
+            start(hedge=True)
+        # NOTE: if one attempt fails, the other still gets to finish
+        done.wait_for(
+            lambda: winner() is not None or len(outcomes) == len(attempts)
+        )
+        (n, outcome) = winner() or outcomes[0]
+
+    for (attempt, _) in attempts:
+        attempt.cancel()
+
+    # Only the attempt we went with gets to write to the caller's files
+    for (i, (_, files)) in enumerate(attempts):
+        for (stream, f) in files.items():
+            if i == n:
+                f.seek(0)
+                shutil.copyfileobj(f, kwargs[stream])
+                kwargs[stream].flush()
+            f.close()
+
+    if isinstance(outcome, BaseException):
+        raise outcome
+    return outcome
+
+
+def run(
+    step: str,
+    argv: Sequence[PathEl],
+    check: bool = True,
+    idempotent: bool = True,
+    already_done: Optional[Callable[[], bool]] = None,
+    secrets: Sequence[str] = (),
+    **kwargs: Any,
+) -> subprocess.CompletedProcess:
+    """
+    subprocess.run under the step's policy, recorded as a span per attempt.
+
+    A call that isn't idempotent is never hedged, and only retried if
+    `already_done` can tell us (before each retry) whether the earlier
+    attempt took effect anyway, in which case we stop there.
+    """
+    policy = policy_for(step)
+    retryable = idempotent or already_done is not None
+    attempts = policy.attempts if retryable else 1
+    hedged = idempotent and policy.hedge_after is not None
+    run_attempt = _run_hedged if hedged else _run_once
+
+    for n in range(1, attempts + 1):
+        if n > 1 and already_done is not None and already_done():
+            return subprocess.CompletedProcess(argv, 0)
+        try:
+            return run_attempt(
+                argv, policy, check, secrets, kwargs, step=step, attempt=n
+            )
+        except RETRYABLE as e:
+            if n == attempts:
+                e.add_note(f"{step}: gave up after {n} attempt(s)")
+                raise
+            time.sleep(policy.delay(n))
+
+    raise AssertionError("unreachable")
@@ -0,0 +1,268 @@
+"""
+Keeps a local history of how long each phase of each build and deploy took,
+so slow creep shows up in `release stats` rather than in someone's patience.
+
+Timings come from the tracer's spans: one row per distinct phase (or
+subprocess) per run, plus a row for the command as a whole.
+"""
+
+from release.tracing import Span
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import os
+import sqlite3
+import time
+
+DEFAULT_WINDOW_DAYS = 30
+# How many of the latest runs of a phase count as "recent"
+DEFAULT_RECENT = 5
+DEFAULT_THRESHOLD = 0.2
+# Ignore regressions smaller than this, however large relatively
+MIN_DELTA = 0.05
+# Fewer runs than this say little about a phase's tail
+MIN_SAMPLES = 10
+
+TOTAL = "total"
+OK = "ok"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS phase_timings (
+    recorded_at REAL    NOT NULL,
+    command     TEXT    NOT NULL,
+    environment TEXT    NOT NULL,
+    version     TEXT,
+    category    TEXT    NOT NULL,
+    phase       TEXT    NOT NULL,
+    duration    REAL    NOT NULL,
+    outcome     TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phase_timings_by_phase
+    ON phase_timings (command, environment, phase, recorded_at);
+"""
+
+
+def history_path(git_dir: Path) -> Path:
+    configured = os.environ.get("RELEASE_HISTORY_DB")
+    if configured:
+        return Path(configured)
+    return git_dir / "release" / "history.sqlite3"
+
+
+@dataclass(frozen=True)
+class PhaseRecord:
+    category: str
+    phase: str
+    duration: float
+    outcome: str
+
+
+def attempt_phase(step: str) -> str:
+    return f"{step}/attempt"
+
+
+def _attempt_outcome(span: Span) -> str:
+    if "error" in span.args:
+        return span.args["error"]
+    # e.g. killed, having lost a hedge
+    code = span.args.get("exit_code", 0)
+    return OK if code == 0 else f"exit {code}"
+
+
+def phase_records(spans: Iterable[Span], total: float) -> List[PhaseRecord]:
+    """
+    Sums spans by name (a phase can run more than once, e.g. one git
+    command per ref), failing the phase if any of them failed.
+
+    Each attempt at a network step (see execution) is also kept as its own
+    row, since hedging goes by how long one attempt takes.
+    """
+    spans = list(spans)
+    durations: Dict[Tuple[str, str], float] = {}
+    outcomes: Dict[Tuple[str, str], str] = {}
+    for s in spans:
+        key = (s.category, s.name)
+        durations[key] = durations.get(key, 0.0) + s.duration
+        if "error" in s.args:
+            outcomes[key] = s.args["error"]
+
+    records = [
+        PhaseRecord(key[0], key[1], duration, outcomes.get(key, OK))
+        for (key, duration) in durations.items()
+    ]
+    failed = next((r.outcome for r in records if r.outcome != OK), OK)
+    records.append(PhaseRecord("command", TOTAL, total, failed))
+    for s in spans:
+        if "step" in s.args and "attempt" in s.args:
+            phase = attempt_phase(s.args["step"])
+            outcome = _attempt_outcome(s)
+            records.append(PhaseRecord("attempt", phase, s.duration, outcome))
+    return records
+
+
+def percentile(ordered: Sequence[float], p: float) -> float:
+    # Nearest-rank, which never invents a duration we didn't see
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+@dataclass(frozen=True)
+class PhaseStats:
+    environment: str
+    phase: str
+    count: int
+    p50: float
+    p95: float
+    p99: float
+    # Median of the most recent runs, and of the runs before them
+    recent: float
+    baseline: Optional[float]
+
+    def regressed(self, threshold: float = DEFAULT_THRESHOLD) -> bool:
+        if self.baseline is None:
+            return False
+        delta = self.recent - self.baseline
+        return delta > MIN_DELTA and delta > self.baseline * threshold
+
+
+class History:
+    def __init__(self, path: Path):
+        self._path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        # NOTE: concurrent deploys wait for each other's (tiny) writes
+        conn = sqlite3.connect(self._path, timeout=10)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def record(
+        self,
+        command: str,
+        environment: str,
+        version: Optional[str],
+        records: Sequence[PhaseRecord],
+        recorded_at: Optional[float] = None,
+    ) -> None:
+        now = time.time() if recorded_at is None else recorded_at
+        rows = [
+            (
+                now,
+                command,
+                environment,
+                version,
+                r.category,
+                r.phase,
+                r.duration,
+                r.outcome,
+            )
+            for r in records
+        ]
+        if not rows:
+            return
+
+        conn = self._connect()
+        try:
+            with conn:
+                placeholders = ", ".join("?" * len(rows[0]))
+                conn.executemany(
+                    f"INSERT INTO phase_timings VALUES ({placeholders})", rows
+                )
+        finally:
+            conn.close()
+
+    def percentile(
+        self,
+        phase: str,
+        p: float,
+        window_days: float = DEFAULT_WINDOW_DAYS,
+        min_samples: int = MIN_SAMPLES,
+        now: Optional[float] = None,
+    ) -> Optional[float]:
+        """
+        The phase's p-th percentile duration over successful runs, or None
+        if it hasn't run often enough to say.
+        """
+        since = (time.time() if now is None else now) - window_days * 86400
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT duration FROM phase_timings "
+                "WHERE phase = ? AND outcome = ? AND recorded_at >= ?",
+                (phase, OK, since),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        if len(rows) < min_samples:
+            return None
+        return percentile(sorted(d for (d,) in rows), p)
+
+    def stats(
+        self,
+        command: str,
+        window_days: float = DEFAULT_WINDOW_DAYS,
+        recent: int = DEFAULT_RECENT,
+        now: Optional[float] = None,
+    ) -> List[PhaseStats]:
+        """
+        Percentiles of each phase's successful runs within the window, with
+        its latest `recent` runs compared against the ones before them.
+        """
+        since = (time.time() if now is None else now) - window_days * 86400
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT environment, phase, duration FROM phase_timings "
+                "WHERE command = ? AND outcome = ? AND recorded_at >= ? "
+                "ORDER BY recorded_at",
+                (command, OK, since),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        runs: Dict[Tuple[str, str], List[float]] = {}
+        for (environment, phase, duration) in rows:
+            runs.setdefault((environment, phase), []).append(duration)
+
+        stats = []
+        for ((environment, phase), durations) in sorted(runs.items()):
+            ordered = sorted(durations)
+            latest = durations[-recent:]
+            earlier = sorted(durations[:-recent])
+            stats.append(
+                PhaseStats(
+                    environment,
+                    phase,
+                    len(durations),
+                    percentile(ordered, 50),
+                    percentile(ordered, 95),
+                    percentile(ordered, 99),
+                    percentile(sorted(latest), 50),
+                    percentile(earlier, 50) if earlier else None,
+                )
+            )
+
+        return stats
+
+
+def stats_table(
+    stats: Sequence[PhaseStats], threshold: float = DEFAULT_THRESHOLD
+) -> str:
+    lines = [
+        f"{'environment':<12}{'phase':<32}{'runs':>6}"
+        f"{'p50':>10}{'p95':>10}{'p99':>10}"
+    ]
+    for s in stats:
+        line = (
+            f"{s.environment[:11]:<12}{s.phase[:31]:<32}{s.count:>6}"
+            f"{s.p50:>9.3f}s{s.p95:>9.3f}s{s.p99:>9.3f}s"
+        )
+        if s.regressed(threshold):
+            assert s.baseline is not None
+            line += f"  SLOWER: {s.recent:.3f}s vs {s.baseline:.3f}s"
+        lines.append(line)
+
+    return "\n".join(lines)
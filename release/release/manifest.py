@@ -0,0 +1,92 @@
+"""
+Remembers what was last deployed to each environment, so deploying the
+same bundle again can skip the uploads.
+
+Records are keyed by environment and hold a digest of the bundle and its
+sourcemap. Where they're kept is up to the ManifestBackend; LocalManifest
+keeps them in a JSON file, and stands in for shared storage until we
+have some.
+"""
+
+from release.utils import atomic_write
+
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_FORMAT = 1
+
+
+def manifest_path(git_dir: Path) -> Path:
+    configured = os.environ.get("RELEASE_MANIFEST")
+    if configured:
+        return Path(configured)
+    return git_dir / "release" / "deploys.json"
+
+
+def bundle_digest(bundle: Path, sourcemap: Path) -> str:
+    h = hashlib.sha256()
+    for path in (bundle, sourcemap):
+        # Length-prefixed, so bytes can't move between the two files
+        h.update(f"{path.stat().st_size}:".encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+@dataclass(frozen=True)
+class DeployRecord:
+    digest: str
+    version: Optional[str]
+    deployed_at: float
+
+
+class ManifestBackend(ABC):
+    @abstractmethod
+    def get(self, environment: str) -> Optional[DeployRecord]:
+        ...
+
+    @abstractmethod
+    def put(self, environment: str, record: DeployRecord) -> None:
+        ...
+
+
+class LocalManifest(ManifestBackend):
+    def __init__(self, path: Path):
+        self._path = path
+        # NOTE: targets deploy in parallel, and all record to one file
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, DeployRecord]:
+        try:
+            raw = json.loads(self._path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if raw.get("format") != MANIFEST_FORMAT:
+            return {}
+        return {
+            env: DeployRecord(**record)
+            for (env, record) in raw["environments"].items()
+        }
+
+    def get(self, environment: str) -> Optional[DeployRecord]:
+        return self._read().get(environment)
+
+    def put(self, environment: str, record: DeployRecord) -> None:
+        with self._lock:
+            records = self._read()
+            records[environment] = record
+            data = {
+                "format": MANIFEST_FORMAT,
+                "environments": {e: asdict(r) for (e, r) in records.items()},
+            }
+
+            path = self._path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(path, json.dumps(data, indent=1))
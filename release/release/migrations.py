@@ -0,0 +1,194 @@
+"""
+Applies the SQL migrations in migrations/ to a D1 database via wrangler.
+
+Applied migrations are recorded in a table of our own, alongside a checksum
+of their contents, so edits to a migration that already ran are caught
+rather than silently diverging from the real schema.
+"""
+
+from release.wrangler import Wrangler
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence
+import hashlib
+import re
+import sqlite3
+import tempfile
+
+TRACKING_TABLE = "release_migrations"
+MIGRATION_REGEX = re.compile(r"^\d{4}_[\w-]+\.sql$")
+
+CREATE_TRACKING_TABLE = f"""CREATE TABLE IF NOT EXISTS {TRACKING_TABLE} (
+    name        TEXT    PRIMARY KEY,
+    checksum    TEXT    NOT NULL,
+    applied_at  INTEGER NOT NULL
+);"""
+LIST_APPLIED = f"SELECT name, checksum FROM {TRACKING_TABLE} ORDER BY name;"
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    name: str
+    sql: str
+    checksum: str
+
+    @classmethod
+    def from_file(cls, path: Path) -> "Migration":
+        data = path.read_bytes()
+        return cls(path.name, data.decode(), hashlib.sha256(data).hexdigest())
+
+
+def load_migrations(directory: Path) -> List[Migration]:
+    paths = (p for p in directory.iterdir() if MIGRATION_REGEX.match(p.name))
+    return [Migration.from_file(p) for p in sorted(paths)]
+
+
+def pending(
+    migrations: Sequence[Migration], applied: Mapping[str, str]
+) -> List[Migration]:
+    """
+    The migrations still to apply, after checking the applied ones against
+    what we have locally.
+    """
+    local = {m.name for m in migrations}
+    missing = sorted(name for name in applied if name not in local)
+    if missing:
+        raise MigrationError(f"applied migrations not found: {missing}")
+
+    changed = [
+        m.name
+        for m in migrations
+        if m.name in applied and applied[m.name] != m.checksum
+    ]
+    if changed:
+        raise MigrationError(f"applied migrations were modified: {changed}")
+
+    todo = [m for m in migrations if m.name not in applied]
+    if todo and applied and todo[0].name < max(applied):
+        raise MigrationError(
+            f"{todo[0].name} sorts before already-applied {max(applied)}"
+        )
+    return todo
+
+
+def record_sql(migration: Migration) -> str:
+    return (
+        f"INSERT INTO {TRACKING_TABLE} (name, checksum, applied_at) "
+        f"VALUES ('{migration.name}', '{migration.checksum}', "
+        "CAST(strftime('%s', 'now') AS INTEGER));"
+    )
+
+
+def batch_sql(batch: Sequence[Migration], run: bool = True) -> str:
+    """
+    One script applying (or with run=False, only recording) the batch. Each
+    migration is recorded in the same script that applies it, so the two
+    can't disagree.
+    """
+    parts = [CREATE_TRACKING_TABLE]
+    for migration in batch:
+        if run:
+            parts.append(f"-- {migration.name}\n{migration.sql.strip()}")
+        parts.append(record_sql(migration))
+
+    return "\n\n".join(parts) + "\n"
+
+
+def batches(
+    migrations: Sequence[Migration], size: Optional[int]
+) -> Iterator[List[Migration]]:
+    step = size or max(len(migrations), 1)
+    for i in range(0, len(migrations), step):
+        yield list(migrations[i : i + step])
+
+
+def dry_run(
+    existing: Sequence[Migration],
+    scripts: Sequence[str],
+) -> None:
+    """
+    Rebuilds the schema from the existing migrations in an in-memory
+    SQLite database (which is what D1 runs), then runs the scripts we're
+    about to send against it.
+    """
+    conn = sqlite3.connect(":memory:")
+    try:
+        for migration in existing:
+            try:
+                conn.executescript(migration.sql)
+            except sqlite3.Error as e:
+                e.add_note(f"while replaying {migration.name}")
+                raise
+        for script in scripts:
+            conn.executescript(script)
+    except sqlite3.Error as e:
+        raise MigrationError(f"dry run failed: {e}") from e
+    finally:
+        conn.close()
+
+
+class Migrator:
+    def __init__(
+        self,
+        wrangler: Wrangler,
+        database: str,
+        env: str,
+        directory: Path,
+        remote: bool = True,
+    ):
+        self._wrangler = wrangler
+        self._database = database
+        self._env = env
+        self._directory = directory
+        self._remote = remote
+
+    def _execute(self, **kwargs) -> list:
+        return self._wrangler.d1_execute(
+            self._database, self._env, remote=self._remote, **kwargs
+        )
+
+    def applied(self) -> Dict[str, str]:
+        command = f"{CREATE_TRACKING_TABLE} {LIST_APPLIED}"
+        results = self._execute(command=command)
+        rows = results[-1]["results"]
+        return {row["name"]: row["checksum"] for row in rows}
+
+    def migrate(
+        self,
+        batch_size: Optional[int] = None,
+        dry_run_only: bool = False,
+        baseline: Optional[str] = None,
+    ) -> List[Migration]:
+        """
+        Applies pending migrations, batch_size at a time (all at once by
+        default), after a successful dry run. Returns what was applied.
+
+        Migrations up to and including `baseline` are recorded as applied
+        without running them, for databases migrated before we tracked it.
+        """
+        migrations = load_migrations(self._directory)
+        applied = self.applied()
+        todo = pending(migrations, applied)
+
+        skip = [m for m in todo if baseline and m.name <= baseline]
+        run = todo[len(skip) :]
+        scripts = [batch_sql(skip, run=False)] if skip else []
+        scripts.extend(batch_sql(b) for b in batches(run, batch_size))
+
+        existing = [m for m in migrations if m.name in applied] + skip
+        dry_run(existing, scripts)
+        if dry_run_only:
+            return run
+
+        with tempfile.TemporaryDirectory(prefix="release-migrate-") as tmp:
+            for (i, script) in enumerate(scripts):
+                path = Path(tmp) / f"batch-{i}.sql"
+                path.write_text(script)
+                self._execute(file=path)
+
+        return run
@@ -1,24 +1,170 @@
+from release import execution, tracing
+
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Sequence, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
+import io
 import subprocess
+import threading
 
 
 PathEl = Union[str, Path]
 PathEls = Sequence[PathEl]
 
+T = TypeVar("T")
+
+# One rev-parse answers all of these: the toplevel, the directory holding
+# refs (shared between worktrees), the commit HEAD points to, and the
+# (abbreviated) name of the branch, or "HEAD" when detached.
+SNAPSHOT_ARGS = [
+    "--path-format=absolute",
+    "--show-toplevel",
+    "--git-common-dir",
+    "HEAD",
+    "--abbrev-ref",
+    "HEAD",
+]
+
+
+# Tracked files only: untracked files (e.g. the wrangler.toml we decrypt
+# into the checkout) don't make a tree dirty, and rename detection is work
+# we don't need.
+STATUS_ARGS = [
+    "status",
+    "--porcelain=v2",
+    "-z",
+    "--untracked-files=no",
+    "--no-renames",
+]
+
+# Fields before the path in each kind of porcelain v2 record
+STATUS_FIELDS = {"1": 8, "2": 9, "u": 10}
+
+# Unit separators between fields, with the (free-form) message last; `log -z`
+# separates the commits themselves with NULs.
+LOG_FORMAT = "%H%x1f%an%x1f%ae%x1f%aI%x1f%B"
+
+
+@dataclass(frozen=True)
+class DirtyPath:
+    path: str
+    # Porcelain XY code: index status then worktree status, "." unchanged
+    status: str
+
+
+class DirtyTreeError(RuntimeError):
+    def __init__(self, paths: Sequence[DirtyPath], limit: int = 20):
+        self.paths = list(paths)
+        lines = [f" - {p.status} {p.path}" for p in self.paths[:limit]]
+        if len(self.paths) > limit:
+            lines.append(f" ... and {len(self.paths) - limit} more")
+        listing = "\n".join(lines)
+        super().__init__(
+            f"Uncommitted changes in {len(self.paths)} path(s):\n{listing}"
+        )
+
+
+def parse_status(output: bytes) -> List[DirtyPath]:
+    paths = []
+    records = iter(output.decode(errors="surrogateescape").split("\0"))
+    for record in records:
+        fields = STATUS_FIELDS.get(record[:1])
+        if fields is None:
+            # Headers, untracked/ignored entries, trailing empty string
+            continue
+
+        parts = record.split(" ", fields)
+        paths.append(DirtyPath(parts[fields], parts[1]))
+        if record[0] == "2":
+            # Followed by the original path, as its own record
+            next(records, None)
+
+    return paths
+
+
+@dataclass(frozen=True)
+class Commit:
+    id: str
+    author_name: str
+    author_email: str
+    # ISO 8601, with the author's offset
+    timestamp: str
+    message: str
+
+    @classmethod
+    def from_log(cls, record: bytes) -> "Commit":
+        fields = record.decode(errors="replace").split("\x1f", 4)
+        (id_, author_name, author_email, timestamp, message) = fields
+        return cls(id_, author_name, author_email, timestamp, message.strip())
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    root: Path
+    git_dir: Path
+    head: str
+    branch: str
+
+    @classmethod
+    def from_rev_parse(cls, output: str) -> "Snapshot":
+        (root, git_dir, head, branch) = output.splitlines()
+        return cls(Path(root), Path(git_dir), head, branch)
+
 
 class Git:
-    def __init__(self, root: Path) -> None:
+    """
+    Wraps the git CLI for a single repository.
+
+    Read-only queries are memoized for the lifetime of the object, and
+    dropped whenever we change repository state ourselves (tag, checkout,
+    push).
+    """
+
+    def __init__(self, root: Path, snapshot: Optional[Snapshot] = None):
         self._root = root
         self._root_str = str(root)
+        self._cache: Dict[Hashable, Any] = {}
+        self._lock = threading.RLock()
+        if snapshot:
+            self._cache["snapshot"] = snapshot
 
     @classmethod
     def from_local_dir(cls) -> "Git":
+        cmd = ["git", "rev-parse", *SNAPSHOT_ARGS]
+        res = tracing.run(cmd, stdout=subprocess.PIPE)
+        if res.returncode == 0:
+            snapshot = Snapshot.from_rev_parse(res.stdout.decode())
+            return cls(snapshot.root, snapshot)
+
+        # No commits yet, so HEAD doesn't resolve; we can still find the root
         cmd = ["git", "rev-parse", "--show-toplevel"]
-        root = subprocess.check_output(cmd).decode().strip()
+        root = tracing.check_output(cmd).decode().strip()
 
         return cls(Path(root))
 
+    def _memo(self, key: Hashable, fn: Callable[[], T]) -> T:
+        # NOTE: held while computing, so concurrent callers asking the same
+        # question wait for one git process instead of starting their own.
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = fn()
+            return self._cache[key]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
     def _cmd(self, argv: PathEls) -> PathEls:
         return ["git", "-C", self._root_str, *argv]
 
@@ -26,62 +172,192 @@ class Git:
         self,
         argv: PathEls,
         check: bool = True,
-        *args,
         **kwargs,
     ) -> subprocess.CompletedProcess:
-        return subprocess.run(self._cmd(argv), check=check, *args, **kwargs)
+        return tracing.run(self._cmd(argv), check=check, **kwargs)
 
     def _output(self, argv: PathEls) -> str:
-        return subprocess.check_output(self._cmd(argv)).decode().strip()
+        return tracing.check_output(self._cmd(argv)).decode().strip()
+
+    def _run_mutating(
+        self, argv: PathEls, step: Optional[str] = None, **kwargs
+    ) -> subprocess.CompletedProcess:
+        try:
+            if step is None:
+                return self._run(argv, check=True)
+            return execution.run(step, self._cmd(argv), **kwargs)
+        finally:
+            self.invalidate()
 
     def root(self) -> Path:
         return self._root
 
+    def snapshot(self) -> Snapshot:
+        return self._memo(
+            "snapshot",
+            lambda: Snapshot.from_rev_parse(
+                self._output(["rev-parse", *SNAPSHOT_ARGS])
+            ),
+        )
+
+    def prefetch(self, ls_files: Optional[PathEls] = None) -> None:
+        """
+        Warms the cache with everything a command is about to ask for.
+        """
+        self.snapshot()
+        if ls_files is not None:
+            self.ls_files(ls_files)
+
     def branch(self) -> str:
-        return self._output(["rev-parse", "--abbrev-ref", "HEAD"])
+        return self.snapshot().branch
+
+    def get_tags(
+        self,
+        sort: Optional[str] = "-committerdate",
+        pattern: str = "refs/tags",
+    ) -> List[str]:
+        cmd = ["for-each-ref", "--merged", "HEAD"]
+        if sort:
+            cmd.append(f"--sort={sort}")
+        cmd.extend(["--format=%(refname:strip=2)", pattern])
 
-    def get_tags(self, sort: str = "-committerdate") -> List[str]:
-        return self._output(["tag", f"--sort={sort}", "--merged"]).splitlines()
+        key = ("tags", sort, pattern)
+        tags = self._memo(key, lambda: self._output(cmd).split())
+        return list(tags)
+
+    def _tag_at_head(self, tag: str) -> bool:
+        # NOTE: uncached, since it's asked right after we tried to tag
+        ref = f"refs/tags/{tag}^{{commit}}"
+        cmd = ["rev-parse", ref, "HEAD"]
+        res = self._run(
+            cmd, check=False, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        lines = res.stdout.decode().split()
+        return res.returncode == 0 and len(lines) == 2 and lines[0] == lines[1]
 
     def tag(self, tag: str) -> None:
-        self._run(["tag", tag])
+        self._run_mutating(
+            ["tag", tag],
+            step="git_tag",
+            idempotent=False,
+            already_done=lambda: self._tag_at_head(tag),
+        )
 
     def checkout(self, branch: str, new: bool = False) -> None:
         cmd = ["checkout"]
         if new:
             cmd.append("-b")
         cmd.append(branch)
-        self._run(cmd, check=True)
+        self._run_mutating(cmd)
+
+    def _remote_refs(
+        self, remote: str, refs: Sequence[str]
+    ) -> Dict[str, str]:
+        cmd = self._cmd(["ls-remote", "--refs", remote, *refs])
+        res = execution.run("git_ls_remote", cmd, stdout=subprocess.PIPE)
+        found = {}
+        for line in res.stdout.decode().splitlines():
+            (oid, ref) = line.split("\t", 1)
+            found[ref] = oid
+        return found
+
+    def _local_refs(self, refs: Sequence[str]) -> Dict[str, str]:
+        # NOTE: not peeled, so annotated tags compare like ls-remote's
+        oids = self._output(["rev-parse", *refs]).split()
+        return dict(zip(refs, oids))
 
     def push(
         self,
         remote: str = "origin",
         target: Optional[str] = None,
         tags: bool = False,
+        refs: Sequence[str] = (),
     ) -> None:
-        args = ["push", remote]
-        if target:
-            args.append(target)
-        if tags:
-            args.append("--tags")
+        """
+        Pushes `target` (or the current branch) and, with `tags`, every tag.
+
+        Given full ref names instead, pushes just those, all or nothing,
+        skipping any the remote already has.
+        """
+        if not refs:
+            args = ["push", remote]
+            if target:
+                args.append(target)
+            if tags:
+                args.append("--tags")
+
+            self._run_mutating(args, step="git_push")
+            return
+
+        local = self._local_refs(refs)
+        remote_ = self._remote_refs(remote, refs)
+        stale = [r for r in refs if remote_.get(r) != local[r]]
+        if not stale:
+            return
 
-        self._run(args, check=True)
+        refspecs = [f"{r}:{r}" for r in stale]
+        self._run_mutating(
+            ["push", "--atomic", remote, *refspecs], step="git_push"
+        )
+
+    def log(self, start: Optional[str], end: str = "HEAD") -> Iterator[Commit]:
+        """
+        Commits reachable from `end` but not from `start` (all of them, with
+        no start), newest first.
+
+        They're parsed as git writes them, so a caller that stops early
+        doesn't wait for (or hold) the rest of a long history.
+        """
+        rev = f"{start}..{end}" if start else end
+        argv = self._cmd(["log", "-z", f"--format={LOG_FORMAT}", rev, "--"])
+        with tracing.process_span(argv) as span:
+            proc = subprocess.Popen(argv, stdout=subprocess.PIPE)
+            stdout = proc.stdout
+            assert isinstance(stdout, io.BufferedReader)
+            finished = False
+            try:
+                pending = b""
+                for block in iter(stdout.read1, b""):
+                    (*records, pending) = (pending + block).split(b"\0")
+                    for record in records:
+                        yield Commit.from_log(record)
+                if pending:
+                    yield Commit.from_log(pending)
+                finished = True
+            finally:
+                # NOTE: the caller stopped early; the rest isn't wanted
+                if not finished:
+                    proc.kill()
+                proc.wait()
+                stdout.close()
+                span.args["exit_code"] = proc.returncode
+
+        if finished and proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, argv)
+
+    def dirty_paths(self) -> List[DirtyPath]:
+        """
+        Tracked paths with staged or unstaged changes, from a single
+        `git status`. Status honours core.fsmonitor and refreshes the
+        index's stat cache as it goes, so later checks get cheaper.
+        """
+        return parse_status(tracing.check_output(self._cmd(STATUS_ARGS)))
 
     def assert_clean(self) -> None:
-        cmd = ["update-index", "--refresh"]
-        self._run(cmd)
-        cmd = ["diff-index", "--quiet", "HEAD", "--"]
-        res = self._run(cmd)
-        if res.returncode != 0:
-            raise RuntimeError("Unstaged changes detected")
+        paths = self.dirty_paths()
+        if paths:
+            raise DirtyTreeError(paths)
 
     def commit_hash(self) -> str:
-        return self._output(["rev-parse", "--verify", "HEAD"])
+        return self.snapshot().head
 
     def ls_files(self, argv: Optional[PathEls] = None) -> List[Path]:
         cmd: List[PathEl] = ["ls-files", "-z"]
         if argv:
             cmd.extend(argv)
-        raw = self._output(cmd)
 
-        return [Path(p) for p in raw.split("\0") if p]
+        def ls_files() -> List[Path]:
+            raw = self._output(cmd)
+            return [Path(p) for p in raw.split("\0") if p]
+
+        return list(self._memo(("ls-files", *map(str, cmd)), ls_files))
@@ -1,11 +1,15 @@
 from release.release_mgmt.git import Git
 from release.release_mgmt.version import Mode, Version
+from release.release_mgmt.version_index import VersionIndex
 
-from typing import Optional
-import re
+from typing import List, Optional
 
 RELEASE_PREFIX = "release/"
-TAG_REGEX = re.compile(r"^v([0-9]+)\.([0-9]+)\.([0-9]+)$")
+
+
+def release_branch(version: Version) -> str:
+    # release/x.y
+    return f'{RELEASE_PREFIX}{version.version_string("minor")}'
 
 
 class VersionBumpError(RuntimeError):
@@ -26,8 +30,9 @@ class NotReleaseBranchError(VersionBumpError):
 
 
 class ReleaseManager:
-    def __init__(self, git: Git) -> None:
+    def __init__(self, git: Git, index: Optional[VersionIndex] = None):
         self._git = git
+        self._index = index or VersionIndex.for_git(git)
 
     @classmethod
     def from_local_dir(cls) -> "ReleaseManager":
@@ -43,7 +48,7 @@ class ReleaseManager:
         version: Version,
         branch: Optional[str] = None,
     ) -> None:
-        exp = f'{RELEASE_PREFIX}{version.version_string("minor")}'
+        exp = release_branch(version)
         branch_ = branch or self._git.branch()
         if branch_ != exp:
             raise NotReleaseBranchError(exp, branch_)
@@ -61,10 +66,7 @@ class ReleaseManager:
             if branch != "master":
                 raise BadBranchError(mode)
 
-            # release/x.y
-            min_version = version.version_string("minor")
-            release_branch = f"{RELEASE_PREFIX}{min_version}"
-            self._git.checkout(release_branch, new=True)
+            self._git.checkout(release_branch(version), new=True)
         elif mode == "patch":
             self.assert_is_release_branch_for_version(version, branch)
 
@@ -74,15 +76,16 @@ class ReleaseManager:
         self._git.tag(tag)
         return version
 
-    def last_version(self) -> Optional[Version]:
-        tags = self._git.get_tags()
-        version_tag = next((t for t in tags if TAG_REGEX.match(t)), None)
-
-        if not version_tag:
-            return None
-
-        match = TAG_REGEX.match(version_tag)
-        assert match  # for mypy, tested earlier with filter
+    def release_refs(self, tag: str, mode: Mode) -> List[str]:
+        """
+        The refs a bump to `tag` created: the tag itself, and for a major or
+        minor bump, the release branch it started.
+        """
+        refs = [f"refs/tags/{tag}"]
+        if mode in ("major", "minor"):
+            branch = release_branch(Version.from_tag(tag))
+            refs.append(f"refs/heads/{branch}")
+        return refs
 
-        (major, minor, patch) = (int(i) for i in match.groups())
-        return Version(major, minor, patch)
+    def last_version(self) -> Optional[Version]:
+        return self._index.latest()
@@ -0,0 +1,101 @@
+"""
+Reads refs straight out of .git, for commands that need to answer simple
+questions without starting git.
+
+Only the plain layout (a .git directory with loose refs and packed-refs) is
+understood. Anything else raises UnsupportedLayout, and callers are expected
+to fall back to the Git wrapper.
+"""
+
+from release.release_mgmt.version import Version
+from release.release_mgmt.version_index import (
+    cache_path,
+    cached_version,
+    read_cache,
+    state_key,
+)
+
+from pathlib import Path
+from typing import Dict, Optional
+import os
+
+
+class UnsupportedLayout(Exception):
+    pass
+
+
+def find_git_dir(start: Path) -> Path:
+    if "GIT_DIR" in os.environ or "GIT_COMMON_DIR" in os.environ:
+        raise UnsupportedLayout("git directory overridden by environment")
+
+    for directory in (start, *start.parents):
+        dot_git = directory / ".git"
+        if dot_git.is_dir():
+            break
+        if dot_git.exists():
+            # A file pointing elsewhere: worktrees, submodules
+            raise UnsupportedLayout(f"{dot_git} is not a directory")
+    else:
+        raise UnsupportedLayout(f"no .git directory above {start}")
+
+    for marker in ("commondir", "objects/info/alternates"):
+        if (dot_git / marker).exists():
+            raise UnsupportedLayout(f"found {marker} in {dot_git}")
+
+    return dot_git
+
+
+# NOTE: plain classes here, since importing dataclasses is a good part of
+# print-version's start-up time
+class LocalRefs:
+    def __init__(self, git_dir: Path, packed: Dict[str, str]):
+        self.git_dir = git_dir
+        self.packed = packed
+
+    @classmethod
+    def open(cls, start: Path) -> "LocalRefs":
+        git_dir = find_git_dir(start)
+        packed: Dict[str, str] = {}
+        try:
+            with open(git_dir / "packed-refs") as f:
+                for line in f:
+                    # Skip the header and peeled (^<hash>) lines
+                    if line[0] in "#^":
+                        continue
+                    (sha, _, name) = line.rstrip("\n").partition(" ")
+                    packed[name] = sha
+        except FileNotFoundError:
+            pass
+
+        return cls(git_dir, packed)
+
+    def resolve(self, ref: str) -> str:
+        try:
+            content = (self.git_dir / ref).read_text().strip()
+        except FileNotFoundError:
+            if ref not in self.packed:
+                raise UnsupportedLayout(f"can't resolve {ref}")
+            return self.packed[ref]
+
+        if content.startswith("ref: "):
+            return self.resolve(content.removeprefix("ref: "))
+        return content
+
+
+def latest_version(start: Path) -> Optional[Version]:
+    """
+    Returns the latest release version reachable from HEAD, as
+    VersionIndex.latest() last worked it out, without spawning any processes.
+
+    Raises UnsupportedLayout when there's no cached answer for the current
+    HEAD and tags. Falling back to VersionIndex.latest() fills the cache, so
+    only the first call after a change pays for starting git.
+    """
+    refs = LocalRefs.open(start)
+    head = refs.resolve("HEAD")
+
+    key = state_key(refs.git_dir, head)
+    cached = read_cache(cache_path(refs.git_dir), key)
+    if cached is None:
+        raise UnsupportedLayout("no cached version for HEAD")
+    return cached_version(cached)
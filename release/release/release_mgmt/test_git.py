@@ -0,0 +1,118 @@
+from release import execution
+from release.bench.fixtures import add_remote, git, make_repo
+from release.execution import Policy
+from release.release_mgmt.git import DirtyPath, DirtyTreeError, Git
+from release.tracing import TRACER
+
+from pathlib import Path
+import subprocess
+import tempfile
+import unittest
+
+
+class TestGit(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = make_repo(Path(self._tmp.name) / "repo")
+        self.git = Git(self.root)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_snapshot(self):
+        snapshot = self.git.snapshot()
+
+        self.assertEqual(snapshot.root, self.root)
+        self.assertEqual(snapshot.branch, "master")
+        self.assertEqual(snapshot.head, git(self.root, "rev-parse", "HEAD"))
+
+    def test_queries_are_memoized(self):
+        head = self.git.commit_hash()
+        self.assertEqual(self.git.get_tags(), [])
+
+        git(self.root, "commit", "-q", "--allow-empty", "-m", "second")
+        git(self.root, "tag", "v0.0.1")
+
+        self.assertEqual(self.git.commit_hash(), head)
+        self.assertEqual(self.git.get_tags(), [])
+
+    def test_mutations_invalidate(self):
+        self.git.get_tags()
+        self.git.tag("v0.1.0")
+        self.assertEqual(self.git.get_tags(), ["v0.1.0"])
+
+        self.git.checkout("release/0.1", new=True)
+        self.assertEqual(self.git.branch(), "release/0.1")
+
+    def test_dirty_paths(self):
+        self.git.assert_clean()
+
+        (self.root / "untracked.txt").write_text("ignored\n")
+        (self.root / "src" / "index.ts").write_text("changed\n")
+        (self.root / "secrets" / "wrangler.toml.age").unlink()
+        git(self.root, "add", "src")
+        (self.root / "src" / "index.ts").write_text("changed again\n")
+
+        with self.assertRaises(DirtyTreeError) as ctx:
+            self.git.assert_clean()
+
+        self.assertEqual(
+            ctx.exception.paths,
+            [
+                DirtyPath("secrets/wrangler.toml.age", ".D"),
+                DirtyPath("src/index.ts", "MM"),
+            ],
+        )
+        self.assertIn("src/index.ts", str(ctx.exception))
+
+    def test_tag_retry_is_idempotent(self):
+        self.addCleanup(execution.reset)
+        execution.configure({"git_tag": Policy(attempts=2, backoff=0)})
+
+        # As though an earlier attempt created the tag, then timed out
+        git(self.root, "tag", "v0.1.0")
+        self.git.tag("v0.1.0")
+        self.assertEqual(self.git.get_tags(), ["v0.1.0"])
+
+        git(self.root, "commit", "-q", "--allow-empty", "-m", "second")
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.git.tag("v0.1.0")
+
+    def test_log(self):
+        git(self.root, "tag", "v0.1.0")
+        for message in ("second", "third\n\nwith a body"):
+            git(self.root, "commit", "-q", "--allow-empty", "-m", message)
+
+        commits = list(self.git.log("v0.1.0"))
+        self.assertEqual(
+            [c.message for c in commits], ["third\n\nwith a body", "second"]
+        )
+        self.assertEqual(commits[0].id, git(self.root, "rev-parse", "HEAD"))
+        self.assertEqual(len(list(self.git.log(None))), 3)
+
+    def test_log_stops_early(self):
+        log = self.git.log(None)
+        next(log)
+        log.close()
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(self.git.log("v9.9.9"))
+
+    def test_push_refs(self):
+        remote = add_remote(self.root)
+        git(self.root, "tag", "stray")
+        git(self.root, "checkout", "-q", "-b", "release/0.1")
+        self.git.tag("v0.1.0")
+        refs = ["refs/tags/v0.1.0", "refs/heads/release/0.1"]
+
+        self.git.push(refs=refs)
+        pushed = git(remote, "for-each-ref", "--format=%(refname)")
+        self.assertEqual(
+            sorted(pushed.split()),
+            ["refs/heads/master", *sorted(refs)],
+        )
+
+        # Already up to date, so there's nothing to push
+        TRACER.reset()
+        self.git.push(refs=refs)
+        self.assertNotIn("git push", [s.name for s in TRACER.spans])
@@ -5,6 +5,7 @@ from release.release_mgmt.manager import (
     NotReleaseBranchError,
 )
 from release.release_mgmt.version import Version
+from release.release_mgmt.version_index import VersionIndex
 
 import unittest
 from unittest.mock import MagicMock
@@ -13,7 +14,7 @@ from unittest.mock import MagicMock
 class TestReleaseManager(unittest.TestCase):
     def setUp(self):
         self.git: Git = MagicMock(spec=Git)
-        self.rm = ReleaseManager(self.git)
+        self.rm = ReleaseManager(self.git, VersionIndex(self.git))
 
     def test_release_branch(self):
         branch_name = "release/0.3"
@@ -68,3 +69,12 @@ class TestReleaseManager(unittest.TestCase):
         self.git.branch.return_value = "release/0.3"
         self.rm.version_bump("patch")
         self.git.tag.assert_called_with("v0.3.1")
+
+    def test_release_refs(self):
+        self.assertEqual(
+            self.rm.release_refs("v0.3.1", "patch"), ["refs/tags/v0.3.1"]
+        )
+        self.assertEqual(
+            self.rm.release_refs("v0.4.0", "minor"),
+            ["refs/tags/v0.4.0", "refs/heads/release/0.4"],
+        )
@@ -0,0 +1,55 @@
+from release.bench.fixtures import git, make_repo
+from release.release_mgmt.git import Git
+from release.release_mgmt.refs import UnsupportedLayout, latest_version
+from release.release_mgmt.version import Version
+from release.release_mgmt.version_index import VersionIndex
+
+from pathlib import Path
+import tempfile
+import unittest
+
+
+class TestLatestVersion(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = make_repo(Path(self._tmp.name) / "repo")
+        git(self.root, "tag", "v0.3.0")
+        git(self.root, "checkout", "-q", "-b", "release/0.3")
+        git(self.root, "commit", "-q", "--allow-empty", "-m", "fix")
+        git(self.root, "tag", "v0.3.1")
+        git(self.root, "checkout", "-q", "master")
+        git(self.root, "commit", "-q", "--allow-empty", "-m", "feature")
+        git(self.root, "tag", "v0.4.0")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_needs_index(self):
+        git(self.root, "checkout", "-q", "release/0.3")
+        with self.assertRaises(UnsupportedLayout):
+            latest_version(self.root)
+
+        expected = VersionIndex.for_git(Git(self.root)).latest()
+        self.assertEqual(expected, Version(0, 3, 1))
+        self.assertEqual(latest_version(self.root), expected)
+        self.assertEqual(latest_version(self.root / "src"), expected)
+
+    def test_packed_refs(self):
+        git(self.root, "pack-refs", "--all")
+        expected = VersionIndex.for_git(Git(self.root)).latest()
+        self.assertEqual(latest_version(self.root), expected)
+
+    def test_new_tag_invalidates(self):
+        VersionIndex.for_git(Git(self.root)).latest()
+        git(self.root, "commit", "-q", "--allow-empty", "-m", "feature")
+        git(self.root, "tag", "v0.5.0")
+
+        with self.assertRaises(UnsupportedLayout):
+            latest_version(self.root)
+
+    def test_worktree_unsupported(self):
+        worktree = Path(self._tmp.name) / "worktree"
+        git(self.root, "worktree", "add", "-q", str(worktree), "release/0.3")
+
+        with self.assertRaises(UnsupportedLayout):
+            latest_version(worktree)
@@ -0,0 +1,55 @@
+from release.bench.fixtures import git, make_repo
+from release.release_mgmt.git import Git
+from release.release_mgmt.version import Version
+from release.release_mgmt.version_index import VersionIndex
+
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+class TestVersionIndex(unittest.TestCase):
+    def test_highest_semver_wins(self):
+        g: Git = MagicMock(spec=Git)
+        g.get_tags.return_value = ["v0.9.0", "vnext", "v0.10.0", "v0.2.11"]
+
+        self.assertEqual(VersionIndex(g).latest(), Version(0, 10, 0))
+        g.get_tags.assert_called_with(sort=None, pattern="refs/tags/v*")
+
+    def test_no_versions(self):
+        g: Git = MagicMock(spec=Git)
+        g.get_tags.return_value = ["latest"]
+
+        self.assertIsNone(VersionIndex(g).latest())
+
+
+class TestVersionIndexCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = make_repo(Path(self._tmp.name) / "repo")
+        git(self.root, "tag", "v1.2.3")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def index(self) -> VersionIndex:
+        return VersionIndex.for_git(Git(self.root))
+
+    def test_reuses_cache(self):
+        self.assertEqual(self.index().latest(), Version(1, 2, 3))
+
+        index = self.index()
+        with patch.object(index, "_compute") as compute:
+            self.assertEqual(index.latest(), Version(1, 2, 3))
+            compute.assert_not_called()
+
+    def test_new_tag_invalidates(self):
+        self.assertEqual(self.index().latest(), Version(1, 2, 3))
+
+        git(self.root, "tag", "v1.3.0")
+        self.assertEqual(self.index().latest(), Version(1, 3, 0))
+
+        git(self.root, "pack-refs", "--all")
+        git(self.root, "tag", "-d", "v1.3.0")
+        self.assertEqual(self.index().latest(), Version(1, 2, 3))
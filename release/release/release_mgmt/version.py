@@ -1,14 +1,30 @@
-from dataclasses import dataclass
-from typing import Literal, Union
+from typing import Literal, Tuple, Union
+import functools
+import re
 
 Mode = Union[Literal["major"], Literal["minor"], Literal["patch"]]
 
+TAG_REGEX = re.compile(r"^v([0-9]+)\.([0-9]+)\.([0-9]+)$")
 
-@dataclass
+
+# NOTE: not a dataclass, for the same reason as refs.LocalRefs
+@functools.total_ordering
 class Version:
-    major: int
-    minor: int
-    patch: int
+    def __init__(self, major: int, minor: int, patch: int):
+        self.major = major
+        self.minor = minor
+        self.patch = patch
+
+    def _key(self) -> Tuple[int, int, int]:
+        return (self.major, self.minor, self.patch)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __lt__(self, other: "Version") -> bool:
+        return self._key() < other._key()
 
     @classmethod
     def from_str(cls, init: str) -> "Version":
@@ -0,0 +1,111 @@
+from release.release_mgmt.version import TAG_REGEX, Version
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+import hashlib
+import json
+
+VERSION_TAG_PATTERN = "refs/tags/v*"
+CACHE_FORMAT = 1
+
+if TYPE_CHECKING:
+    # Only needed for annotations; keeps release.release_mgmt.refs light
+    from release.release_mgmt.git import Git
+
+
+def cache_path(git_dir: Path) -> Path:
+    return git_dir / "release" / "version-index.json"
+
+
+def state_key(git_dir: Path, head: str) -> str:
+    h = hashlib.sha256(head.encode())
+
+    def add_stat(name: str, path: Path) -> None:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            h.update(f"{name}:-\n".encode())
+            return
+        stat = f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+        h.update(f"{name}:{stat}\n".encode())
+
+    add_stat("packed-refs", git_dir / "packed-refs")
+    # NOTE: git writes loose refs via a lockfile that's renamed into place, so
+    # creating, moving or deleting a tag always touches the directory itself,
+    # and we don't need to stat every tag inside it.
+    add_stat("refs/tags", git_dir / "refs" / "tags")
+
+    return h.hexdigest()
+
+
+def read_cache(path: Path, key: str) -> Optional[dict]:
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+    if data.get("format") != CACHE_FORMAT or data.get("key") != key:
+        return None
+    return data
+
+
+def cached_version(data: dict) -> Optional[Version]:
+    latest = data["latest"]
+    return Version.from_str(latest) if latest else None
+
+
+class VersionIndex:
+    """
+    Finds the highest release version reachable from HEAD.
+
+    Only `refs/tags/v*` is enumerated, and the result is cached on disk keyed
+    on HEAD and the state of packed-refs and the loose tags directory, so
+    repeated runs against an unchanged repository don't list tags at all.
+    """
+
+    def __init__(self, git: "Git", cache_path: Optional[Path] = None):
+        self._git = git
+        self._cache_path = cache_path
+
+    @classmethod
+    def for_git(cls, git: "Git") -> "VersionIndex":
+        return cls(git, cache_path(git.snapshot().git_dir))
+
+    def _state_key(self) -> str:
+        git_dir = self._git.snapshot().git_dir
+        return state_key(git_dir, self._git.commit_hash())
+
+    def _compute(self) -> Optional[Version]:
+        tags = self._git.get_tags(sort=None, pattern=VERSION_TAG_PATTERN)
+        versions = (Version.from_tag(t) for t in tags if TAG_REGEX.match(t))
+        return max(versions, default=None)
+
+    def _store(self, key: str, version: Optional[Version]) -> None:
+        assert self._cache_path
+        data = {
+            "format": CACHE_FORMAT,
+            "key": key,
+            "latest": version.version_string() if version else None,
+        }
+        try:
+            self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # NOTE: only needed on a miss, so print-version's hit skips it
+            from release.utils import atomic_write
+
+            atomic_write(self._cache_path, json.dumps(data))
+        except OSError:
+            # A read-only checkout just doesn't get a cache
+            pass
+
+    def latest(self) -> Optional[Version]:
+        if not self._cache_path:
+            return self._compute()
+
+        key = self._state_key()
+        cached = read_cache(self._cache_path, key)
+        if cached is not None:
+            return cached_version(cached)
+
+        version = self._compute()
+        self._store(key, version)
+        return version
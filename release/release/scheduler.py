@@ -0,0 +1,162 @@
+from release.tracing import TRACER
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+import textwrap
+import time
+
+StepFn = Callable[[Mapping[str, Any]], Any]
+
+
+@dataclass
+class Step:
+    name: str
+    fn: StepFn
+    deps: Sequence[str] = ()
+
+
+@dataclass
+class StepResult:
+    name: str
+    start: float = 0.0
+    end: float = 0.0
+    value: Any = None
+    error: Optional[BaseException] = None
+    # Not run, because a dependency (or another step) failed first
+    skipped: bool = False
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def ok(self) -> bool:
+        return not self.skipped and self.error is None
+
+
+@dataclass
+class Report:
+    results: Dict[str, StepResult]
+    critical_path: List[str] = field(default_factory=list)
+
+    @property
+    def failed(self) -> List[StepResult]:
+        return [r for r in self.results.values() if r.error is not None]
+
+    def summary(self) -> str:
+        started = [r.start for r in self.results.values() if not r.skipped]
+        origin = min(started, default=0.0)
+        lines = []
+        for r in self.results.values():
+            if r.skipped:
+                lines.append(f"  {r.name:<28} skipped")
+                continue
+
+            marker = "*" if r.name in self.critical_path else " "
+            status = "failed" if r.error else "ok"
+            lines.append(
+                f"{marker} {r.name:<28} {status:<7} "
+                f"+{r.start - origin:6.2f}s {r.duration:7.2f}s"
+            )
+
+        return "\n".join(lines)
+
+
+class StepFailed(RuntimeError):
+    def __init__(self, report: Report):
+        self.report = report
+        names = ", ".join(r.name for r in report.failed)
+        summary = textwrap.indent(report.summary(), "  ")
+        super().__init__(f"steps failed: {names}\n{summary}")
+
+
+class Graph:
+    """
+    A set of steps with dependencies between them.
+
+    Each step receives the return values of its dependencies. Independent
+    steps run concurrently; once any step fails, nothing new is started and
+    the run stops after the in-flight steps finish.
+    """
+
+    def __init__(self) -> None:
+        self._steps: Dict[str, Step] = {}
+
+    def add(self, name: str, fn: StepFn, deps: Sequence[str] = ()) -> None:
+        missing = [d for d in deps if d not in self._steps]
+        # NOTE: requiring dependencies to exist first also rules out cycles
+        assert not missing, f"{name} depends on unknown steps: {missing}"
+        assert name not in self._steps, f"duplicate step {name}"
+        self._steps[name] = Step(name, fn, tuple(deps))
+
+    def _critical_path(self, results: Dict[str, StepResult]) -> List[str]:
+        finished = [r for r in results.values() if not r.skipped]
+        if not finished:
+            return []
+
+        # Walk back from whatever finished last, always via the dependency
+        # that held it up the longest.
+        path = [max(finished, key=lambda r: r.end).name]
+        while True:
+            deps = self._steps[path[-1]].deps
+            if not deps:
+                break
+            path.append(max(deps, key=lambda d: results[d].end))
+
+        return list(reversed(path))
+
+    def run(self, max_workers: Optional[int] = None) -> Report:
+        results = {name: StepResult(name) for name in self._steps}
+        pending = dict(self._steps)
+        running: Dict[Future, str] = {}
+        done: Dict[str, Any] = {}
+        failed = False
+
+        def timed(step: Step, inputs: Mapping[str, Any]) -> Any:
+            result = results[step.name]
+            result.start = time.monotonic()
+            try:
+                with TRACER.span(step.name):
+                    return step.fn(inputs)
+            finally:
+                result.end = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                if not failed:
+                    ready = [
+                        s
+                        for s in pending.values()
+                        if all(d in done for d in s.deps)
+                    ]
+                    for step in ready:
+                        del pending[step.name]
+                        inputs = {d: done[d] for d in step.deps}
+                        future = pool.submit(timed, step, inputs)
+                        running[future] = step.name
+
+                if not running:
+                    break
+
+                (finished, _) = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        results[name].value = done[name] = future.result()
+                    except Exception as e:
+                        results[name].error = e
+                        failed = True
+
+        for name in pending:
+            results[name].skipped = True
+
+        report = Report(results, self._critical_path(results))
+        if report.failed:
+            raise StepFailed(report) from report.failed[0].error
+        return report
@@ -1,10 +1,10 @@
-from release.utils import format_paths
+from release import tracing
+from release.utils import atomic_write, format_paths
 
 from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Sequence, Union
 import subprocess
-import tempfile
 
 SUPPORTED_ID_TYPES = ["rsa", "ed25519"]
 
@@ -35,10 +35,16 @@ class Secrets:
 
         return cls(existing_paths)
 
-    def decrypt(self, path: Path) -> Path:
-        tmp = tempfile.mktemp()
-        tail: List[PathEl] = ["--output", tmp, path]
+    def decrypt(self, path: Path) -> bytes:
+        # age writes the plaintext to stdout, which we keep in memory rather
+        # than round-tripping it through a temporary file.
+        tail: List[PathEl] = [path]
         cmd: Sequence[PathEl] = ["age", "--decrypt"] + self._id_args() + tail
-
-        subprocess.run(cmd, check=True)
-        return Path(tmp)
+        res = tracing.run(cmd, check=True, stdout=subprocess.PIPE)
+        return res.stdout
+
+    def decrypt_to(self, path: Path, dest: Path) -> None:
+        """
+        Decrypts path to dest, atomically replacing any existing file.
+        """
+        atomic_write(dest, self.decrypt(path), mode=0o600)
@@ -1,6 +1,10 @@
+from release import execution, tracing
+from release.release_mgmt.git import Commit
+
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Sequence, Union
+from typing import Iterable, Optional, Sequence, Union
 import subprocess
 import os
 
@@ -9,8 +13,40 @@ PathEl = Union[str, Path]
 PathEls = Sequence[PathEl]
 
 
+@dataclass(frozen=True)
+class CommitRange:
+    """
+    The commits a release adds: everything since the previous release's tag
+    (or all of history, for the first release), listed lazily.
+    """
+
+    previous: Optional[str]
+    commits: Iterable[Commit]
+
+
+class SentryClient(ABC):
+    @abstractmethod
+    def create_release(
+        self, commit: str, tag: str, commits: Optional[CommitRange] = None
+    ) -> None:
+        """
+        Without `commits`, Sentry works out which commits the release has
+        itself, by walking the repository's history from `commit`.
+        """
+        ...
+
+    @abstractmethod
+    def upload_sourcemaps(
+        self,
+        tag: str,
+        bundle: Path,
+        bundle_sourcemap: Path,
+    ) -> None:
+        ...
+
+
 @dataclass
-class Sentry:
+class Sentry(SentryClient):
     org: str
     project: str
     auth_token: str
@@ -18,6 +54,7 @@ class Sentry:
     def _run(
         self,
         cmd: Sequence[PathEl],
+        step: Optional[str] = None,
         check=True,
         **kwargs,
     ) -> subprocess.CompletedProcess:
@@ -25,9 +62,27 @@ class Sentry:
         env["SENTRY_AUTH_TOKEN"] = self.auth_token
 
         argv: Sequence[str | Path] = ["sentry-cli"] + [str(p) for p in cmd]
-        return subprocess.run(argv, env=env, check=check, **kwargs)
+        if step is None:
+            return tracing.run(
+                argv,
+                env=env,
+                check=check,
+                secrets=[self.auth_token],
+                **kwargs,
+            )
 
-    def _releases(self, cmd: Sequence[PathEl]) -> subprocess.CompletedProcess:
+        return execution.run(
+            step,
+            argv,
+            env=env,
+            check=check,
+            secrets=[self.auth_token],
+            **kwargs,
+        )
+
+    def _releases(
+        self, cmd: Sequence[PathEl], step: Optional[str] = None, **kwargs
+    ) -> subprocess.CompletedProcess:
         argv = [
             "releases",
             "--org",
@@ -36,14 +91,35 @@ class Sentry:
             self.project,
         ] + list(cmd)
 
-        return self._run(argv)
+        return self._run(argv, step, **kwargs)
 
-    def create_release(self, commit: str, tag: str) -> None:
+    def _release_exists(self, tag: str) -> bool:
+        res = self._releases(
+            ["info", tag],
+            check=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return res.returncode == 0
+
+    def create_release(
+        self, commit: str, tag: str, commits: Optional[CommitRange] = None
+    ) -> None:
         cmd = ["new", tag]
-        self._releases(cmd)
+        self._releases(
+            cmd,
+            "create_release",
+            idempotent=False,
+            already_done=lambda: self._release_exists(tag),
+        )
 
-        cmd = ["set-commits", "--commit", f"origin@{commit}", tag]
-        self._releases(cmd)
+        # NOTE: sentry-cli can't take a list of commits, but an explicit
+        # range saves it (and the server) finding the previous release
+        ref = f"origin@{commit}"
+        if commits and commits.previous:
+            ref = f"origin@{commits.previous}..{commit}"
+        cmd = ["set-commits", "--commit", ref, tag]
+        self._releases(cmd, "create_release")
 
     def upload_sourcemaps(
         self,
@@ -60,4 +136,4 @@ class Sentry:
             "--bundle-sourcemap",
             bundle_sourcemap,
         ]
-        self._releases(cmd)
+        self._releases(cmd, "upload_sourcemaps")
@@ -0,0 +1,366 @@
+from release import tracing
+from release.release_mgmt.git import Commit
+from release.sentry import CommitRange, SentryClient
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+import hashlib
+import http.client
+import io
+import json
+import logging
+import queue
+import time
+import uuid
+import zipfile
+
+DEFAULT_URL = "https://sentry.io"
+DEFAULT_CONCURRENCY = 4
+
+# Fixed timestamp for bundle entries, so identical inputs produce identical
+# bundles (and therefore identical chunks the server may already have).
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+# Assemble states meaning the server has everything it needs from us
+ASSEMBLED_STATES = {"created", "assembling", "ok"}
+
+# NOTE: Sentry replaces a release's commits whenever they're set, so they
+# can't be sent over several requests; instead we stop reading the log here
+# (with a warning), which mostly matters for a first release (i.e. all of
+# history).
+MAX_COMMITS = 1000
+
+log = logging.getLogger(__name__)
+
+
+class SentryAPIError(RuntimeError):
+    def __init__(self, method: str, path: str, status: int, body: bytes):
+        detail = body.decode(errors="replace")[:500]
+        super().__init__(f"{method} {path} returned {status}: {detail}")
+        self.status = status
+
+
+class ConnectionPool:
+    """
+    Keeps up to `size` keep-alive connections to one host, handing them out
+    to one request at a time.
+    """
+
+    def __init__(self, url: str, size: int, timeout: float = 60):
+        parts = urlsplit(url)
+        self._https = parts.scheme == "https"
+        self._host = parts.netloc
+        self._timeout = timeout
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = (
+            queue.LifoQueue()
+        )
+        self._slots: "queue.Queue[None]" = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._slots.put(None)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self._https:
+            return http.client.HTTPSConnection(
+                self._host, timeout=self._timeout
+            )
+        return http.client.HTTPConnection(self._host, timeout=self._timeout)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, bytes]:
+        self._slots.get()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._connect()
+                reused = False
+
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                res = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                if not reused:
+                    raise
+                # The server timed out an idle connection; retry on a new one
+                conn = self._connect()
+                conn.request(method, path, body=body, headers=headers or {})
+                res = conn.getresponse()
+
+            data = res.read()
+            if res.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+            return (res.status, data)
+        finally:
+            self._slots.put(None)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _multipart(
+    files: Sequence[Tuple[str, str, bytes]]
+) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    buf = io.BytesIO()
+    for name, filename, content in files:
+        buf.write(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n".encode()
+        )
+        buf.write(content)
+        buf.write(b"\r\n")
+    buf.write(f"--{boundary}--\r\n".encode())
+
+    return (buf.getvalue(), f"multipart/form-data; boundary={boundary}")
+
+
+def build_bundle(
+    org: str,
+    tag: str,
+    bundle: Path,
+    bundle_sourcemap: Path,
+) -> bytes:
+    """
+    Packs the bundle and sourcemap as a release artifact bundle, referenced
+    the same way `sentry-cli files upload-sourcemaps --bundle` would.
+    """
+    manifest: Dict[str, Any] = {"org": org, "release": tag, "files": {}}
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        sources = [
+            (bundle, "minified_source", {"Sourcemap": bundle_sourcemap.name}),
+            (bundle_sourcemap, "source_map", {}),
+        ]
+        for path, file_type, headers in sources:
+            name = f"files/_/_/{path.name}"
+            manifest["files"][name] = {
+                "url": f"~/{path.name}",
+                "type": file_type,
+                "headers": headers,
+            }
+            z.writestr(zipfile.ZipInfo(name, ZIP_DATE), path.read_bytes())
+
+        info = zipfile.ZipInfo("manifest.json", ZIP_DATE)
+        z.writestr(info, json.dumps(manifest, sort_keys=True))
+
+    return buf.getvalue()
+
+
+@dataclass
+class ChunkOptions:
+    path: str
+    chunk_size: int
+    chunks_per_request: int
+    max_request_size: int
+    concurrency: int
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any]) -> "ChunkOptions":
+        return cls(
+            path=urlsplit(data["url"]).path,
+            chunk_size=data["chunkSize"],
+            chunks_per_request=data["chunksPerRequest"],
+            max_request_size=data["maxRequestSize"],
+            concurrency=data.get("concurrency", 1),
+        )
+
+
+@dataclass
+class SentryAPI(SentryClient):
+    """
+    Talks to the Sentry web API directly instead of through sentry-cli.
+
+    All requests share one pool of keep-alive connections. Sourcemaps are
+    uploaded as content-addressed chunks, and only the chunks the server
+    reports missing are sent.
+    """
+
+    org: str
+    project: str
+    auth_token: str
+    url: str = DEFAULT_URL
+    concurrency: int = DEFAULT_CONCURRENCY
+    repository: str = "origin"
+
+    _pool: ConnectionPool = field(init=False, repr=False)
+    _base: str = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._pool = ConnectionPool(self.url, self.concurrency)
+        # Self-hosted instances may live under a path
+        self._base = urlsplit(self.url).path.rstrip("/")
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        payload: Any = None,
+        body: Optional[bytes] = None,
+        content_type: str = "application/json",
+    ) -> Any:
+        if payload is not None:
+            body = json.dumps(payload).encode()
+        headers = {"Authorization": f"Bearer {self.auth_token}"}
+        if body is not None:
+            headers["Content-Type"] = content_type
+
+        name = f"sentry {method}"
+        with tracing.TRACER.span(name, "http", path=path) as span:
+            (status, data) = self._pool.request(method, path, body, headers)
+            span.args.update(
+                status=status,
+                request_bytes=len(body or b""),
+                response_bytes=len(data),
+            )
+        if status >= 400:
+            raise SentryAPIError(method, path, status, data)
+        return json.loads(data) if data else None
+
+    def _org_path(self, suffix: str) -> str:
+        return f"{self._base}/api/0/organizations/{self.org}/{suffix}"
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def _commit(self, commit: Commit) -> Dict[str, str]:
+        return {
+            "id": commit.id,
+            "repository": self.repository,
+            "message": commit.message,
+            "author_name": commit.author_name,
+            "author_email": commit.author_email,
+            "timestamp": commit.timestamp,
+        }
+
+    def create_release(
+        self, commit: str, tag: str, commits: Optional[CommitRange] = None
+    ) -> None:
+        # NOTE: Sentry answers 208 for a release that already exists
+        payload = {"version": tag, "projects": [self.project]}
+        self._request("POST", self._org_path("releases/"), payload)
+
+        path = self._org_path(f"releases/{tag}/")
+        if commits is None:
+            refs = [{"repository": self.repository, "commit": commit}]
+            self._request("PUT", path, {"refs": refs})
+            return
+
+        # One more than we send, to tell whether any were left out
+        listed = list(islice(commits.commits, MAX_COMMITS + 1))
+        if len(listed) > MAX_COMMITS:
+            log.warning(
+                "%s has more than %d commits since %s; Sentry is only "
+                "given the latest %d",
+                tag,
+                MAX_COMMITS,
+                commits.previous or "the start of history",
+                MAX_COMMITS,
+            )
+            listed = listed[:MAX_COMMITS]
+        commit_list: List[Dict[str, str]] = [self._commit(c) for c in listed]
+        self._request("PUT", path, {"commits": commit_list})
+
+    def _chunk_options(self) -> ChunkOptions:
+        data = self._request("GET", self._org_path("chunk-upload/"))
+        return ChunkOptions.from_response(data)
+
+    def _assemble(
+        self, tag: str, checksum: str, chunks: List[str]
+    ) -> Dict[str, Any]:
+        path = self._org_path(f"releases/{tag}/assemble/")
+        return self._request(
+            "POST", path, {"checksum": checksum, "chunks": chunks}
+        )
+
+    def _upload_batches(
+        self,
+        opts: ChunkOptions,
+        chunks: Dict[str, bytes],
+    ) -> Iterator[List[Tuple[str, bytes]]]:
+        batch: List[Tuple[str, bytes]] = []
+        size = 0
+        for checksum, chunk in chunks.items():
+            full = len(batch) >= opts.chunks_per_request
+            if batch and (full or size + len(chunk) > opts.max_request_size):
+                yield batch
+                (batch, size) = ([], 0)
+            batch.append((checksum, chunk))
+            size += len(chunk)
+
+        if batch:
+            yield batch
+
+    def _upload_chunks(
+        self, opts: ChunkOptions, chunks: Dict[str, bytes]
+    ) -> None:
+        def upload(batch: List[Tuple[str, bytes]]) -> None:
+            files = [("file", checksum, data) for (checksum, data) in batch]
+            (body, content_type) = _multipart(files)
+            self._request(
+                "POST", opts.path, body=body, content_type=content_type
+            )
+
+        workers = max(1, min(opts.concurrency, self.concurrency))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batches = self._upload_batches(opts, chunks)
+            for _ in pool.map(upload, batches):
+                pass
+
+    def upload_sourcemaps(
+        self,
+        tag: str,
+        bundle: Path,
+        bundle_sourcemap: Path,
+    ) -> None:
+        archive = build_bundle(self.org, tag, bundle, bundle_sourcemap)
+        opts = self._chunk_options()
+
+        order: List[str] = []
+        chunks: Dict[str, bytes] = {}
+        for offset in range(0, len(archive), opts.chunk_size):
+            chunk = archive[offset : offset + opts.chunk_size]
+            chunk_checksum = hashlib.sha1(chunk).hexdigest()
+            order.append(chunk_checksum)
+            chunks.setdefault(chunk_checksum, chunk)
+
+        checksum = hashlib.sha1(archive).hexdigest()
+
+        # Asking to assemble first tells us which chunks are already stored
+        res = self._assemble(tag, checksum, order)
+        missing = set(res.get("missingChunks", []))
+        if missing:
+            self._upload_chunks(
+                opts, {c: chunks[c] for c in chunks if c in missing}
+            )
+            res = self._assemble(tag, checksum, order)
+
+        for _ in range(30):
+            if res.get("state") in ASSEMBLED_STATES:
+                return
+            if res.get("state") == "error":
+                break
+            time.sleep(1)
+            res = self._assemble(tag, checksum, order)
+
+        detail = res.get("detail") or res.get("state")
+        msg = f"failed to assemble sourcemaps for {tag}: {detail}"
+        raise RuntimeError(msg)
@@ -1,18 +1,143 @@
-from pathlib import Path
-from typing import Dict
+from release import tracing
+
+from typing import Dict, List, Mapping, Optional, Set
 import os
+import re
 import subprocess
 
+# Anything we can't be sure of evaluating the same way bash would (expansions,
+# command substitution, control flow, ...) sends the script to the fallback.
+ASSIGNMENT_REGEX = re.compile(
+    r"""
+    ^(?P<export>export\s+)?
+    (?P<key>[A-Za-z_][A-Za-z0-9_]*)=
+    (?:
+        '(?P<single>[^']*)'
+        | "(?P<double>(?:[^"\\$`]|\\["\\$`])*)"
+        | (?P<bare>[^\s'"\\$`;&|<>()\#~]*)
+    )
+    (?:\s+\#.*)?$
+    """,
+    re.VERBOSE,
+)
+DOUBLE_QUOTE_ESCAPE = re.compile(r"\\([\"\\$`])")
+
+# Sources each script (read from stdin, NUL-terminated, so no secret ends up
+# on a command line) in its own subshell and prints its environment, with an
+# empty record marking the end of each one. The first record set is the
+# baseline environment before any sourcing.
+BATCH_SOURCE = """
+env -0; printf '\\0'
+while IFS= read -r -d '' __script; do
+    ( source /dev/stdin <<<"$__script" >&2 && env -0 ) || exit $?
+    printf '\\0'
+done
+"""
+
+# Set by bash itself as a side effect of running the script.
+IGNORED_VARS = {"_", "SHLVL"}
+
+
+def parse_env(script: str) -> Optional[Dict[str, str]]:
+    """
+    Parses a file of simple `[export ]KEY=value` assignments without a shell.
+
+    Like sourcing it, only gives the variables it exports (and only those it
+    changes). Returns None if the file uses any syntax beyond that, in which
+    case it needs to be sourced by bash.
+    """
+    env: Dict[str, str] = {}
+    exported: Set[str] = set()
+    for line in script.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        match = ASSIGNMENT_REGEX.match(line)
+        if not match:
+            return None
+
+        if match["single"] is not None:
+            value = match["single"]
+        elif match["double"] is not None:
+            value = DOUBLE_QUOTE_ESCAPE.sub(r"\1", match["double"])
+        else:
+            value = match["bare"]
+
+        key = match["key"]
+        if match["export"]:
+            exported.add(key)
+        elif key not in exported:
+            if key in os.environ:
+                # Already exported, by whoever started us
+                return None
+            # Just a shell variable
+            continue
+        env[key] = value
+
+    return {k: v for (k, v) in env.items() if os.environ.get(k) != v}
+
+
+def _parse_env_records(output: bytes) -> List[Dict[str, str]]:
+    groups: List[Dict[str, str]] = [{}]
+    # Every record (including the empty separators) is NUL-terminated
+    for record in output.decode().split("\0")[:-1]:
+        if not record:
+            groups.append({})
+            continue
+
+        (key, _, value) = record.partition("=")
+        groups[-1][key] = value
+
+    # The final separator opens a group that never gets any records
+    return groups[:-1]
+
+
+def _bash_source(scripts: Mapping[str, bytes]) -> Dict[str, Dict[str, str]]:
+    names = list(scripts)
+    stdin = b"".join(s + b"\0" for s in scripts.values())
+    cmd = ["bash", "-c", BATCH_SOURCE]
+
+    res = tracing.run(cmd, stdout=subprocess.PIPE, input=stdin)
+    (base, *envs) = _parse_env_records(res.stdout)
+    if res.returncode != 0:
+        err = subprocess.CalledProcessError(res.returncode, cmd[:2])
+        # Every script before the failing one has printed its environment
+        err.add_note(f"while sourcing {names[len(envs)]}")
+        raise err
+
+    new_envs = {}
+    for name, env in zip(names, envs):
+        new_envs[name] = {
+            k: v
+            for (k, v) in env.items()
+            if base.get(k) != v and k not in IGNORED_VARS
+        }
+
+    return new_envs
+
+
+def source_scripts(scripts: Mapping[str, bytes]) -> Dict[str, Dict[str, str]]:
+    """
+    Returns the variables set by each of the given named scripts.
+
+    Simple assignment files are parsed natively; any scripts needing a real
+    shell are sourced together by a single bash process.
+    """
+    results: Dict[str, Dict[str, str]] = {}
+    fallback: Dict[str, bytes] = {}
+    for name, script in scripts.items():
+        env = parse_env(script.decode())
+        if env is None:
+            fallback[name] = script
+        else:
+            results[name] = env
 
-# https://stackoverflow.com/a/3505826
-def source_file(shell_path: Path) -> Dict[str, str]:
-    cmd = ["bash", "-c", f"source {shell_path} && env"]
-    start_env = dict(**os.environ)
+    if fallback:
+        results.update(_bash_source(fallback))
 
-    output = subprocess.check_output(cmd, env=start_env)
+    return {name: results[name] for name in scripts}
 
-    ps = [line.strip().partition("=") for line in output.decode().splitlines()]
 
-    new_env_set = {(key, value) for (key, _, value) in ps}
-    start_env_set = {_ for _ in start_env.items()}
-    return dict(new_env_set - start_env_set)
+def source_script(script: bytes) -> Dict[str, str]:
+    return source_scripts({"<script>": script})["<script>"]
@@ -0,0 +1,539 @@
+"""
+Works out what a built bundle is made of, from its sourcemap.
+
+The sourcemap is memory-mapped and scanned with regular expressions rather
+than parsed as JSON: the embedded sourcesContent is usually most of it, and
+we only need `sources` and `mappings`.
+"""
+
+from release.utils import atomic_write, atomic_writer
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    IO,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+import contextlib
+import json
+import mmap
+import os
+import re
+import subprocess
+import zlib
+
+if TYPE_CHECKING:
+    from release.release_mgmt.git import Git
+
+REPORT_FORMAT = 1
+
+# Bytes that the sourcemap doesn't attribute to any source
+UNMAPPED = "<unmapped>"
+FIRST_PARTY = "<first-party>"
+
+BASE64 = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+VLQ_DIGITS = [BASE64.find(bytes([b])) for b in range(256)]
+
+# NOTE: the lookbehind skips the same text inside an (escaped) source
+SOURCES_REGEX = re.compile(rb'(?<!\\)"sources"\s*:\s*\[\s*')
+STRING_REGEX = re.compile(rb'"([^"\\]*(?:\\.[^"\\]*)*)"\s*([,\]])\s*')
+MAPPINGS_REGEX = re.compile(rb'(?<!\\)"mappings"\s*:\s*"')
+SEGMENT_REGEX = re.compile(rb'[A-Za-z0-9+/]+|[,;"]')
+WHITESPACE_REGEX = re.compile(rb"\s*")
+RAW_STRING_REGEX = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+LITERAL_REGEX = re.compile(rb"[-+.0-9eE]+|true|false|null")
+
+
+class SourcemapError(ValueError):
+    pass
+
+
+class BudgetExceeded(RuntimeError):
+    def __init__(self, size: int, budget: int):
+        super().__init__(
+            f"bundle is {size:,} bytes gzipped, over the budget of "
+            f"{budget:,} bytes"
+        )
+        self.size = size
+        self.budget = budget
+
+
+@contextlib.contextmanager
+def _mapped(path: Path) -> Iterator[Any]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap refuses empty files
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield m
+
+
+def decode_vlq(segment: bytes) -> List[int]:
+    values = []
+    value = shift = 0
+    for byte in segment:
+        digit = VLQ_DIGITS[byte]
+        value += (digit & 31) << shift
+        if digit & 32:
+            shift += 5
+        else:
+            values.append(-(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+
+    return values
+
+
+def read_sources(data: Any) -> List[str]:
+    m = SOURCES_REGEX.search(data)
+    if not m:
+        raise SourcemapError("no sources in sourcemap")
+
+    sources: List[str] = []
+    pos = m.end()
+    if data[pos : pos + 1] == b"]":
+        return sources
+
+    while True:
+        m = STRING_REGEX.match(data, pos)
+        if not m:
+            raise SourcemapError(f"malformed sources at byte {pos}")
+        sources.append(json.loads(b'"' + m.group(1) + b'"'))
+        pos = m.end()
+        if m.group(2) == b"]":
+            return sources
+
+
+def line_starts(bundle: Any) -> List[int]:
+    starts = [0]
+    pos = bundle.find(b"\n")
+    while pos >= 0:
+        starts.append(pos + 1)
+        pos = bundle.find(b"\n", pos + 1)
+
+    return starts
+
+
+def attribute(
+    data: Any, starts: Sequence[int], size: int
+) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yields (start, end, source index) for each run of the bundle mapped to
+    one source, with index -1 for bytes no source claims.
+
+    Generated columns are treated as byte offsets, which holds for esbuild
+    output since it escapes non-ASCII characters by default.
+    """
+    m = MAPPINGS_REGEX.search(data)
+    if not m:
+        raise SourcemapError("no mappings in sourcemap")
+
+    line = 0
+    column = 0
+    source = 0
+    # Minified code repeats a lot of segments
+    decoded: Dict[bytes, List[int]] = {}
+    # Where the last segment started, and who it belongs to
+    (prev, owner) = (starts[0], -1)
+
+    def line_end(n: int) -> int:
+        return starts[n + 1] if n + 1 < len(starts) else size
+
+    for token in SEGMENT_REGEX.finditer(data, m.end()):
+        segment = token.group()
+        if segment == b",":
+            continue
+        if segment == b'"':
+            break
+        if segment == b";":
+            if line >= len(starts):
+                break
+            yield (prev, line_end(line), owner)
+            line += 1
+            column = 0
+            (prev, owner) = (line_end(line - 1), -1)
+            continue
+
+        fields = decoded.get(segment)
+        if fields is None:
+            fields = decoded[segment] = decode_vlq(segment)
+        column += fields[0]
+        if len(fields) >= 4:
+            source += fields[1]
+            new_owner = source
+        else:
+            new_owner = -1
+        # Consecutive segments from the same source make one range
+        if new_owner == owner or line >= len(starts):
+            continue
+
+        offset = min(starts[line] + column, line_end(line))
+        yield (prev, offset, owner)
+        (prev, owner) = (offset, new_owner)
+
+    if line < len(starts):
+        yield (prev, line_end(line), owner)
+        prev = line_end(line)
+    yield (prev, size, -1)
+
+
+def normalize_source(source: str) -> str:
+    source = source.removeprefix("webpack://")
+    while source.startswith(("../", "./")):
+        source = source.split("/", 1)[1]
+    return source
+
+
+def package_of(module: str) -> str:
+    parts = module.split("/")
+    if "node_modules" not in parts:
+        return FIRST_PARTY if module != UNMAPPED else UNMAPPED
+
+    # The innermost node_modules, for nested dependencies
+    i = len(parts) - 1 - parts[::-1].index("node_modules")
+    name = parts[i + 1] if i + 1 < len(parts) else module
+    if name.startswith("@") and i + 2 < len(parts):
+        name = f"{name}/{parts[i + 2]}"
+    return name
+
+
+def gzip_size(data: bytes) -> int:
+    # Cloudflare's size limits are on the gzipped script
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return len(compressor.compress(data) + compressor.flush())
+
+
+@dataclass
+class Size:
+    raw: int = 0
+    gzip: int = 0
+
+
+@dataclass
+class SizeReport:
+    total: Size
+    modules: Dict[str, int] = field(default_factory=dict)
+    packages: Dict[str, Size] = field(default_factory=dict)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "format": REPORT_FORMAT,
+            "total": [self.total.raw, self.total.gzip],
+            "modules": self.modules,
+            "packages": {
+                name: [s.raw, s.gzip] for (name, s) in self.packages.items()
+            },
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "SizeReport":
+        return cls(
+            total=Size(*data["total"]),
+            modules=data["modules"],
+            packages={n: Size(*s) for (n, s) in data["packages"].items()},
+        )
+
+
+def analyze(
+    bundle_path: Path,
+    sourcemap_path: Path,
+    max_workers: Optional[int] = None,
+) -> SizeReport:
+    """
+    Attributes every byte of the bundle to a source module, and groups
+    modules by package (node_modules) to get gzipped sizes.
+    """
+    with _mapped(sourcemap_path) as data, _mapped(bundle_path) as bundle:
+        sources = [normalize_source(s) for s in read_sources(data)]
+        size = len(bundle)
+
+        # Modules and packages by source index, with -1 as unmapped
+        modules = [*sources, UNMAPPED]
+        packages = [package_of(m) for m in modules]
+        module_sizes = [0] * len(modules)
+        ranges: Dict[str, List[Tuple[int, int]]] = {}
+        for (start, end, index) in attribute(data, line_starts(bundle), size):
+            if end <= start:
+                continue
+            if index >= len(sources):
+                index = -1
+            module_sizes[index] += end - start
+            ranges.setdefault(packages[index], []).append((start, end))
+
+        def compress(name: str) -> Tuple[str, Size]:
+            content = b"".join(bundle[s:e] for (s, e) in ranges[name])
+            return (name, Size(len(content), gzip_size(content)))
+
+        # NOTE: zlib releases the GIL, so threads compress in parallel
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            total = pool.submit(gzip_size, bundle[:])
+            package_sizes = dict(pool.map(compress, ranges))
+            total_size = Size(size, total.result())
+
+    # Sources can repeat after normalizing
+    by_module: Dict[str, int] = {}
+    for (module, raw) in zip(modules, module_sizes):
+        if raw:
+            by_module[module] = by_module.get(module, 0) + raw
+
+    return SizeReport(
+        total_size,
+        dict(sorted(by_module.items(), key=lambda kv: -kv[1])),
+        dict(sorted(package_sizes.items(), key=lambda kv: -kv[1].raw)),
+    )
+
+
+def check_budget(report: SizeReport, budget: Optional[int]) -> None:
+    if budget is not None and report.total.gzip > budget:
+        raise BudgetExceeded(report.total.gzip, budget)
+
+
+def report_path(git_dir: Path, tag: str) -> Path:
+    return git_dir / "release" / "sizes" / f"{tag}.json"
+
+
+def load_report(path: Path) -> Optional[SizeReport]:
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if data.get("format") != REPORT_FORMAT:
+        return None
+    return SizeReport.from_json(data)
+
+
+def store_report(path: Path, report: SizeReport) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(path, json.dumps(report.to_json()))
+
+
+def module_changes(
+    before: SizeReport, after: SizeReport
+) -> List[Tuple[str, int]]:
+    names = before.modules.keys() | after.modules.keys()
+    changes = [
+        (n, after.modules.get(n, 0) - before.modules.get(n, 0))
+        for n in names
+    ]
+    return sorted(
+        (c for c in changes if c[1]), key=lambda c: (-abs(c[1]), c[0])
+    )
+
+
+@dataclass
+class Analysis:
+    report: SizeReport
+    # The report recorded for the last release, if we have one
+    previous: Optional[SizeReport] = None
+    previous_tag: Optional[str] = None
+
+    def summary(self, top: int = 10) -> str:
+        total = self.report.total
+        lines = [f"bundle: {total.raw:,} bytes ({total.gzip:,} gzipped)"]
+
+        lines.append(f"  {'package':<40}{'bytes':>12}{'gzipped':>12}")
+        for name, size in list(self.report.packages.items())[:top]:
+            lines.append(f"  {name[:39]:<40}{size.raw:>12,}{size.gzip:>12,}")
+
+        lines.append(f"  {'largest modules':<40}{'bytes':>12}")
+        for name, raw in list(self.report.modules.items())[:top]:
+            lines.append(f"  {name[-39:]:<40}{raw:>12,}")
+
+        if self.previous is None:
+            return "\n".join(lines)
+
+        delta = total.gzip - self.previous.total.gzip
+        lines.append(f"since {self.previous_tag}: {delta:+,} bytes gzipped")
+        for name, change in module_changes(self.previous, self.report)[:top]:
+            lines.append(f"  {name[-39:]:<40}{change:>+12,}")
+
+        return "\n".join(lines)
+
+
+def last_release_report(git: "Git") -> Tuple[Optional[str], Optional[Path]]:
+    """
+    Where the report for the latest release tag reachable from HEAD is (or
+    would be) kept.
+    """
+    from release.release_mgmt.version_index import VersionIndex
+
+    version = VersionIndex.for_git(git).latest()
+    if version is None:
+        return (None, None)
+
+    tag = f"v{version.version_string()}"
+    return (tag, report_path(git.snapshot().git_dir, tag))
+
+
+def _skip_whitespace(data: Any, pos: int) -> int:
+    match = WHITESPACE_REGEX.match(data, pos)
+    # NOTE: `\s*` always matches, if only the empty string
+    return match.end() if match else pos
+
+
+def _expect(data: Any, pos: int, char: bytes) -> int:
+    if data[pos : pos + 1] != char:
+        raise SourcemapError(f"expected {char!r} at byte {pos}")
+    return _skip_whitespace(data, pos + 1)
+
+
+def _value_end(data: Any, pos: int) -> int:
+    """
+    Finds where the JSON value starting at pos ends, without decoding it.
+    """
+    char = data[pos : pos + 1]
+    if char not in (b"[", b"{"):
+        regex = RAW_STRING_REGEX if char == b'"' else LITERAL_REGEX
+        m = regex.match(data, pos)
+        if not m:
+            raise SourcemapError(f"malformed value at byte {pos}")
+        return m.end()
+
+    close = b"]" if char == b"[" else b"}"
+    pos = _skip_whitespace(data, pos + 1)
+    while data[pos : pos + 1] != close:
+        if char == b"{":
+            pos = _skip_whitespace(data, _value_end(data, pos))
+            pos = _expect(data, pos, b":")
+        pos = _skip_whitespace(data, _value_end(data, pos))
+        if data[pos : pos + 1] == b",":
+            pos = _skip_whitespace(data, pos + 1)
+        elif data[pos : pos + 1] != close:
+            raise SourcemapError(f"expected , or {close!r} at byte {pos}")
+
+    return pos + 1
+
+
+@dataclass
+class SlimResult:
+    before: int
+    after: int
+    # How many sources lost their sourcesContent
+    dropped: int
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+    def __str__(self) -> str:
+        return (
+            f"sourcemap slimmed from {self.before:,} to {self.after:,} bytes "
+            f"(saved {self.saved:,}; dropped content of {self.dropped} "
+            "third-party sources)"
+        )
+
+
+def is_first_party(source: str) -> bool:
+    return package_of(normalize_source(source)) == FIRST_PARTY
+
+
+def _write_contents(
+    data: Any, pos: int, out: IO[bytes], keep: Sequence[bool]
+) -> Tuple[int, int]:
+    # Element by element, so no source is ever decoded
+    dropped = 0
+    out.write(b"[")
+    pos = _expect(data, pos, b"[")
+    i = 0
+    while data[pos : pos + 1] != b"]":
+        end = _value_end(data, pos)
+        if i:
+            out.write(b",")
+        if i < len(keep) and keep[i]:
+            out.write(data[pos:end])
+        else:
+            out.write(b"null")
+            if data[pos:end] != b"null":
+                dropped += 1
+
+        pos = _skip_whitespace(data, end)
+        if data[pos : pos + 1] == b",":
+            pos = _skip_whitespace(data, pos + 1)
+        i += 1
+
+    out.write(b"]")
+    return (pos + 1, dropped)
+
+
+def slim(
+    sourcemap_path: Path,
+    dest: Path,
+    keep_content: Callable[[str], bool] = is_first_party,
+) -> SlimResult:
+    """
+    Writes a copy of the sourcemap to dest with normalized source paths,
+    and sourcesContent only for the sources `keep_content` accepts (our own
+    code, by default).
+
+    Mappings are copied untouched, so stack traces still resolve to every
+    source; dropped sources just don't get context lines.
+    """
+    dropped = 0
+    with _mapped(sourcemap_path) as data, atomic_writer(dest) as out:
+        sources = read_sources(data)
+        keep = [keep_content(s) for s in sources]
+
+        pos = _expect(data, _skip_whitespace(data, 0), b"{")
+        out.write(b"{")
+        first = True
+        while data[pos : pos + 1] != b"}":
+            if not first:
+                out.write(b",")
+            first = False
+
+            key_end = _value_end(data, pos)
+            key = json.loads(data[pos:key_end])
+            out.write(data[pos:key_end] + b":")
+            pos = _expect(data, _skip_whitespace(data, key_end), b":")
+
+            if key == "sources":
+                normalized = [normalize_source(s) for s in sources]
+                out.write(json.dumps(normalized).encode())
+                pos = _value_end(data, pos)
+            elif key == "sourcesContent":
+                (pos, dropped) = _write_contents(data, pos, out, keep)
+            else:
+                end = _value_end(data, pos)
+                out.write(data[pos:end])
+                pos = end
+
+            pos = _skip_whitespace(data, pos)
+            if data[pos : pos + 1] == b",":
+                pos = _skip_whitespace(data, pos + 1)
+
+        out.write(b"}")
+        result = SlimResult(len(data), out.tell(), dropped)
+
+    return result
+
+
+def analyze_release(
+    bundle_path: Path,
+    sourcemap_path: Path,
+    git: Optional["Git"] = None,
+) -> Analysis:
+    """
+    Analyzes the bundle, alongside the report kept for the last release if
+    there is one to compare with.
+    """
+    report = analyze(bundle_path, sourcemap_path)
+    if git is None:
+        return Analysis(report)
+
+    try:
+        (tag, path) = last_release_report(git)
+    except subprocess.CalledProcessError:
+        # e.g. no commits yet; there's nothing to compare with anyway
+        return Analysis(report)
+
+    previous = load_report(path) if path else None
+    return Analysis(report, previous, tag if previous else None)
@@ -0,0 +1,107 @@
+from release.agent import AgentClient, AgentServer, Store, socket_path
+from release.bench.environment import load_all
+from release.bench.fixtures import bench_env, git
+from release.environment import Environment
+from release.tracing import TRACER
+
+from pathlib import Path
+from unittest.mock import patch
+import os
+import stat
+import threading
+import unittest
+
+
+class TestStore(unittest.TestCase):
+    def test_expires(self):
+        store = Store(ttl=10)
+        with patch("time.monotonic", return_value=100):
+            store.put("repo", "key", {"a": 1})
+        with patch("time.monotonic", return_value=105):
+            self.assertEqual(store.get("repo", "key"), {"a": 1})
+        with patch("time.monotonic", return_value=111):
+            self.assertIsNone(store.get("repo", "key"))
+
+    def test_changed_key_drops_entry(self):
+        store = Store(ttl=10)
+        store.put("repo", "old", {"a": 1})
+
+        self.assertIsNone(store.get("repo", "new"))
+        self.assertIsNone(store.get("repo", "old"))
+
+
+class AgentTestCase(unittest.TestCase):
+    def start_agent(self) -> AgentServer:
+        # Called inside bench_env, which points RELEASE_AGENT_SOCK somewhere
+        # private to the test.
+        server = AgentServer(socket_path(), ttl=60)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.addCleanup(stop)
+        return server
+
+
+class TestAgent(AgentTestCase):
+    def test_round_trip_and_permissions(self):
+        with bench_env(age_latency=0):
+            self.assertIsNone(AgentClient.connect())
+            self.start_agent()
+
+            path = socket_path()
+            self.assertEqual(stat.S_IMODE(path.parent.stat().st_mode), 0o700)
+            self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o600)
+
+            client = AgentClient.connect()
+            assert client is not None
+            self.assertIsNone(client.get("repo", "key"))
+            client.put("repo", "key", {"token": "t"})
+            self.assertEqual(client.get("repo", "key"), {"token": "t"})
+
+    def test_refuses_shared_directory(self):
+        with bench_env(age_latency=0):
+            self.start_agent()
+            os.chmod(socket_path().parent, 0o755)
+
+            self.assertIsNone(AgentClient.connect())
+
+
+class TestEnvironmentWithAgent(AgentTestCase):
+    def decrypts(self) -> int:
+        TRACER.reset()
+        load_all(Environment.from_env())
+        return sum(1 for s in TRACER.spans if s.name == "age")
+
+    def test_reuses_credentials(self):
+        with bench_env(age_latency=0) as repo:
+            self.start_agent()
+
+            self.assertEqual(self.decrypts(), 3)
+            (repo / "wrangler.toml").unlink()
+            self.assertEqual(self.decrypts(), 0)
+            # Restored from the agent, but no more readable than decrypted
+            mode = (repo / "wrangler.toml").stat().st_mode
+            self.assertEqual(mode & 0o777, 0o600)
+
+            env = Environment.from_env()
+            self.assertEqual(env.cf.token, "bench-token")
+            self.assertTrue(env.wrangler_toml_path.exists())
+
+    def test_changed_secret_invalidates(self):
+        with bench_env(age_latency=0) as repo:
+            self.start_agent()
+            self.decrypts()
+
+            secret = Path("secrets") / "cf_authn.sh.age"
+            rotated = (repo / secret).read_bytes().replace(b"bench-", b"new-")
+            (repo / secret).write_bytes(rotated)
+            git(repo, "commit", "-qam", "rotate")
+
+            # Only the rotated secret is decrypted again
+            self.assertEqual(self.decrypts(), 1)
+            self.assertEqual(Environment.from_env().cf.token, "new-token")
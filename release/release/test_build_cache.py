@@ -0,0 +1,90 @@
+from release.build_cache import BuildCache
+
+from pathlib import Path
+from unittest.mock import patch
+import os
+import tempfile
+import unittest
+
+ARGS = ["deploy", "--minify", "src/index.ts"]
+
+
+class TestBuildCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self._tmp.name)
+
+        self.proj = tmp / "proj"
+        (self.proj / "src" / "lib").mkdir(parents=True)
+        (self.proj / "src" / "index.ts").write_text("export {}")
+        (self.proj / "src" / "lib" / "util.ts").write_text("export {}")
+        (self.proj / "yarn.lock").write_text("# lock")
+        self.node_modules = tmp / "node_modules"
+        self.node_modules.mkdir()
+
+        self.out = tmp / "out"
+        self.out.mkdir()
+        (self.out / "index.js").write_text("bundle")
+        (self.out / "index.js.map").write_text("{}")
+
+        self.cache = BuildCache(tmp / "cache")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def key(self) -> str:
+        return self.cache.key(self.proj, self.node_modules, ARGS)
+
+    def test_key_tracks_inputs(self):
+        key = self.key()
+        self.assertEqual(self.key(), key)
+
+        (self.proj / "src" / "lib" / "util.ts").write_text("export { x }")
+        changed_src = self.key()
+        self.assertNotEqual(changed_src, key)
+
+        (self.proj / "yarn.lock").write_text("# lock 2")
+        changed_lock = self.key()
+        self.assertNotEqual(changed_lock, changed_src)
+
+        (self.proj / "wrangler.toml").write_text('name = "other"\n')
+        self.assertNotEqual(self.key(), changed_lock)
+
+        args_key = self.cache.key(self.proj, self.node_modules, ARGS[:-1])
+        self.assertNotEqual(args_key, self.key())
+
+    def test_round_trip(self):
+        key = self.key()
+        dest = Path(self._tmp.name) / "dest"
+        self.assertFalse(self.cache.restore(key, dest))
+
+        self.cache.store(key, self.out)
+        self.assertTrue(self.cache.restore(key, dest))
+        self.assertEqual((dest / "index.js").read_text(), "bundle")
+
+    def test_eviction_drops_least_recent(self):
+        cache = BuildCache(Path(self._tmp.name) / "small", max_bytes=20)
+        cache.store("old", self.out)
+        entry = Path(self._tmp.name) / "small" / "entries" / "old"
+        os.utime(entry, (0, 0))
+
+        cache.store("new", self.out)
+        cache.store("newer", self.out)
+
+        dest = Path(self._tmp.name) / "dest"
+        self.assertFalse(cache.restore("old", dest))
+        self.assertTrue(cache.restore("newer", dest))
+
+    def test_size(self):
+        env = {
+            "RELEASE_BUILD_CACHE": str(Path(self._tmp.name) / "env"),
+            "RELEASE_BUILD_CACHE_SIZE": "512M",
+        }
+        with patch.dict("os.environ", env):
+            with self.assertRaises(ValueError):
+                BuildCache.from_env()
+
+            # As given on the command line, instead
+            cache = BuildCache.from_env(1024)
+            assert cache
+            self.assertEqual(cache._max_bytes, 1024)
@@ -0,0 +1,291 @@
+from release.deploy import UNCHANGED, deploy_graph, target_summary
+from release.environment import Environment
+from release.manifest import DeployRecord, LocalManifest, bundle_digest
+from release.release_mgmt.git import Git, Snapshot
+from release.release_mgmt.manager import ReleaseManager
+from release.release_mgmt.version_index import VersionIndex
+from release.scheduler import StepFailed
+from release.sentry import CommitRange, SentryClient
+from release.sourcemap import BudgetExceeded, load_report, report_path
+from release.wrangler import Wrangler
+
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+
+class TestDeployGraph(unittest.TestCase):
+    def setUp(self):
+        self.env = MagicMock(spec=Environment)
+        self.env.git = MagicMock(spec=Git)
+        self.env.git.branch.return_value = "release/0.3"
+        self.env.git.get_tags.return_value = ["v0.3.0"]
+        self.env.git.commit_hash.return_value = "abc123"
+        self.sentry = MagicMock(spec=SentryClient)
+        self.wrangler = MagicMock(spec=Wrangler)
+
+    def graph(self, release_mode: str, **kwargs):
+        return deploy_graph(
+            self.env,
+            self.sentry,
+            self.wrangler,
+            release_mode,
+            "patch",
+            Path("index.js"),
+            Path("index.js.map"),
+            ReleaseManager(self.env.git, VersionIndex(self.env.git)),
+            **kwargs,
+        )
+
+    def test_staging_only_deploys(self):
+        report = self.graph("staging").run()
+
+        self.assertEqual(list(report.results), ["wrangler_deploy[staging]"])
+        self.wrangler.deploy.assert_called_once_with(
+            "staging", Path("index.js")
+        )
+        self.env.git.tag.assert_not_called()
+
+    def test_production(self):
+        self.graph("production").run()
+
+        self.env.git.tag.assert_called_once_with("v0.3.1")
+        self.env.git.assert_clean.assert_called_once()
+        self.env.git.push.assert_called_once_with(refs=["refs/tags/v0.3.1"])
+        self.env.git.log.assert_called_once_with("v0.3.0", "abc123")
+        self.sentry.create_release.assert_called_once_with(
+            commit="abc123",
+            tag="v0.3.1",
+            commits=CommitRange("v0.3.0", self.env.git.log.return_value),
+        )
+        self.sentry.upload_sourcemaps.assert_called_once_with(
+            "v0.3.1", Path("index.js"), Path("index.js.map")
+        )
+        self.wrangler.deploy.assert_called_once_with(
+            "production", Path("index.js")
+        )
+
+    def test_fans_out_to_targets(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def deploy(target, bundle_path, log=None):
+            with lock:
+                running.append(target)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(target)
+            log.write(f"deployed {target}\n".encode())
+
+        self.wrangler.deploy.side_effect = deploy
+        targets = ["production", "eu", "us", "apac"]
+        with tempfile.TemporaryDirectory() as tmp:
+            log_dir = Path(tmp)
+            report = self.graph(
+                "production",
+                targets=targets,
+                max_parallel=2,
+                log_dir=log_dir,
+            ).run()
+
+            self.assertEqual(
+                (log_dir / "wrangler-eu.log").read_text(), "deployed eu\n"
+            )
+            self.assertIn("eu", target_summary(report, targets, log_dir))
+
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(self.wrangler.deploy.call_count, 4)
+        # Still only one release
+        self.env.git.tag.assert_called_once_with("v0.3.1")
+        self.sentry.create_release.assert_called_once()
+
+    def test_reports_failed_target(self):
+        def deploy(target, bundle_path, log=None):
+            if target == "eu":
+                raise RuntimeError("upload failed")
+
+        self.wrangler.deploy.side_effect = deploy
+        targets = ["production", "eu"]
+        with self.assertRaises(StepFailed) as ctx:
+            self.graph("production", targets=targets).run()
+
+        summary = target_summary(ctx.exception.report, targets)
+        (production, eu) = summary.splitlines()
+        self.assertIn("ok", production)
+        self.assertIn("failed", eu)
+
+    def test_size_budget(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            git_dir = Path(tmp) / ".git"
+            self.env.git.snapshot.return_value = Snapshot(
+                Path(tmp), git_dir, "abc123", "release/0.3"
+            )
+            bundle = Path(tmp) / "index.js"
+            bundle.write_text("export default {};\n")
+            sourcemap = Path(tmp) / "index.js.map"
+            sourcemap.write_text(
+                '{"version":3,"sources":["src/index.ts"],"mappings":"AAAA"}'
+            )
+
+            def graph(budget):
+                return deploy_graph(
+                    self.env,
+                    self.sentry,
+                    self.wrangler,
+                    "production",
+                    "patch",
+                    bundle,
+                    sourcemap,
+                    ReleaseManager(self.env.git, VersionIndex(self.env.git)),
+                    size_budget=budget,
+                )
+
+            with self.assertRaises(StepFailed) as ctx:
+                graph(10).run()
+            self.assertIsInstance(
+                ctx.exception.report.failed[0].error, BudgetExceeded
+            )
+            self.env.git.tag.assert_not_called()
+            self.wrangler.deploy.assert_not_called()
+
+            graph(1024).run()
+            report = load_report(report_path(git_dir, "v0.3.1"))
+            assert report
+            self.assertEqual(report.modules, {"src/index.ts": 19})
+
+    def test_slims_sourcemap(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sourcemap = Path(tmp) / "index.js.map"
+            sourcemap.write_text(
+                '{"version":3,"sources":["node_modules/a/a.js"],'
+                '"sourcesContent":["var a;"],"mappings":"AAAA"}'
+            )
+            slim_dir = Path(tmp) / "slim"
+            slim_dir.mkdir()
+            graph = deploy_graph(
+                self.env,
+                self.sentry,
+                self.wrangler,
+                "production",
+                "patch",
+                Path("index.js"),
+                sourcemap,
+                ReleaseManager(self.env.git, VersionIndex(self.env.git)),
+                slim_dir=slim_dir,
+            )
+            report = graph.run()
+
+        self.assertEqual(report.results["slim_sourcemap"].value.dropped, 1)
+        self.sentry.upload_sourcemaps.assert_called_once_with(
+            "v0.3.1", Path("index.js"), slim_dir / "index.js.map"
+        )
+
+    def test_migrates_before_tagging(self):
+        order = []
+        self.wrangler.d1_execute.side_effect = (
+            lambda *args, **kwargs: order.append("d1") or [{"results": []}]
+        )
+        self.env.git.tag.side_effect = lambda tag: order.append("tag")
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / "migrations").mkdir()
+            (Path(tmp) / "migrations" / "0000_a.sql").write_text(
+                "CREATE TABLE a (id INTEGER);"
+            )
+            self.env.git.root.return_value = Path(tmp)
+            report = self.graph(
+                "production", targets=["production", "eu"], database="db"
+            ).run()
+
+        self.assertEqual(
+            [m.name for m in report.results["migrate[eu]"].value],
+            ["0000_a.sql"],
+        )
+        # A lookup and a batch per target, all before the tag
+        self.assertEqual(order, ["d1"] * 4 + ["tag"])
+
+
+class TestUnchangedBundle(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self._tmp.name)
+        self.bundle = tmp / "index.js"
+        self.bundle.write_text("export default {};\n")
+        self.sourcemap = tmp / "index.js.map"
+        self.sourcemap.write_text('{"version":3,"mappings":""}')
+        self.manifest = LocalManifest(tmp / "deploys.json")
+        self.digest = bundle_digest(self.bundle, self.sourcemap)
+
+        self.env = MagicMock(spec=Environment)
+        self.env.git = MagicMock(spec=Git)
+        self.env.git.branch.return_value = "release/0.3"
+        self.env.git.get_tags.return_value = ["v0.3.0"]
+        self.env.git.commit_hash.return_value = "abc123"
+        self.sentry = MagicMock(spec=SentryClient)
+        self.wrangler = MagicMock(spec=Wrangler)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def graph(self, release_mode: str, **kwargs):
+        return deploy_graph(
+            self.env,
+            self.sentry,
+            self.wrangler,
+            release_mode,
+            "patch",
+            self.bundle,
+            self.sourcemap,
+            ReleaseManager(self.env.git, VersionIndex(self.env.git)),
+            manifest=self.manifest,
+            **kwargs,
+        )
+
+    def deployed(self, target: str, digest: str) -> None:
+        self.manifest.put(target, DeployRecord(digest, "v0.3.0", 0.0))
+
+    def test_records_uploads(self):
+        self.graph("production").run()
+
+        record = self.manifest.get("production")
+        assert record
+        self.assertEqual(
+            (record.digest, record.version), (self.digest, "v0.3.1")
+        )
+
+    def test_skips_unchanged_target(self):
+        self.deployed("staging", self.digest)
+        report = self.graph("staging").run()
+
+        result = report.results["wrangler_deploy[staging]"]
+        self.assertEqual(result.value, UNCHANGED)
+        self.wrangler.deploy.assert_not_called()
+        self.assertIn(UNCHANGED, target_summary(report, ["staging"]))
+
+    def test_uploads_changed_targets_only(self):
+        self.deployed("production", self.digest)
+        self.deployed("eu", "stale")
+        report = self.graph("production", targets=["production", "eu"]).run()
+
+        self.wrangler.deploy.assert_called_once_with("eu", self.bundle)
+        self.assertIn("upload_sourcemaps", report.results)
+
+    def test_production_still_releases(self):
+        self.deployed("production", self.digest)
+        report = self.graph("production").run()
+
+        self.wrangler.deploy.assert_not_called()
+        self.assertNotIn("upload_sourcemaps", report.results)
+        # A new version of the same bundle is still a release
+        self.env.git.tag.assert_called_once_with("v0.3.1")
+        self.sentry.create_release.assert_called_once()
+
+    def test_force(self):
+        self.deployed("staging", self.digest)
+        self.graph("staging", force=True).run()
+
+        self.wrangler.deploy.assert_called_once_with("staging", self.bundle)
@@ -0,0 +1,90 @@
+from release.__main__ import EXIT_SUPERSEDED, cli
+from release.bench.fixtures import bench_env
+from release.deploy_queue import DeployQueue, Superseded, Ticket
+
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import patch
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+
+class TestDeployQueue(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.queue = DeployQueue(Path(self._tmp.name), poll_interval=0.01)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def request(self, key: str, outcomes: Dict[str, str], name: str):
+        def run():
+            try:
+                with self.queue.admit(key):
+                    outcomes[name] = "deployed"
+            except Superseded:
+                outcomes[name] = "superseded"
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def wait_for_depth(self, depth: int) -> None:
+        deadline = time.monotonic() + 5
+        while self.queue.status().depth() < depth:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_newest_request_wins(self):
+        outcomes: Dict[str, str] = {}
+        threads: List[threading.Thread] = []
+        with self.queue.admit("staging") as first:
+            self.assertEqual(first.ahead, 0)
+
+            threads.append(self.request("staging", outcomes, "older"))
+            self.wait_for_depth(2)
+            threads.append(self.request("production", outcomes, "other"))
+            self.wait_for_depth(3)
+            threads.append(self.request("staging", outcomes, "newer"))
+
+            threads[0].join(timeout=5)
+            self.assertEqual(outcomes, {"older": "superseded"})
+
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(
+            outcomes,
+            {"older": "superseded", "other": "deployed", "newer": "deployed"},
+        )
+        self.assertEqual(self.queue.status().depth(), 0)
+
+    def test_dead_requests_are_pruned(self):
+        cmd = [sys.executable, "-c", "import os; print(os.getpid())"]
+        dead_pid = int(subprocess.check_output(cmd))
+
+        # A newer request that crashed mustn't supersede us (or count)
+        with self.queue._state() as state:
+            state.pending.append(Ticket(100, "staging", dead_pid, 0))
+
+        with self.queue.admit("staging") as admission:
+            self.assertEqual(admission.ahead, 0)
+
+
+class TestSupersededDeploy(unittest.TestCase):
+    def test_exit_status(self):
+        older = Ticket(1, "staging:staging", 1, 0.0)
+        newer = Ticket(2, "staging:staging", 2, 0.0)
+
+        def admit(self, key):
+            raise Superseded(older, newer)
+
+        argv = ["deploy", "staging", "patch", "index.js", "index.js.map"]
+        with bench_env(age_latency=0):
+            with patch.object(DeployQueue, "admit", admit):
+                status = cli.main(argv, standalone_mode=False)
+
+        self.assertEqual(status, EXIT_SUPERSEDED)
@@ -0,0 +1,42 @@
+from release.bench.fixtures import bench_env, git
+from release.environment import WRANGLER_SECRET, Environment
+from release.tracing import TRACER
+
+import unittest
+
+
+class TestEnvironment(unittest.TestCase):
+    def test_from_env_loads_all_secrets(self):
+        with bench_env(age_latency=0) as repo:
+            env = Environment.from_env()
+
+            self.assertEqual(env.cf.token, "bench-token")
+            self.assertEqual(env.sentry.org, "bench-org")
+            self.assertEqual(env.wrangler_toml_path, repo / "wrangler.toml")
+            self.assertTrue(env.wrangler_toml_path.exists())
+
+    def test_failing_secret_is_reported(self):
+        with bench_env(age_latency=0) as repo:
+            git(repo, "rm", "-q", "secrets/sentry_authn.sh.age")
+            TRACER.reset()
+
+            with self.assertRaises(AssertionError) as ctx:
+                Environment.from_env()
+
+            notes = getattr(ctx.exception, "__notes__", [])
+            self.assertIn("while checking secret sentry_authn.sh", notes)
+            # Found before decrypting anything
+            self.assertFalse(any(s.name == "age" for s in TRACER.spans))
+
+    def test_only_decrypts_what_is_used(self):
+        with bench_env(age_latency=0) as repo:
+            git(repo, "rm", "-q", "secrets/sentry_authn.sh.age")
+
+            TRACER.reset()
+            env = Environment.from_env([WRANGLER_SECRET], concurrent=False)
+            env.wrangler()
+            decrypts = [s for s in TRACER.spans if s.name == "age"]
+            self.assertEqual(len(decrypts), 1)
+            self.assertTrue((repo / "wrangler.toml").exists())
+            with self.assertRaises(AssertionError):
+                env.sentry
@@ -0,0 +1,103 @@
+from release import execution
+from release.execution import Policy
+from release.tracing import TRACER
+
+from pathlib import Path
+import subprocess
+import tempfile
+import time
+import unittest
+
+# Fails (or with an argument, sleeps that long) the first time it's run in
+# a directory, and succeeds quickly after that.
+FLAKY = """
+if [ -e ran ]; then exit 0; fi
+touch ran
+if [ -n "$1" ]; then sleep "$1"; exit 0; fi
+exit 1
+"""
+
+
+class TestRun(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self._tmp.name)
+        self.addCleanup(execution.reset)
+        TRACER.reset()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def flaky(self, *args: str):
+        return ["sh", "-c", FLAKY, "flaky", *args]
+
+    def attempts(self):
+        return [s for s in TRACER.spans if s.args.get("step") == "step"]
+
+    def test_retries_idempotent_steps(self):
+        execution.configure({"step": Policy(attempts=2, backoff=0)})
+
+        execution.run("step", self.flaky(), cwd=self.dir)
+        self.assertEqual(len(self.attempts()), 2)
+
+    def test_gives_up(self):
+        policy = Policy(timeout=0.1, attempts=2, backoff=0)
+        execution.configure({"step": policy})
+
+        with self.assertRaises(subprocess.TimeoutExpired) as ctx:
+            execution.run("step", ["sleep", "5"])
+        notes = ctx.exception.__notes__
+        self.assertIn("step: gave up after 2 attempt(s)", notes)
+
+    def test_unsafe_steps_need_a_check(self):
+        execution.configure({"step": Policy(attempts=3, backoff=0)})
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            execution.run("step", self.flaky(), idempotent=False, cwd=self.dir)
+        self.assertEqual(len(self.attempts()), 1)
+
+        (self.dir / "ran").unlink()
+        TRACER.reset()
+        execution.run(
+            "step",
+            self.flaky(),
+            idempotent=False,
+            already_done=lambda: True,
+            cwd=self.dir,
+        )
+        self.assertEqual(len(self.attempts()), 1)
+
+    def test_hedges_slow_attempts(self):
+        execution.configure({"step": Policy(hedge_after=0.1)})
+
+        start = time.monotonic()
+        execution.run("step", self.flaky("5"), cwd=self.dir)
+        self.assertLess(time.monotonic() - start, 2)
+
+        hedges = [s.args.get("hedge") for s in self.attempts()]
+        self.assertIn(True, hedges)
+
+    def test_hedges_keep_their_output_apart(self):
+        execution.configure({"step": Policy(hedge_after=0.1)})
+        # Writes something before stalling, which mustn't reach the log
+        script = "[ -e ran ] && { echo fast; exit 0; }; touch ran; echo slow"
+        script += "; sleep 5"
+
+        with open(self.dir / "log", "w+b") as log:
+            execution.run(
+                "step", ["sh", "-c", script], cwd=self.dir, stdout=log
+            )
+            log.seek(0)
+            self.assertEqual(log.read(), b"fast\n")
+
+    def test_step_falls_back_to_base_policy(self):
+        execution.configure({"wrangler_deploy": Policy(attempts=5)})
+        execution.update_policy("wrangler_deploy[staging]", timeout=1)
+
+        self.assertEqual(
+            execution.policy_for("wrangler_deploy[staging]"),
+            Policy(timeout=1, attempts=5),
+        )
+        self.assertEqual(
+            execution.policy_for("wrangler_deploy[production]").attempts, 5
+        )
@@ -0,0 +1,105 @@
+from release.history import (
+    OK,
+    TOTAL,
+    History,
+    PhaseRecord,
+    attempt_phase,
+    percentile,
+    phase_records,
+    stats_table,
+)
+from release.tracing import Span
+
+from pathlib import Path
+import tempfile
+import unittest
+
+DAY = 86400.0
+
+
+class TestPhaseRecords(unittest.TestCase):
+    def test_sums_repeated_spans(self):
+        spans = [
+            Span("git push", "subprocess", 0.0, 1.0),
+            Span("git push", "subprocess", 1.0, 1.5, args={"error": "X"}),
+            Span("version_bump", "phase", 0.0, 0.25),
+        ]
+        records = {r.phase: r for r in phase_records(spans, total=2.0)}
+
+        self.assertEqual(records["git push"].duration, 1.5)
+        self.assertEqual(records["git push"].outcome, "X")
+        self.assertEqual(records["version_bump"].outcome, OK)
+        self.assertEqual(records[TOTAL], PhaseRecord("command", TOTAL, 2, "X"))
+
+    def test_keeps_each_attempt(self):
+        # A slow attempt, killed once its hedge succeeded
+        first = {"step": "deploy", "attempt": 1, "exit_code": -9}
+        hedge = {"step": "deploy", "attempt": 1, "hedge": True}
+        spans = [
+            Span("wrangler", "subprocess", 0.0, 3.0, args=first),
+            Span("wrangler", "subprocess", 1.0, 2.0, args=hedge),
+        ]
+        records = phase_records(spans, total=3.0)
+
+        phase = attempt_phase("deploy")
+        self.assertEqual(
+            [r for r in records if r.phase == phase],
+            [
+                PhaseRecord("attempt", phase, 3, "exit -9"),
+                PhaseRecord("attempt", phase, 1, OK),
+            ],
+        )
+        self.assertEqual(records[-3], PhaseRecord("command", TOTAL, 3, OK))
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.history = History(Path(self._tmp.name) / "history.sqlite3")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def record(self, at: float, duration: float, outcome: str = OK) -> None:
+        records = [PhaseRecord("phase", "upload", duration, outcome)]
+        self.history.record("deploy", "staging", "v1.0.0", records, at)
+
+    def test_percentiles(self):
+        for i in range(1, 101):
+            self.record(i, float(i))
+        self.record(101, 1000.0, outcome="TimeoutExpired")
+
+        [stats] = self.history.stats("deploy", now=101, recent=100)
+        self.assertEqual(stats.count, 100)
+        self.assertEqual((stats.p50, stats.p95, stats.p99), (50, 95, 99))
+        self.assertIsNone(stats.baseline)
+
+    def test_window(self):
+        self.record(0, 100.0)
+        self.record(40 * DAY, 1.0)
+
+        [stats] = self.history.stats("deploy", window_days=30, now=40 * DAY)
+        self.assertEqual(stats.count, 1)
+
+    def test_flags_regressions(self):
+        for i in range(10):
+            self.record(i, 1.0)
+        for i in range(10, 15):
+            self.record(i, 2.0)
+
+        [stats] = self.history.stats("deploy", recent=5, now=15)
+        self.assertEqual((stats.recent, stats.baseline), (2.0, 1.0))
+        self.assertTrue(stats.regressed())
+        self.assertIn("SLOWER", stats_table([stats]))
+
+        self.record(15, 1.0)
+        [stats] = self.history.stats("deploy", recent=5, now=15)
+        self.assertTrue(stats.regressed(threshold=0.5))
+        self.assertFalse(stats.regressed(threshold=1.5))
+
+
+class TestPercentile(unittest.TestCase):
+    def test_nearest_rank(self):
+        self.assertEqual(percentile([1.0], 99), 1.0)
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 50), 2.0)
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 95), 4.0)
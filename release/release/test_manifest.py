@@ -0,0 +1,42 @@
+from release.manifest import DeployRecord, LocalManifest, bundle_digest
+
+from pathlib import Path
+import tempfile
+import unittest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_round_trip(self):
+        path = self.dir / "release" / "deploys.json"
+        record = DeployRecord("abc", "v0.3.1", 1.0)
+        LocalManifest(path).put("production", record)
+        LocalManifest(path).put("eu", DeployRecord("def", None, 2.0))
+
+        manifest = LocalManifest(path)
+        self.assertEqual(manifest.get("production"), record)
+        self.assertEqual(manifest.get("eu"), DeployRecord("def", None, 2.0))
+        self.assertIsNone(manifest.get("staging"))
+
+    def test_unreadable_manifest_is_empty(self):
+        path = self.dir / "deploys.json"
+        path.write_text("{")
+        self.assertIsNone(LocalManifest(path).get("production"))
+
+    def test_digest(self):
+        (bundle, sourcemap) = (self.dir / "index.js", self.dir / "index.map")
+        bundle.write_text("ab")
+        sourcemap.write_text("c")
+        before = bundle_digest(bundle, sourcemap)
+        self.assertEqual(bundle_digest(bundle, sourcemap), before)
+
+        # The same bytes, split differently
+        bundle.write_text("a")
+        sourcemap.write_text("bc")
+        self.assertNotEqual(bundle_digest(bundle, sourcemap), before)
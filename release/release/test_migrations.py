@@ -0,0 +1,119 @@
+from release.migrations import (
+    TRACKING_TABLE,
+    MigrationError,
+    Migrator,
+    batch_sql,
+    dry_run,
+    load_migrations,
+)
+from release.wrangler import Wrangler
+
+from pathlib import Path
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+REPO_MIGRATIONS = Path(__file__).parents[2] / "migrations"
+
+
+class FakeD1:
+    """
+    Stands in for `wrangler d1 execute`, against a SQLite database.
+    """
+
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        self.files = []
+
+    def execute(self, database, env, command=None, file=None, remote=True):
+        if file is not None:
+            self.files.append(file.read_text())
+            self.conn.executescript(file.read_text())
+            return [{"results": [], "success": True}]
+
+        results = []
+        for statement in command.split(";"):
+            if statement.strip():
+                rows = self.conn.execute(statement).fetchall()
+                results.append({"results": [dict(r) for r in rows]})
+        return results
+
+    def tables(self):
+        query = "SELECT name FROM sqlite_master WHERE type = 'table'"
+        return {row["name"] for row in self.conn.execute(query)}
+
+
+class TestMigrator(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self._tmp.name)
+        self.d1 = FakeD1()
+        self.wrangler = MagicMock(spec=Wrangler)
+        self.wrangler.d1_execute.side_effect = self.d1.execute
+        self.migrator = Migrator(self.wrangler, "db", "production", self.dir)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write(self, name: str, sql: str) -> None:
+        (self.dir / name).write_text(sql)
+
+    def test_applies_pending_once(self):
+        self.write("0000_a.sql", "CREATE TABLE a (id INTEGER);")
+        self.write("0001_b.sql", "CREATE TABLE b (id INTEGER);")
+        self.write("README.md", "not a migration")
+
+        applied = self.migrator.migrate()
+        self.assertEqual(
+            [m.name for m in applied], ["0000_a.sql", "0001_b.sql"]
+        )
+        self.assertEqual(len(self.d1.files), 1)
+        self.assertLessEqual({"a", "b", TRACKING_TABLE}, self.d1.tables())
+
+        self.write("0002_c.sql", "CREATE TABLE c (id INTEGER);")
+        applied = self.migrator.migrate()
+        self.assertEqual([m.name for m in applied], ["0002_c.sql"])
+        self.assertEqual(self.migrator.migrate(), [])
+
+    def test_batches(self):
+        for i in range(5):
+            self.write(f"000{i}_t.sql", f"CREATE TABLE t{i} (id INTEGER);")
+
+        self.migrator.migrate(batch_size=2)
+        self.assertEqual(len(self.d1.files), 3)
+
+    def test_dry_run_catches_errors_first(self):
+        self.write("0000_a.sql", "CREATE TABLE a (id INTEGER);")
+        self.write("0001_b.sql", "ALTER TABLE missing ADD COLUMN x;")
+
+        with self.assertRaises(MigrationError):
+            self.migrator.migrate()
+        self.assertEqual(self.d1.files, [])
+
+    def test_rejects_modified_migration(self):
+        self.write("0000_a.sql", "CREATE TABLE a (id INTEGER);")
+        self.migrator.migrate()
+
+        self.write("0000_a.sql", "CREATE TABLE a (id TEXT);")
+        with self.assertRaisesRegex(MigrationError, "modified"):
+            self.migrator.migrate()
+
+    def test_baseline(self):
+        self.d1.conn.execute("CREATE TABLE a (id INTEGER)")
+        self.write("0000_a.sql", "CREATE TABLE a (id INTEGER);")
+        self.write("0001_b.sql", "CREATE TABLE b (id INTEGER);")
+
+        applied = self.migrator.migrate(baseline="0000_a.sql")
+        self.assertEqual([m.name for m in applied], ["0001_b.sql"])
+        self.assertEqual(
+            set(self.migrator.applied()), {"0000_a.sql", "0001_b.sql"}
+        )
+
+
+class TestRepoMigrations(unittest.TestCase):
+    @unittest.skipUnless(REPO_MIGRATIONS.is_dir(), "no migrations/")
+    def test_repo_migrations_apply_cleanly(self):
+        migrations = load_migrations(REPO_MIGRATIONS)
+        dry_run([], [batch_sql(migrations)])
@@ -0,0 +1,65 @@
+from release.scheduler import Graph, StepFailed
+
+import threading
+import time
+import unittest
+
+
+class TestGraph(unittest.TestCase):
+    def test_dependencies_receive_results(self):
+        graph = Graph()
+        graph.add("a", lambda _: 1)
+        graph.add("b", lambda r: r["a"] + 1, ["a"])
+        graph.add("c", lambda r: r["a"] + r["b"], ["a", "b"])
+
+        report = graph.run()
+
+        self.assertEqual(report.results["c"].value, 3)
+        self.assertEqual(report.critical_path, ["a", "b", "c"])
+
+    def test_independent_steps_overlap(self):
+        barrier = threading.Barrier(2, timeout=5)
+        graph = Graph()
+        graph.add("root", lambda _: None)
+        # Each of these blocks until the other has started
+        graph.add("left", lambda _: barrier.wait(), ["root"])
+        graph.add("right", lambda _: barrier.wait(), ["root"])
+
+        report = graph.run()
+        self.assertTrue(all(r.ok for r in report.results.values()))
+
+    def test_critical_path_follows_slowest_branch(self):
+        graph = Graph()
+        graph.add("start", lambda _: None)
+        graph.add("fast", lambda _: None, ["start"])
+        graph.add("slow", lambda _: time.sleep(0.05), ["start"])
+        graph.add("end", lambda _: None, ["fast", "slow"])
+
+        report = graph.run()
+        self.assertEqual(report.critical_path, ["start", "slow", "end"])
+
+    def test_failure_stops_downstream(self):
+        ran = []
+
+        def fail(_):
+            raise ValueError("nope")
+
+        graph = Graph()
+        graph.add("a", fail)
+        graph.add("b", lambda _: ran.append("b"), ["a"])
+        graph.add("c", lambda _: ran.append("c"), ["b"])
+
+        with self.assertRaises(StepFailed) as ctx:
+            graph.run()
+
+        results = ctx.exception.report.results
+        self.assertIsInstance(results["a"].error, ValueError)
+        self.assertTrue(results["b"].skipped)
+        self.assertTrue(results["c"].skipped)
+        self.assertEqual(ran, [])
+        self.assertIsInstance(ctx.exception.__cause__, ValueError)
+
+    def test_unknown_dependency(self):
+        graph = Graph()
+        with self.assertRaises(AssertionError):
+            graph.add("a", lambda _: None, ["b"])
@@ -0,0 +1,25 @@
+from release.bench.fixtures import SECRETS, bench_env
+from release.secrets import Secrets
+
+import unittest
+
+
+class TestSecrets(unittest.TestCase):
+    def test_decrypt_in_memory(self):
+        with bench_env(age_latency=0) as repo:
+            s = Secrets.from_env()
+            plaintext = s.decrypt(repo / "secrets/cf_authn.sh.age")
+
+            self.assertEqual(plaintext.decode(), SECRETS["cf_authn.sh"])
+
+    def test_decrypt_to_replaces_destination(self):
+        with bench_env(age_latency=0) as repo:
+            s = Secrets.from_env()
+            dest = repo / "wrangler.toml"
+            dest.write_text("stale")
+
+            s.decrypt_to(repo / "secrets/wrangler.toml.age", dest)
+
+            self.assertEqual(dest.read_text(), SECRETS["wrangler.toml"])
+            leftovers = [p for p in repo.iterdir() if p.name.startswith(".w")]
+            self.assertEqual(leftovers, [])
@@ -0,0 +1,212 @@
+from release.release_mgmt.git import Commit
+from release.sentry import CommitRange
+from release.sentry_api import MAX_COMMITS, SentryAPI, SentryAPIError
+
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Set
+import hashlib
+import itertools
+import json
+import tempfile
+import threading
+import unittest
+
+CHUNK_SIZE = 1024
+
+
+class FakeSentry(BaseHTTPRequestHandler):
+    """
+    Just enough of the Sentry API for SentryAPI, recording what it saw.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    releases: Dict[str, Any]
+    chunks: Dict[str, bytes]
+    uploaded: List[str]
+    connections: Set[Any]
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _reply(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _route(self, method: str) -> None:
+        self.connections.add(self.client_address)
+        if self.headers["Authorization"] != "Bearer token":
+            return self._reply(401, {"detail": "bad token"})
+
+        prefix = "/api/0/organizations/org/"
+        path = self.path.removeprefix(prefix)
+        if (method, path) == ("GET", "chunk-upload/"):
+            host = self.headers["Host"]
+            return self._reply(
+                200,
+                {
+                    "url": f"http://{host}{prefix}chunk-upload/",
+                    "chunkSize": CHUNK_SIZE,
+                    "chunksPerRequest": 4,
+                    "maxRequestSize": 1 << 20,
+                    "concurrency": 4,
+                },
+            )
+
+        if (method, path) == ("POST", "chunk-upload/"):
+            header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n"
+            msg = BytesParser().parsebytes(header.encode() + self._body())
+            for part in msg.walk():
+                if part.is_multipart():
+                    continue
+                data = part.get_payload(decode=True)
+                checksum = part.get_filename()
+                assert isinstance(data, bytes) and checksum
+                assert hashlib.sha1(data).hexdigest() == checksum
+                self.chunks[checksum] = data
+                self.uploaded.append(checksum)
+            return self._reply(200, {})
+
+        if (method, path) == ("POST", "releases/"):
+            payload = json.loads(self._body())
+            existed = payload["version"] in self.releases
+            self.releases.setdefault(payload["version"], payload)
+            return self._reply(208 if existed else 201, payload)
+
+        (_, tag, action) = (path.split("/") + [""])[:3]
+        if method == "PUT" and action == "":
+            self.releases[tag].update(json.loads(self._body()))
+            return self._reply(200, self.releases[tag])
+
+        if method == "POST" and action == "assemble":
+            payload = json.loads(self._body())
+            missing = [c for c in payload["chunks"] if c not in self.chunks]
+            if missing:
+                return self._reply(
+                    200, {"state": "not_found", "missingChunks": missing}
+                )
+
+            archive = b"".join(self.chunks[c] for c in payload["chunks"])
+            assert hashlib.sha1(archive).hexdigest() == payload["checksum"]
+            self.releases[tag]["archive"] = archive
+            return self._reply(200, {"state": "created", "missingChunks": []})
+
+        self._reply(404, {"detail": f"no route for {method} {self.path}"})
+
+    def do_GET(self) -> None:
+        self._route("GET")
+
+    def do_POST(self) -> None:
+        self._route("POST")
+
+    def do_PUT(self) -> None:
+        self._route("PUT")
+
+
+class TestSentryAPI(unittest.TestCase):
+    def setUp(self):
+        state = {
+            "releases": {},
+            "chunks": {},
+            "uploaded": [],
+            "connections": set(),
+        }
+        handler = type("Handler", (FakeSentry,), state)
+        self.handler = handler
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        (host, port) = self.server.server_address[:2]
+
+        self.client = SentryAPI(
+            org="org",
+            project="proj",
+            auth_token="token",
+            url=f"http://{host}:{port}",
+        )
+
+        self._tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self._tmp.name)
+        self.bundle = tmp / "index.js"
+        self.sourcemap = tmp / "index.js.map"
+        # Incompressible, so the sourcemap spans several chunks
+        self.bundle.write_bytes(b"console.log(1)\n")
+        self.sourcemap.write_bytes(
+            b"".join(hashlib.sha256(bytes([i])).digest() for i in range(256))
+            * 2
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self._tmp.cleanup()
+
+    def test_create_release(self):
+        self.client.create_release(commit="abc123", tag="v1.0.0")
+        self.client.create_release(commit="abc123", tag="v1.0.0")
+
+        release = self.handler.releases["v1.0.0"]
+        self.assertEqual(release["projects"], ["proj"])
+        self.assertEqual(
+            release["refs"], [{"repository": "origin", "commit": "abc123"}]
+        )
+
+    def test_create_release_with_commits(self):
+        listed = []
+
+        def commits():
+            for i in itertools.count():
+                listed.append(i)
+                yield Commit(f"{i:040x}", "A", "a@b.c", "2024-01-01", "msg")
+
+        commit_range = CommitRange("v0.9.0", commits())
+        with self.assertLogs("release.sentry_api", "WARNING") as logs:
+            self.client.create_release("abc123", "v1.0.0", commit_range)
+        self.assertIn("more than 1000 commits since v0.9.0", logs.output[0])
+
+        release = self.handler.releases["v1.0.0"]
+        self.assertNotIn("refs", release)
+        self.assertEqual(len(release["commits"]), MAX_COMMITS)
+        self.assertEqual(release["commits"][0]["repository"], "origin")
+        # Only read far enough into the log to see it was cut short
+        self.assertEqual(len(listed), MAX_COMMITS + 1)
+
+    def test_upload_sourcemaps_skips_known_chunks(self):
+        self.client.create_release(commit="abc123", tag="v1.0.0")
+        self.client.upload_sourcemaps("v1.0.0", self.bundle, self.sourcemap)
+
+        first_upload = len(self.handler.uploaded)
+        self.assertGreater(first_upload, 1)
+        self.assertIn("archive", self.handler.releases["v1.0.0"])
+
+        # Only the tail of the archive (the manifest, which names the
+        # release) differs, so most chunks are already on the server
+        self.client.create_release(commit="abc123", tag="v1.0.1")
+        self.client.upload_sourcemaps("v1.0.1", self.bundle, self.sourcemap)
+        second_upload = len(self.handler.uploaded) - first_upload
+        self.assertLess(second_upload, first_upload / 2)
+        self.assertIn("archive", self.handler.releases["v1.0.1"])
+
+    def test_connections_are_reused(self):
+        self.client.create_release(commit="abc123", tag="v1.0.0")
+        self.client.create_release(commit="abc123", tag="v1.0.1")
+
+        self.assertEqual(len(self.handler.connections), 1)
+
+    def test_errors(self):
+        self.client.auth_token = "wrong"
+        with self.assertRaises(SentryAPIError) as ctx:
+            self.client.create_release(commit="abc123", tag="v1.0.0")
+
+        self.assertEqual(ctx.exception.status, 401)
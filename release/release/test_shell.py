@@ -0,0 +1,80 @@
+from release.shell import _bash_source, parse_env, source_scripts
+from release.tracing import TRACER
+
+import subprocess
+import unittest
+from unittest.mock import patch
+
+# Simple enough to parse natively, so each can be checked against bash
+NATIVE_SCRIPTS = {
+    "unexported": "A=1\nexport B=2\n",
+    "exported later": "export A=1\nA=2\n",
+    "quoted": "export A='x y'\nexport B=\"\\$z\"\n",
+    "unchanged": "export HOME=/home/bench\nexport C=3\n",
+}
+
+
+class TestParseEnv(unittest.TestCase):
+    def test_simple_assignments(self):
+        script = (
+            "# credentials\n"
+            "export TOKEN=abc123\n"
+            "export ACCOUNT='some account'\n"
+            'export ORG="my \\"org\\""  # trailing comment\n'
+            "\n"
+        )
+        self.assertEqual(
+            parse_env(script),
+            {"TOKEN": "abc123", "ACCOUNT": "some account", "ORG": 'my "org"'},
+        )
+
+    def test_shell_syntax_is_rejected(self):
+        for script in (
+            "export TOKEN=$(cat token)\n",
+            'export TOKEN="${HOME}/token"\n',
+            "[ -f x ] && export TOKEN=abc\n",
+            "export TOKEN=abc; export OTHER=def\n",
+            "export TOKEN=~/token\n",
+            # Changes the environment, despite not saying export
+            "HOME=/tmp\n",
+        ):
+            self.assertIsNone(parse_env(script), script)
+
+    @patch.dict("os.environ", {"HOME": "/home/bench"})
+    def test_agrees_with_bash(self):
+        scripts = {k: v.encode() for (k, v) in NATIVE_SCRIPTS.items()}
+        sourced = _bash_source(scripts)
+        for name, script in NATIVE_SCRIPTS.items():
+            self.assertEqual(parse_env(script), sourced[name], name)
+
+
+class TestSourceScripts(unittest.TestCase):
+    def test_mixed_native_and_bash(self):
+        envs = source_scripts(
+            {
+                "simple": b"export A=1\n",
+                "complex": b"B=2\nexport C=\"$B$B\"\n",
+                "loop": b"for i in 1; do export D=$i; done\n",
+            }
+        )
+        self.assertEqual(envs["simple"], {"A": "1"})
+        self.assertEqual(envs["complex"], {"C": "22"})
+        self.assertEqual(envs["loop"], {"D": "1"})
+
+    def test_scripts_stay_off_the_command_line(self):
+        TRACER.reset()
+        source_scripts({"secret": b"export A=$(echo hunter2)\n"})
+
+        [span] = [s for s in TRACER.spans if s.name == "bash"]
+        self.assertNotIn("hunter2", " ".join(span.args["argv"]))
+
+    def test_failing_script_is_reported(self):
+        with self.assertRaises(subprocess.CalledProcessError) as ctx:
+            source_scripts(
+                {
+                    "ok": b"export A=$(echo 1)\n",
+                    "broken": b"export B=$(echo 2)\nfalse\n",
+                }
+            )
+
+        self.assertIn("while sourcing broken", ctx.exception.__notes__)
@@ -0,0 +1,152 @@
+from release.sourcemap import (
+    FIRST_PARTY,
+    UNMAPPED,
+    Analysis,
+    BudgetExceeded,
+    analyze,
+    check_budget,
+    decode_vlq,
+    package_of,
+    slim,
+)
+
+from pathlib import Path
+from typing import List
+import json
+import tempfile
+import unittest
+
+BASE64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+
+def encode_vlq(values):
+    out = []
+    for value in values:
+        n = (-value << 1) | 1 if value < 0 else value << 1
+        while True:
+            digit = n & 31
+            n >>= 5
+            out.append(BASE64[digit | (32 if n else 0)])
+            if not n:
+                break
+    return "".join(out)
+
+
+class TestSourcemap(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write(self, bundle: str, sources, lines):
+        # lines: per generated line, [(column, source index or None)]
+        mappings = []
+        prev_source = 0
+        for line in lines:
+            column = 0
+            segments: List[str] = []
+            for col, source in line:
+                fields = [col - column]
+                if source is not None:
+                    fields += [source - prev_source, 0, 0]
+                    prev_source = source
+                segments.append(encode_vlq(fields))
+                column = col
+            mappings.append(",".join(segments))
+
+        sourcemap = {
+            "version": 3,
+            "sources": sources,
+            # Mentions "sources" itself, which mustn't confuse the scan
+            "sourcesContent": ['const x = {"sources": []};'] * len(sources),
+            "mappings": ";".join(mappings),
+            "names": [],
+        }
+        (self.dir / "index.js").write_text(bundle)
+        (self.dir / "index.js.map").write_text(json.dumps(sourcemap))
+        return (self.dir / "index.js", self.dir / "index.js.map")
+
+    def test_decode_vlq(self):
+        for values in ([0], [1, -1, 16, -16], [123456, -7]):
+            self.assertEqual(decode_vlq(encode_vlq(values).encode()), values)
+
+    def test_package_of(self):
+        self.assertEqual(package_of("src/index.ts"), FIRST_PARTY)
+        self.assertEqual(
+            package_of("node_modules/itty-router/index.mjs"), "itty-router"
+        )
+        self.assertEqual(
+            package_of("node_modules/a/node_modules/@scope/b/x.js"),
+            "@scope/b",
+        )
+
+    def test_attributes_bytes(self):
+        sources = ["../src/index.ts", "../node_modules/itty-router/r.mjs"]
+        # 0123456789
+        # aaaaRRRRRR
+        # xxaaaa
+        paths = self.write(
+            "aaaaRRRRRR\nxxaaaa",
+            sources,
+            [[(0, 0), (4, 1)], [(0, None), (2, 0)]],
+        )
+        report = analyze(*paths)
+
+        self.assertEqual(report.total.raw, 17)
+        self.assertEqual(
+            report.modules,
+            {
+                # Including line 1's newline
+                "node_modules/itty-router/r.mjs": 7,
+                "src/index.ts": 8,
+                UNMAPPED: 2,
+            },
+        )
+        self.assertEqual(report.packages["itty-router"].raw, 7)
+        self.assertGreater(report.total.gzip, 0)
+
+    def test_budget_and_diff(self):
+        paths = self.write("a" * 100, ["src/a.ts"], [[(0, 0)]])
+        before = analyze(*paths)
+        paths = self.write(
+            "a" * 100 + "b" * 50,
+            ["src/a.ts", "src/b.ts"],
+            [[(0, 0), (100, 1)]],
+        )
+        after = analyze(*paths)
+
+        check_budget(after, after.total.gzip)
+        with self.assertRaises(BudgetExceeded):
+            check_budget(after, after.total.gzip - 1)
+
+        summary = Analysis(after, before, "v1.2.3").summary()
+        self.assertIn("since v1.2.3", summary)
+        self.assertRegex(summary, r"src/b.ts +\+50")
+
+    def test_slim(self):
+        sources = ["../src/index.ts", "../node_modules/itty-router/r.mjs"]
+        (bundle, sourcemap) = self.write(
+            "aaaaRRRRRR", sources, [[(0, 0), (4, 1)]]
+        )
+        dest = self.dir / "slim" / "index.js.map"
+        dest.parent.mkdir()
+        result = slim(sourcemap, dest)
+
+        before = json.loads(sourcemap.read_text())
+        after = json.loads(dest.read_text())
+        self.assertEqual(
+            after["sources"],
+            ["src/index.ts", "node_modules/itty-router/r.mjs"],
+        )
+        self.assertEqual(
+            after["sourcesContent"], [before["sourcesContent"][0], None]
+        )
+        self.assertEqual(after["mappings"], before["mappings"])
+        self.assertEqual(result.dropped, 1)
+        saved = sourcemap.stat().st_size - dest.stat().st_size
+        self.assertEqual(result.saved, saved)
+        self.assertEqual(
+            analyze(bundle, dest).modules, analyze(bundle, sourcemap).modules
+        )
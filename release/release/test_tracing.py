@@ -0,0 +1,54 @@
+from release.tracing import REDACTED, Tracer, run
+
+import subprocess
+import unittest
+from unittest.mock import patch
+
+
+class TestTracer(unittest.TestCase):
+    def test_redacts_secrets(self):
+        tracer = Tracer()
+        tracer.add_secret("hunter2")
+
+        argv = ["tool", "--auth-token", "abc", "--url=https://x/hunter2"]
+        self.assertEqual(
+            tracer.redact(argv, secrets=["unused"]),
+            ["tool", "--auth-token", REDACTED, f"--url=https://x/{REDACTED}"],
+        )
+
+    def test_spans_record_errors(self):
+        tracer = Tracer()
+        with self.assertRaises(ValueError):
+            with tracer.span("phase"):
+                raise ValueError()
+
+        (span,) = tracer.spans
+        self.assertEqual(span.args["error"], "ValueError")
+        self.assertGreaterEqual(span.duration, 0)
+
+    def test_chrome_trace(self):
+        tracer = Tracer()
+        with tracer.span("outer"):
+            with tracer.span("inner", "subprocess", argv=["true"]):
+                pass
+
+        events = tracer.chrome_trace()["traceEvents"]
+        self.assertEqual([e["name"] for e in events], ["outer", "inner"])
+        self.assertTrue(all(e["ph"] == "X" for e in events))
+        self.assertIn("inner", tracer.summary())
+
+
+class TestRun(unittest.TestCase):
+    def test_records_subprocess(self):
+        tracer = Tracer()
+        with patch("release.tracing.TRACER", tracer):
+            run(["sh", "-c", "printf hello"], stdout=subprocess.PIPE)
+            with self.assertRaises(subprocess.CalledProcessError):
+                run(["sh", "-c", "exit 3"], check=True)
+
+        (ok, failed) = tracer.spans
+        self.assertEqual(ok.name, "sh")
+        self.assertEqual(ok.category, "subprocess")
+        self.assertEqual(ok.args["exit_code"], 0)
+        self.assertEqual(ok.args["stdout_bytes"], 5)
+        self.assertEqual(failed.args["exit_code"], 3)
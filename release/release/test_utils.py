@@ -0,0 +1,38 @@
+from release.utils import atomic_write, atomic_writer
+
+from pathlib import Path
+import os
+import stat
+import tempfile
+import unittest
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = Path(self._tmp.name)
+
+    def test_replaces_with_mode(self):
+        path = self.dir / "secret"
+        path.write_text("stale")
+        # Left behind by a writer that was killed
+        (self.dir / f".secret.{os.getpid()}.tmp").touch(0o666)
+
+        atomic_write(path, "fresh", mode=0o600)
+
+        self.assertEqual(path.read_text(), "fresh")
+        self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o600)
+        self.assertEqual([p.name for p in self.dir.iterdir()], ["secret"])
+
+    def test_failed_write_keeps_original(self):
+        path = self.dir / "file"
+        path.write_text("original")
+
+        with self.assertRaises(RuntimeError):
+            with atomic_writer(path) as f:
+                f.write(b"partial")
+                raise RuntimeError()
+
+        self.assertEqual(path.read_text(), "original")
+        self.assertEqual([p.name for p in self.dir.iterdir()], ["file"])
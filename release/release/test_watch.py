@@ -0,0 +1,170 @@
+from release.watch import (
+    BuildFailed,
+    EsbuildServer,
+    Inotify,
+    Poller,
+    watch,
+)
+
+from functools import partial
+from pathlib import Path
+from typing import Callable, Union
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Enough of `esbuild --serve` for EsbuildServer: the bundle is the entrypoint
+# as-is, and an entrypoint containing "error" fails to build.
+FAKE_ESBUILD = """
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import sys
+
+entrypoint = sys.argv[1]
+serve = next(a for a in sys.argv if a.startswith("--serve="))
+(host, port) = serve.removeprefix("--serve=").split(":")
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        source = open(entrypoint, "rb").read()
+        (status, body) = (200, source)
+        if self.path == "/index.js.map":
+            body = b'{"version":3}'
+        if b"error" in source:
+            (status, body) = (503, b"syntax error")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+HTTPServer((host, int(port)), Handler).serve_forever()
+"""
+
+
+class WatcherTests:
+    watcher_cls: Callable[[Path], Union[Inotify, Poller]]
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        (self.root / "lib").mkdir()
+        (self.root / "index.ts").write_text("a")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_reports_changes(self):
+        watcher = self.watcher_cls(self.root)
+        try:
+            (self.root / "index.ts").write_text("b")
+            changed = watcher.read(2)
+            self.assertIn(self.root / "index.ts", changed)
+        finally:
+            watcher.close()
+
+    def test_new_directories_are_watched(self):
+        watcher = self.watcher_cls(self.root)
+        try:
+            (self.root / "lib" / "new").mkdir()
+            watcher.read(2)
+            time.sleep(0.01)
+            (self.root / "lib" / "new" / "file.ts").write_text("c")
+            changed = set()
+            deadline = time.monotonic() + 2
+            while not changed and time.monotonic() < deadline:
+                changed = watcher.read(0.5)
+            self.assertIn(self.root / "lib" / "new" / "file.ts", changed)
+        finally:
+            watcher.close()
+
+
+@unittest.skipUnless(Inotify.available(), "needs inotify")
+class TestInotify(WatcherTests, unittest.TestCase):
+    watcher_cls = Inotify
+
+
+class TestPoller(WatcherTests, unittest.TestCase):
+    watcher_cls = partial(Poller, interval=0.01)
+
+
+class TestWatch(unittest.TestCase):
+    def test_bursts_are_debounced(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            batches = watch(root, debounce=0.2)
+
+            def burst():
+                time.sleep(0.1)
+                for i in range(5):
+                    (root / f"{i}.ts").write_text("x")
+                    time.sleep(0.02)
+
+            threading.Thread(target=burst).start()
+            batch = next(batches)
+            batches.close()
+
+            names = {p.name for p in batch}
+            self.assertEqual(names, {f"{i}.ts" for i in range(5)})
+
+
+class EsbuildServerTests:
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.proj = Path(self._tmp.name) / "proj"
+        (self.proj / "src").mkdir(parents=True)
+        self.entrypoint = self.proj / "src" / "index.ts"
+        self.entrypoint.write_text("export default { n: 1 };\n")
+        self.out = Path(self._tmp.name) / "out"
+        self.server = EsbuildServer(self.esbuild_bin(), self.proj)
+
+    def tearDown(self):
+        self.server.close()
+        self._tmp.cleanup()
+
+    def esbuild_bin(self) -> Path:
+        raise NotImplementedError
+
+    def test_builds(self):
+        self.server.build(self.out, ["index.js", "index.js.map"])
+        self.assertIn("1", (self.out / "index.js").read_text())
+        self.assertTrue((self.out / "index.js.map").exists())
+
+        self.entrypoint.write_text("export default { n: 2 };\n")
+        self.server.build(self.out, ["index.js"])
+        self.assertIn("2", (self.out / "index.js").read_text())
+
+    def test_build_errors(self):
+        self.entrypoint.write_text("export default { error\n")
+        with self.assertRaises(BuildFailed):
+            self.server.build(self.out, ["index.js"])
+
+    def test_restarts(self):
+        self.server._proc.kill()
+        self.server._proc.wait()
+
+        self.server.build(self.out, ["index.js"])
+        self.assertTrue(self.server.running())
+
+
+class TestFakeEsbuild(EsbuildServerTests, unittest.TestCase):
+    def esbuild_bin(self) -> Path:
+        path = Path(self._tmp.name) / "esbuild"
+        path.write_text(f"#!{sys.executable}\n{FAKE_ESBUILD}")
+        path.chmod(0o755)
+        return path
+
+
+@unittest.skipUnless(
+    os.environ.get("ESBUILD") or shutil.which("esbuild"), "needs esbuild"
+)
+class TestEsbuild(EsbuildServerTests, unittest.TestCase):
+    def esbuild_bin(self) -> Path:
+        return Path(os.environ.get("ESBUILD") or shutil.which("esbuild") or "")
@@ -0,0 +1,189 @@
+"""
+Records how long the release tool spends in each phase and each process it
+starts, for writing out as a Chrome trace (chrome://tracing, Perfetto) and
+summarising at the end of a command.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Union
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+
+PathEl = Union[str, Path]
+
+REDACTED = "<redacted>"
+# Flags whose following argument is always a secret
+SECRET_FLAGS = {"--auth-token", "--api-key", "--token"}
+SUBCOMMAND_REGEX = re.compile(r"^[a-z][a-z0-9-]*$")
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start: float
+    end: float = 0.0
+    thread: int = field(default_factory=threading.get_native_id)
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._secrets: Set[str] = set()
+        self.spans: List[Span] = []
+        self.origin = time.perf_counter()
+
+    def add_secret(self, value: str) -> None:
+        if value:
+            with self._lock:
+                self._secrets.add(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans = []
+            self.origin = time.perf_counter()
+
+    def redact(
+        self,
+        argv: Sequence[PathEl],
+        secrets: Sequence[str] = (),
+    ) -> List[str]:
+        hidden = self._secrets.union(secrets)
+        redacted = []
+        after_flag = False
+        for arg in (str(a) for a in argv):
+            if after_flag or arg in hidden:
+                redacted.append(REDACTED)
+            else:
+                for secret in hidden:
+                    arg = arg.replace(secret, REDACTED)
+                redacted.append(arg)
+            after_flag = arg in SECRET_FLAGS
+
+        return redacted
+
+    @contextmanager
+    def span(
+        self, name: str, category: str = "phase", **args: Any
+    ) -> Iterator[Span]:
+        span = Span(name, category, time.perf_counter(), args=args)
+        try:
+            yield span
+        except BaseException as e:
+            span.args.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            span.end = time.perf_counter()
+            with self._lock:
+                self.spans.append(span)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        pid = os.getpid()
+        events = [
+            {
+                "name": s.name,
+                "cat": s.category,
+                "ph": "X",
+                "ts": (s.start - self.origin) * 1e6,
+                "dur": s.duration * 1e6,
+                "pid": pid,
+                "tid": s.thread,
+                "args": s.args,
+            }
+            for s in sorted(self.spans, key=lambda s: s.start)
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: Path) -> None:
+        path.write_text(json.dumps(self.chrome_trace(), indent=1))
+
+    def summary(self) -> str:
+        rows: Dict[tuple, List[float]] = {}
+        for s in self.spans:
+            rows.setdefault((s.category, s.name), []).append(s.duration)
+
+        lines = [f"{'':<11}{'name':<32}{'count':>6}{'total':>10}{'max':>10}"]
+        ordered = sorted(rows.items(), key=lambda kv: -sum(kv[1]))
+        for (category, name), durations in ordered:
+            lines.append(
+                f"{category:<11}{name[:31]:<32}{len(durations):>6}"
+                f"{sum(durations):>9.3f}s{max(durations):>9.3f}s"
+            )
+
+        return "\n".join(lines)
+
+
+TRACER = Tracer()
+
+
+def _span_name(argv: Sequence[str]) -> str:
+    # e.g. "git push", "sentry-cli releases", "age"
+    program = os.path.basename(argv[0])
+    rest = argv[1:]
+    if program == "git" and rest[:1] == ["-C"]:
+        rest = rest[2:]
+
+    sub = next((a for a in rest if not a.startswith("-")), "")
+    if SUBCOMMAND_REGEX.match(sub):
+        return f"{program} {sub}"
+    return program
+
+
+@contextmanager
+def process_span(
+    argv: Sequence[PathEl], secrets: Sequence[str] = (), **args: Any
+) -> Iterator[Span]:
+    """
+    A span for running argv, named after the program (and subcommand).
+    """
+    shown = TRACER.redact(argv, secrets)
+    name = _span_name(shown)
+    with TRACER.span(name, "subprocess", argv=shown, **args) as span:
+        yield span
+
+
+def record_result(span: Span, res: subprocess.CompletedProcess) -> None:
+    span.args["exit_code"] = res.returncode
+    for stream in ("stdout", "stderr"):
+        output = getattr(res, stream)
+        if output is not None:
+            span.args[f"{stream}_bytes"] = len(output)
+
+
+def run(
+    argv: Sequence[PathEl],
+    check: bool = False,
+    secrets: Sequence[str] = (),
+    **kwargs: Any,
+) -> subprocess.CompletedProcess:
+    """
+    subprocess.run, recorded as a span. `secrets` are hidden from the
+    recorded argv in addition to any registered with the tracer.
+    """
+    with process_span(argv, secrets) as span:
+        res = subprocess.run(argv, **kwargs)
+        record_result(span, res)
+
+    if check:
+        res.check_returncode()
+    return res
+
+
+def check_output(argv: Sequence[PathEl], **kwargs: Any) -> bytes:
+    return run(argv, check=True, stdout=subprocess.PIPE, **kwargs).stdout
+
+
+def write_trace(path: Optional[Path]) -> None:
+    if path:
+        TRACER.write_chrome_trace(path)
@@ -1,5 +1,7 @@
 from pathlib import Path
-from typing import Iterable
+from typing import BinaryIO, Iterable, Iterator, Union
+import contextlib
+import os
 import textwrap
 
 
@@ -8,3 +10,33 @@ def format_paths(paths: Iterable[Path]) -> str:
         return "<none>"
 
     return textwrap.indent("\n".join(str(p) for p in paths), prefix=" - ")
+
+
+@contextlib.contextmanager
+def atomic_writer(path: Path, mode: int = 0o644) -> Iterator[BinaryIO]:
+    """
+    Yields a file that replaces path once the block finishes, so readers
+    never see a partial write. It's created with the given mode, rather than
+    one derived from the umask.
+    """
+    # NOTE: not tempfile, which is slow to import for print-version
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # A leftover temporary file keeps its old mode through O_CREAT
+            os.fchmod(f.fileno(), mode)
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def atomic_write(
+    path: Path, data: Union[bytes, str], mode: int = 0o644
+) -> None:
+    if isinstance(data, str):
+        data = data.encode()
+    with atomic_writer(path, mode) as f:
+        f.write(data)
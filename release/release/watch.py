@@ -0,0 +1,272 @@
+from release.utils import atomic_write
+
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Sequence, Set, Union
+import ctypes
+import ctypes.util
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+# Roughly what wrangler passes to esbuild for a module worker
+ESBUILD_ARGS = [
+    "--bundle",
+    "--format=esm",
+    "--target=es2022",
+    "--platform=neutral",
+    "--main-fields=browser,module,main",
+    "--conditions=workerd,worker,browser",
+    "--minify",
+    "--sourcemap",
+]
+
+PathEl = Union[str, Path]
+
+# Seconds to wait for esbuild to answer a request, i.e. to finish a build
+FETCH_TIMEOUT = 60
+
+
+class Inotify:
+    """
+    Recursively watches a directory tree with inotify(7).
+    """
+
+    def __init__(self, root: Path) -> None:
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self._dirs: Dict[int, Path] = {}
+        self._add_tree(root)
+
+    @staticmethod
+    def available() -> bool:
+        return sys.platform.startswith("linux")
+
+    def _add_tree(self, root: Path) -> None:
+        for directory, _, _ in os.walk(root):
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), WATCH_MASK
+            )
+            if wd >= 0:
+                self._dirs[wd] = Path(directory)
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        (readable, _, _) = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed: Set[Path] = set()
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            (wd, mask, _, length) = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            directory = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+            if directory is None:
+                continue
+
+            path = directory / os.fsdecode(name) if name else directory
+            if mask & IN_CREATE and mask & IN_ISDIR:
+                # Files may land in a new directory before we watch it
+                self._add_tree(path)
+            changed.add(path)
+
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class Poller:
+    """
+    Fallback for platforms without inotify: compares mtimes periodically.
+    """
+
+    def __init__(self, root: Path, interval: float = 0.25) -> None:
+        self._root = root
+        self._interval = interval
+        self._state = self._scan()
+
+    def _scan(self) -> Dict[Path, int]:
+        state = {}
+        for directory, _, names in os.walk(self._root):
+            for name in names:
+                path = Path(directory) / name
+                try:
+                    state[path] = path.stat().st_mtime_ns
+                except FileNotFoundError:
+                    pass
+        return state
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            new_state = self._scan()
+            changed = {
+                p
+                for p in self._state.keys() | new_state.keys()
+                if self._state.get(p) != new_state.get(p)
+            }
+            self._state = new_state
+            if changed:
+                return changed
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self._interval)
+
+    def close(self) -> None:
+        pass
+
+
+def watch(root: Path, debounce: float = 0.1) -> Iterator[Set[Path]]:
+    """
+    Yields batches of changed paths under root. Each batch is only yielded
+    once no further changes have arrived for `debounce` seconds.
+    """
+    watcher: Union[Inotify, Poller]
+    watcher = Inotify(root) if Inotify.available() else Poller(root)
+    try:
+        while True:
+            batch = watcher.read(None)
+            while True:
+                more = watcher.read(debounce)
+                if not more:
+                    break
+                batch |= more
+            yield batch
+    finally:
+        watcher.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class BuildFailed(RuntimeError):
+    pass
+
+
+class EsbuildServer:
+    """
+    A long-lived esbuild process in serve mode. It keeps its incremental
+    build state between requests, so fetching the outputs after a change
+    only rebuilds what changed.
+    """
+
+    def __init__(
+        self,
+        esbuild_bin: Path,
+        proj_dir: Path,
+        entrypoint: str = "src/index.ts",
+        log: Optional[IO[bytes]] = None,
+    ) -> None:
+        self._esbuild_bin = esbuild_bin
+        self._proj_dir = proj_dir
+        self._entrypoint = entrypoint
+        self._log = log
+        self._start()
+
+    def _start(self) -> None:
+        self._port = _free_port()
+        cmd: List[PathEl] = [
+            self._esbuild_bin,
+            self._entrypoint,
+            *ESBUILD_ARGS,
+            "--outdir=.",
+            f"--serve=127.0.0.1:{self._port}",
+            "--log-level=warning",
+        ]
+        self._proc = subprocess.Popen(
+            cmd, cwd=self._proj_dir, stdout=self._log, stderr=self._log
+        )
+        self._wait_ready()
+
+    def _wait_ready(self, timeout: float = 10) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._proc.poll() is not None:
+                raise BuildFailed("esbuild exited during startup")
+            try:
+                with socket.create_connection(("127.0.0.1", self._port)):
+                    return
+            except OSError:
+                time.sleep(0.05)
+
+        self.close()
+        raise BuildFailed("timed out waiting for esbuild to start")
+
+    def running(self) -> bool:
+        return self._proc.poll() is None
+
+    def fetch(self, name: str) -> bytes:
+        if not self.running():
+            # NOTE: a fresh one has to build everything again, but that
+            # beats ending the watch
+            self._start()
+
+        url = f"http://127.0.0.1:{self._port}/{name}"
+        try:
+            with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as res:
+                return res.read()
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode(errors="replace")
+            raise BuildFailed(f"building {name} failed: {detail}") from e
+        except OSError as e:
+            msg = f"couldn't fetch {name} from esbuild: {e}"
+            raise BuildFailed(msg) from e
+
+    def build(self, out_dir: Path, names: Sequence[str]) -> None:
+        """
+        Writes fresh copies of the given outputs to out_dir.
+        """
+        outputs = {name: self.fetch(name) for name in names}
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for name, content in outputs.items():
+            atomic_write(out_dir / name, content)
+
+    def close(self) -> None:
+        self._proc.terminate()
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
@@ -1,5 +1,8 @@
+from release import execution, tracing
+
 from pathlib import Path
-from typing import Sequence, Union
+from typing import IO, Any, List, Optional, Sequence, Union
+import json
 import subprocess
 
 
@@ -8,6 +11,19 @@ PathEls = Sequence[PathEl]
 
 COMPATIBILITY_DATE = "2023-03-02"
 
+# Everything `build` passes to wrangler besides the output directory
+BUILD_ARGS = [
+    "deploy",
+    "--compatibility-date",
+    COMPATIBILITY_DATE,
+    "--name",
+    "local-build",
+    "--minify",
+    "--dry-run",
+    "src/index.ts",
+]
+BUILD_OUTPUTS = ["index.js", "index.js.map"]
+
 
 class Wrangler:
     def __init__(self, src_root: Path, wrangler_bin: Path):
@@ -16,26 +32,57 @@ class Wrangler:
         self._wrangler_bin = wrangler_bin
 
     def _run(
-        self, cmd: PathEls, check: bool = True
+        self,
+        cmd: PathEls,
+        check: bool = True,
+        step: Optional[str] = None,
+        **kwargs: Any,
     ) -> subprocess.CompletedProcess:
         argv = [self._wrangler_bin] + list(cmd)
         # TODO: global wrangler.toml path?
-        return subprocess.run(argv, check=check, cwd=self._src_root)
+        if step is None:
+            return tracing.run(argv, check=check, cwd=self._src_root, **kwargs)
+        return execution.run(
+            step, argv, check=check, cwd=self._src_root, **kwargs
+        )
+
+    def deploy(
+        self, env: str, bundle_path: Path, log: Optional[IO[bytes]] = None
+    ) -> None:
+        """
+        Uploads the bundle to the given wrangler environment. Output goes
+        to `log` if given, otherwise to our own stdout/stderr.
+        """
+        cmd: PathEls = ["deploy", "--env", env, "--no-bundle", bundle_path]
+        step = f"wrangler_deploy[{env}]"
+        if log is None:
+            self._run(cmd, step=step)
+        else:
+            self._run(cmd, step=step, stdout=log, stderr=subprocess.STDOUT)
+
+    def d1_execute(
+        self,
+        database: str,
+        env: str,
+        command: Optional[str] = None,
+        file: Optional[Path] = None,
+        remote: bool = True,
+    ) -> Any:
+        """
+        Runs SQL against a D1 database, returning wrangler's JSON output
+        (one entry per statement).
+        """
+        assert (command is None) != (file is None)
+        cmd: List[PathEl] = ["d1", "execute", database, "--env", env, "--json"]
+        cmd.append("--remote" if remote else "--local")
+        if command is not None:
+            cmd.extend(["--command", command])
+        if file is not None:
+            cmd.append(f"--file={file}")
 
-    def deploy(self, env: str, bundle_path: Path) -> None:
-        self._run(["deploy", "--env", env, "--no-bundle", bundle_path])
+        res = self._run(cmd, stdout=subprocess.PIPE)
+        return json.loads(res.stdout)
 
     def build(self, out_dir: Path) -> None:
-        cmd: PathEls = [
-            "deploy",
-            "--compatibility-date",
-            COMPATIBILITY_DATE,
-            "--name",
-            "local-build",
-            "--minify",
-            "--dry-run",
-            "--outdir",
-            out_dir,
-            "src/index.ts",
-        ]
+        cmd: PathEls = [*BUILD_ARGS[:-1], "--outdir", out_dir, BUILD_ARGS[-1]]
         self._run(cmd)